@@ -0,0 +1,144 @@
+# Adaptive match evaluation: instead of a fixed number of games per pair, keep
+# playing until a sequential probability ratio test (SPRT) decides which agent
+# is stronger, within min/max game limits. Lopsided pairs stop after a few
+# games and close ones get more, for a better ranking at the same compute.
+#
+# With the defaults, against the fixed 3 games per pair (exact, no ties):
+#
+#   p1 win probability   0.5    0.6    0.7    0.8    0.9    1.0
+#   expected games       3.25   3.19   3.02   2.74   2.39   2.00
+#   stronger agent wins  -      0.671  0.819  0.927  0.985  1.000
+#   fixed 3 games        -      0.648  0.784  0.896  0.972  1.000
+
+
+import math
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from poke_env.player.player import Player
+
+if TYPE_CHECKING:
+    from results_cache import ResultsCache
+
+
+class SPRT:
+    """Tests H0: p1 wins with probability 0.5 - margin, against H1: 0.5 + margin.
+
+    With the defaults a pair is decided as soon as one agent is two games ahead
+    (2-0, 3-1), and a pair still undecided after max_games goes to whoever is
+    ahead; an odd max_games leaves no even split without ties.
+    """
+
+    def __init__(
+        self,
+        margin: float = 0.25,
+        alpha: float = 0.15,
+        beta: float = 0.15,
+        min_games: int = 2,
+        max_games: int = 5,
+    ):
+        if not 0.0 < margin < 0.5:
+            raise ValueError("margin must be between 0 and 0.5")
+        if not 1 <= min_games <= max_games:
+            raise ValueError("need 1 <= min_games <= max_games")
+
+        self.min_games = min_games
+        self.max_games = max_games
+        # Pairs played under other parameters are not recalled from the cache
+        self.mode = f"sprt-{margin:g}-{alpha:g}-{beta:g}-{min_games}-{max_games}"
+
+        # Log-likelihood ratio added by a win and by a loss of p1
+        self._win = math.log((0.5 + margin) / (0.5 - margin))
+        self._loss = -self._win
+        self._upper = math.log((1 - beta) / alpha)
+        self._lower = math.log(beta / (1 - alpha))
+
+        # Games and pairs played under this rule, for reporting
+        self.games = 0
+        self.pairs = 0
+
+    def llr(self, wins: int, losses: int) -> float:
+        return wins * self._win + losses * self._loss
+
+    def done(self, wins: int, losses: int, games: int) -> bool:
+        """Whether p1's wins and losses after games (ties included) decide the pair."""
+        if games < self.min_games:
+            return False
+        if games >= self.max_games:
+            return True
+        llr = self.llr(wins, losses)
+        return llr >= self._upper or llr <= self._lower
+
+    def summary(self) -> str:
+        average = self.games / self.pairs if self.pairs else 0.0
+        return f"{self.games} games over {self.pairs} pairs ({average:.1f} per pair)"
+
+
+def evaluation_mode(n_challenges: int = 3, rule: Optional[SPRT] = None) -> str:
+    """How a pair is played, as the results cache keeps it."""
+    return rule.mode if rule is not None else f"fixed-{n_challenges}"
+
+
+async def play_match(
+    p1: Player, p2: Player, n_challenges: int = 3, rule: Optional[SPRT] = None
+) -> Tuple[int, int, int]:
+    """Plays n_challenges games between p1 and p2, or as many as rule needs.
+
+    Returns p1's wins, p1's losses and the number of games played, ties included.
+    """
+    start = p1.n_finished_battles, p1.n_won_battles, p2.n_won_battles
+    games = n_challenges if rule is None else rule.min_games
+    while True:
+        await p1.battle_against(p2, n_battles=games)
+        played = p1.n_finished_battles - start[0]
+        wins = p1.n_won_battles - start[1]
+        losses = p2.n_won_battles - start[2]
+        if rule is None or rule.done(wins, losses, played):
+            break
+        games = 1
+
+    if rule is not None:
+        rule.games += played
+        rule.pairs += 1
+    return wins, losses, played
+
+
+async def play_or_recall(
+    p1: Player,
+    p2: Player,
+    n_challenges: int = 3,
+    rule: Optional[SPRT] = None,
+    cache: Optional["ResultsCache"] = None,
+) -> Tuple[float, float]:
+    """Win rates of p1 and p2 against each other, from cache if it has the pair
+    played the same way."""
+    mode = evaluation_mode(n_challenges, rule)
+    counts = cache.get(p1, p2, mode) if cache is not None else None
+    if counts is None:
+        counts = await play_match(p1, p2, n_challenges, rule)
+        p1.reset_battles()
+        p2.reset_battles()
+        if cache is not None:
+            cache.record(p1, p2, mode, counts)
+
+    wins, losses, games = counts
+    return wins / games, losses / games
+
+
+async def cross_evaluate(
+    players: List[Player],
+    n_challenges: int = 3,
+    rule: Optional[SPRT] = None,
+    cache: Optional["ResultsCache"] = None,
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """poke_env's cross_evaluate, with an optional stopping rule for each pair and
+    an optional cache of pairs that were already played."""
+    results: Dict[str, Dict[str, Optional[float]]] = {
+        p1.username: {p2.username: None for p2 in players} for p1 in players
+    }
+    for i, p1 in enumerate(players):
+        for p2 in players[i + 1 :]:
+            (
+                results[p1.username][p2.username],
+                results[p2.username][p1.username],
+            ) = await play_or_recall(p1, p2, n_challenges, rule, cache)
+    return results
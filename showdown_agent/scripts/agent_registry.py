@@ -0,0 +1,115 @@
+# Loads agent modules from the players and bots folders once per run.
+#
+# Each file is imported a single time, under a namespaced module name
+# ("agent_plugins.bots.simple", "agent_plugins.players.ratk825") so that
+# bots/random.py, bots/simple.py and the players cannot clash with each other
+# or with the standard library, and its CustomAgent class is cached by path.
+#
+# Agents that a run may not need, such as the bots added to fill a bracket,
+# can be handed out as LazyAgents, which build the Player (and open its
+# connection) the first time a match asks for it.
+
+
+import importlib.util
+import os
+import sys
+from typing import Callable, Dict, List, Optional, Union
+
+from poke_env.player.player import Player
+
+NAMESPACE = "agent_plugins"
+
+# Absolute path -> CustomAgent class, or None if the module has none
+_classes: Dict[str, Optional[type]] = {}
+
+
+def load(path: str) -> Optional[type]:
+    """The CustomAgent class defined in the file at path, importing it only once."""
+    path = os.path.abspath(path)
+    if path in _classes:
+        return _classes[path]
+
+    folder = os.path.basename(os.path.dirname(path))
+    module_name = f"{NAMESPACE}.{folder}.{os.path.splitext(os.path.basename(path))[0]}"
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Could not load module {path}. Please check the file path.")
+    module = importlib.util.module_from_spec(spec)
+
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+
+    _classes[path] = getattr(module, "CustomAgent", None)
+    return _classes[path]
+
+
+def discover(folder: str) -> Dict[str, type]:
+    """The CustomAgent classes of folder's modules, by file name without .py."""
+    agents = {}
+    for file_name in sorted(os.listdir(folder)):
+        if file_name.endswith(".py") and not file_name.startswith("__"):
+            agent_class = load(os.path.join(folder, file_name))
+            if agent_class is not None:
+                agents[file_name[:-3]] = agent_class
+    return agents
+
+
+class LazyAgent:
+    """An agent whose Player is only built when a match first needs it."""
+
+    def __init__(self, username: str, build: Callable[[], Player]):
+        self.username = username
+        self._build = build
+        self._agent: Optional[Player] = None
+        self._hooks: List[Callable[[Player], object]] = []
+
+    @property
+    def built(self) -> bool:
+        return self._agent is not None
+
+    def when_built(self, hook: Callable[[Player], object]):
+        """Runs hook on the Player once it is built, or now if it already is."""
+        if self._agent is not None:
+            hook(self._agent)
+        else:
+            self._hooks.append(hook)
+
+    def get(self) -> Player:
+        if self._agent is None:
+            self._agent = self._build()
+            for hook in self._hooks:
+                hook(self._agent)
+            self._hooks.clear()
+        return self._agent
+
+    def __repr__(self):
+        return f"LazyAgent({self.username}, {'built' if self.built else 'not built'})"
+
+
+AgentLike = Union[Player, LazyAgent]
+
+
+def resolve(agent: AgentLike) -> Player:
+    return agent.get() if isinstance(agent, LazyAgent) else agent
+
+
+def when_built(agent: AgentLike, hook: Callable[[Player], object]):
+    """Runs hook on agent now if it is a Player, or once it is built if it is lazy."""
+    if isinstance(agent, LazyAgent):
+        agent.when_built(hook)
+    else:
+        hook(agent)
+
+
+def built(agents: List[AgentLike]) -> List[Player]:
+    """The agents that exist as Players so far."""
+    return [
+        agent.get() if isinstance(agent, LazyAgent) else agent
+        for agent in agents
+        if not isinstance(agent, LazyAgent) or agent.built
+    ]
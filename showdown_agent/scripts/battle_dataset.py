@@ -0,0 +1,260 @@
+# Records every decision of the agents it is attached to into a columnar dataset
+# of NumPy structured arrays, for tuning the heuristic offline (--dataset).
+#
+# Two tables are written side by side in results/dataset:
+#   decisions-NNNNNN.npy   one row per choose_move: battle, turn, actives, HP
+#                          fractions, chosen action, branch and the outcome
+#   candidates-NNNNNN.npy  one row per scored candidate action of a decision,
+#                          joined to decisions on the "decision" column
+#
+# Rows are held per battle until it finishes, as the outcome is only known
+# then, and written in chunks of chunk_rows decisions. Battles an agent
+# forfeits, or drops with reset_battles before they end, are left out, as
+# their outcome says nothing about the decisions. Candidate scores come
+# from agents that publish them in ``last_decision`` (see ratk825); for others
+# only the chosen action is recorded.
+#
+# Reading back: load("results/dataset", "decisions") concatenates the chunks,
+# memory-mapped, into a single structured array.
+
+
+import glob
+import inspect
+import itertools
+import os
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+from poke_env.battle import Move, Pokemon
+from poke_env.player.player import Player
+
+DECISION_DTYPE = np.dtype(
+    [
+        ("decision", "i8"),
+        ("battle", "U64"),
+        ("agent", "U32"),
+        ("opponent", "U32"),
+        ("turn", "i2"),
+        ("active", "U24"),
+        ("opponent_active", "U24"),
+        ("hp", "f4"),
+        ("opponent_hp", "f4"),
+        # Pokemon left on each side, the active one included
+        ("remaining", "i1"),
+        ("opponent_remaining", "i1"),
+        ("action", "U48"),
+        ("branch", "U12"),
+        ("candidates", "i2"),
+        # 1 won, -1 lost, 0 tied
+        ("outcome", "i1"),
+        ("battle_turns", "i2"),
+    ]
+)
+
+CANDIDATE_DTYPE = np.dtype(
+    [
+        ("decision", "i8"),
+        ("action", "U48"),
+        ("score", "f4"),
+        ("chosen", "?"),
+    ]
+)
+
+TABLES = {"decisions": DECISION_DTYPE, "candidates": CANDIDATE_DTYPE}
+
+
+def action_label(order) -> str:
+    """Names an order the way agents name their candidates: "move <id>",
+    "switch <species>", or the raw order message for anything else."""
+    action = getattr(order, "order", None)
+    if isinstance(action, Move):
+        return f"move {action.id}"
+    if isinstance(action, Pokemon):
+        return f"switch {action.species}"
+    return getattr(order, "message", str(order))
+
+
+def _too_long(table: str, rows: List[tuple]) -> List[Tuple[str, int]]:
+    """(field, longest value) of the text fields rows do not fit in, as NumPy
+    would cut them short without a word."""
+    dtype = TABLES[table]
+    too_long = []
+    for column, name in enumerate(dtype.names):
+        if dtype[name].kind != "U":
+            continue
+        longest = max((len(row[column]) for row in rows), default=0)
+        if longest > dtype[name].itemsize // 4:
+            too_long.append((name, longest))
+    return too_long
+
+
+def _chunks(directory: str, table: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, f"{table}-*.npy")))
+
+
+def load(directory: str, table: str = "decisions") -> np.ndarray:
+    """All chunks of a table as one structured array."""
+    chunks = [np.load(path, mmap_mode="r") for path in _chunks(directory, table)]
+    if not chunks:
+        return np.empty(0, dtype=TABLES[table])
+    return np.concatenate(chunks)
+
+
+class DatasetRecorder:
+    def __init__(self, directory: str, chunk_rows: int = 50_000):
+        """
+        :param directory: Where the chunks are written, next to earlier runs' chunks.
+        :param chunk_rows: Number of decisions buffered before a chunk is written.
+        """
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.decisions = 0
+        self.chunks = 0
+
+        # Continue numbering after the chunks and decisions already on disk
+        existing = _chunks(directory, "decisions")
+        self._next_chunk = len(existing)
+        self._ids = itertools.count(
+            sum(len(np.load(path, mmap_mode="r")) for path in existing)
+        )
+
+        # Rows of battles in progress, keyed by (agent, battle tag)
+        self._open: Dict[Tuple[int, str], Tuple[list, list]] = {}
+        self._decision_rows: List[tuple] = []
+        self._candidate_rows: List[tuple] = []
+        # Battles forfeited before they ended, whose last decisions are not kept
+        self._forfeited: Set[Tuple[int, str]] = set()
+        # Fields already reported as cut short
+        self._truncated: Set[Tuple[str, str]] = set()
+
+    def attach(self, player: Player) -> Player:
+        """Records player's decisions, and their outcome once each battle ends."""
+        choose_move = player.choose_move
+        battle_finished_callback = player._battle_finished_callback
+        reset_battles = player.reset_battles
+        send_message = player.ps_client.send_message
+
+        async def recorded_choose_move(battle):
+            choice = choose_move(battle)
+            if inspect.isawaitable(choice):
+                choice = await choice
+            self._record(player, battle, choice)
+            return choice
+
+        def recording_battle_finished_callback(battle):
+            battle_finished_callback(battle)
+            self._finish(player, battle)
+
+        def recording_reset_battles():
+            reset_battles()
+            self._discard(player, lambda tag: tag not in player._battles)
+
+        async def recording_send_message(message, room="", message_2=None):
+            if message == "/forfeit":
+                self._forfeited.add((id(player), room))
+                self._discard(player, lambda tag: tag == room)
+            return await send_message(message, room, message_2)
+
+        player.choose_move = recorded_choose_move
+        player._battle_finished_callback = recording_battle_finished_callback
+        player.reset_battles = recording_reset_battles
+        player.ps_client.send_message = recording_send_message
+        return player
+
+    def _discard(self, player: Player, dropped):
+        for key in [key for key in self._open if key[0] == id(player) and dropped(key[1])]:
+            del self._open[key]
+
+    def _record(self, player: Player, battle, choice):
+        if (id(player), battle.battle_tag) in self._forfeited:
+            return
+        decisions, candidates = self._open.setdefault(
+            (id(player), battle.battle_tag), ([], [])
+        )
+        decision = next(self._ids)
+        action = action_label(choice)
+        details = getattr(player, "last_decision", {}).get(battle.battle_tag, {})
+        scores = details.get("scores", [])
+
+        active = battle.active_pokemon
+        opponent_active = battle.opponent_active_pokemon
+        decisions.append(
+            (
+                decision,
+                battle.battle_tag,
+                player.username,
+                battle.opponent_username or "",
+                battle.turn,
+                active.species if active else "",
+                opponent_active.species if opponent_active else "",
+                active.current_hp_fraction if active else 0.0,
+                opponent_active.current_hp_fraction if opponent_active else 0.0,
+                sum(not mon.fainted for mon in battle.team.values()),
+                # Unrevealed opponents count as healthy
+                len(battle.opponent_team)
+                - sum(mon.fainted for mon in battle.opponent_team.values())
+                + max(0, 6 - len(battle.opponent_team)),
+                action,
+                details.get("branch") or "",
+                details.get("candidates", len(scores)),
+            )
+        )
+        candidates.extend(
+            (decision, label, score, label == action) for label, score in scores
+        )
+
+    def _finish(self, player: Player, battle):
+        self._forfeited.discard((id(player), battle.battle_tag))
+        rows = self._open.pop((id(player), battle.battle_tag), None)
+        if rows is None:
+            return
+        decisions, candidates = rows
+
+        outcome = 1 if battle.won else -1 if battle.lost else 0
+        self._decision_rows.extend(row + (outcome, battle.turn) for row in decisions)
+        self._candidate_rows.extend(candidates)
+        if len(self._decision_rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Writes the finished battles' buffered rows as one chunk per table."""
+        if not self._decision_rows:
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        for table, rows in (
+            ("decisions", self._decision_rows),
+            ("candidates", self._candidate_rows),
+        ):
+            for name, longest in _too_long(table, rows):
+                if (table, name) not in self._truncated:
+                    self._truncated.add((table, name))
+                    print(
+                        f"⚠️ {table}.{name} cut short: values of up to {longest} "
+                        f"characters, {TABLES[table][name].itemsize // 4} stored"
+                    )
+            path = os.path.join(self.directory, f"{table}-{self._next_chunk:06d}.npy")
+            # Write then rename, so readers never see a partial chunk
+            temporary = f"{path}.tmp"
+            with open(temporary, "wb") as file:
+                np.save(file, np.array(rows, dtype=TABLES[table]))
+            os.replace(temporary, path)
+
+        self.decisions += len(self._decision_rows)
+        self.chunks += 1
+        self._next_chunk += 1
+        self._decision_rows = []
+        self._candidate_rows = []
+
+    def close(self):
+        # Battles still in progress have no outcome and are left out
+        self.flush()
+        self._open.clear()
+        self._forfeited.clear()
+
+    def summary(self) -> str:
+        return (
+            f"{self.decisions} decisions written to {self.directory} "
+            f"in {self.chunks} chunks"
+        )
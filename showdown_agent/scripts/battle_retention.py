@@ -0,0 +1,109 @@
+# Bounded memory for long-running agents. poke_env keeps every battle a player
+# has played in player.battles, each with its full request history and the
+# events of every turn, so over a tournament memory grows with every game.
+#
+# A RetentionPolicy compacts finished battles into a BattleSummary (result,
+# turns and both teams) once they fall out of the last keep_last finished
+# battles. Summaries stay in player.battles, so n_won_battles, n_finished_battles
+# and win_rate keep counting them, while the full battle objects are released.
+# Replays are written by poke_env when a battle ends, before it is compacted.
+
+
+from collections import deque
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+from poke_env.player.player import Player
+
+
+def parse_retention(options: Sequence[str]) -> "RetentionPolicy":
+    """Builds the policy asked for by a --keep-battles=N command line option."""
+    for option in options:
+        if option.startswith("--keep-battles="):
+            return RetentionPolicy(keep_last=int(option.split("=", 1)[1]))
+    return RetentionPolicy()
+
+
+class BattleSummary:
+    """What is left of a finished battle once its full object is released."""
+
+    __slots__ = (
+        "battle_tag",
+        "won",
+        "lost",
+        "turn",
+        "team",
+        "opponent_team",
+        "opponent_username",
+    )
+
+    finished = True
+
+    def __init__(self, battle):
+        self.battle_tag: str = battle.battle_tag
+        self.won: Optional[bool] = battle.won
+        self.lost: Optional[bool] = battle.lost
+        self.turn: int = battle.turn
+        self.team: Tuple[str, ...] = tuple(mon.species for mon in battle.team.values())
+        self.opponent_team: Tuple[str, ...] = tuple(
+            mon.species for mon in battle.opponent_team.values()
+        )
+        self.opponent_username: Optional[str] = battle.opponent_username
+
+    def __repr__(self):
+        result = "won" if self.won else "lost" if self.lost else "tied"
+        return f"BattleSummary({self.battle_tag}, {result} in {self.turn} turns)"
+
+
+class RetentionPolicy:
+    def __init__(self, keep_last: int = 1, keep_summaries: bool = True):
+        """
+        :param keep_last: Number of most recent finished battles kept whole. The
+            battle that just finished is always kept until the next one ends, as
+            the server can still send messages to its room.
+        :param keep_summaries: Whether older battles are kept as summaries. If
+            not, they are dropped and no longer count towards win_rate.
+        """
+        if keep_last < 0:
+            raise ValueError("keep_last must be positive or zero")
+
+        self.keep_last = max(keep_last, 1)
+        self.keep_summaries = keep_summaries
+        self.compacted = 0
+
+        # Per agent, tags of the finished battles still kept whole, oldest first
+        self._finished: Dict[int, Deque[str]] = {}
+
+    def apply(self, player: Player) -> Player:
+        """Compacts player's battles as they finish, after its own callback ran."""
+        finished = self._finished.setdefault(id(player), deque())
+        battle_finished_callback = player._battle_finished_callback
+
+        def retaining_battle_finished_callback(battle):
+            battle_finished_callback(battle)
+            finished.append(battle.battle_tag)
+            self._compact(player, finished)
+
+        player._battle_finished_callback = retaining_battle_finished_callback
+        return player
+
+    def _compact(self, player: Player, finished: Deque[str]):
+        battles = player._battles
+        while len(finished) > self.keep_last:
+            battle_tag = finished.popleft()
+            # Battles dropped by reset_battles are already gone
+            battle = battles.get(battle_tag)
+            if battle is None or isinstance(battle, BattleSummary):
+                continue
+
+            if self.keep_summaries:
+                battles[battle_tag] = BattleSummary(battle)
+            else:
+                del battles[battle_tag]
+            self.compacted += 1
+
+    def summary(self) -> str:
+        kept = "as summaries" if self.keep_summaries else "dropped"
+        return (
+            f"{self.compacted} finished battles {kept}, "
+            f"last {self.keep_last} kept whole per agent"
+        )
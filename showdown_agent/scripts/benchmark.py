@@ -0,0 +1,212 @@
+# python benchmark.py [--battles N] [--seed S] [--output FILE]
+#
+# Plays fixed-seed round-robin matchups between ratk825 and the simple,
+# max_damage and random bots on the offline simulator (see offline_sim.py) and
+# reports battle and turn throughput, choose_move latency percentiles per agent,
+# event-loop lag and peak RSS. The numbers are also written as JSON so runs can
+# be compared over time and performance regressions caught before tournaments.
+
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from poke_env.concurrency import POKE_LOOP
+from poke_env.player.player import Player
+from tabulate import tabulate
+
+import offline_sim
+from expert_main import gather_bots, gather_players
+
+AGENTS = ("ratk825", "simple-uber", "max_damage-uber", "random-uber")
+PERCENTILES = (50, 95, 99)
+LAG_INTERVAL = 0.01
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99 and max of samples, in milliseconds."""
+    if not samples:
+        return {**{f"p{p}": None for p in PERCENTILES}, "max": None}
+    values = np.percentile(np.asarray(samples) * 1000.0, PERCENTILES)
+    return {
+        **{f"p{p}": float(v) for p, v in zip(PERCENTILES, values)},
+        "max": max(samples) * 1000.0,
+    }
+
+
+def time_choose_move(player: Player, samples: List[float]):
+    """Records how long every choose_move of player takes, awaiting it if needed."""
+    choose_move = player.choose_move
+
+    async def timed_choose_move(battle):
+        start = time.perf_counter()
+        choice = choose_move(battle)
+        if inspect.isawaitable(choice):
+            choice = await choice
+        samples.append(time.perf_counter() - start)
+        return choice
+
+    player.choose_move = timed_choose_move
+
+
+async def monitor_lag(samples: List[float], stop: asyncio.Event):
+    """Samples how late the loop wakes up from a LAG_INTERVAL sleep."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_matchups(agents: List[Player], n_battles: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    matchups = []
+    for i, p1 in enumerate(agents):
+        for p2 in agents[i + 1 :]:
+            start = time.perf_counter()
+            await offline_sim.battle_against(p1, p2, n_battles, rng.getrandbits(64))
+            elapsed = time.perf_counter() - start
+
+            matchups.append(
+                {
+                    "p1": p1.username,
+                    "p2": p2.username,
+                    "battles": p1.n_finished_battles,
+                    "p1_wins": p1.n_won_battles,
+                    "p2_wins": p2.n_won_battles,
+                    "turns": sum(battle.turn for battle in p1.battles.values()),
+                    "seconds": elapsed,
+                }
+            )
+            p1.reset_battles()
+            p2.reset_battles()
+    return matchups
+
+
+def benchmark(n_battles: int, seed: int) -> dict:
+    # Bots and poke_env's default-order fallback draw from the global generators
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+    candidates = gather_players(start_listening=False) + gather_bots(
+        start_listening=False
+    )
+    agents = [next(p for p in candidates if p.username == name) for name in AGENTS]
+
+    latencies: Dict[str, List[float]] = {}
+    for agent in agents:
+        agent._save_replays = False
+        time_choose_move(agent, latencies.setdefault(agent.username, []))
+
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.run_coroutine_threadsafe(monitor_lag(lag, stop), POKE_LOOP)
+
+    start = time.perf_counter()
+    matchups = asyncio.run(run_matchups(agents, n_battles, seed))
+    elapsed = time.perf_counter() - start
+
+    POKE_LOOP.call_soon_threadsafe(stop.set)
+    monitor.result()
+
+    battles = sum(m["battles"] for m in matchups)
+    turns = sum(m["turns"] for m in matchups)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "seed": seed,
+        "battles_per_matchup": n_battles,
+        "seconds": elapsed,
+        "battles": battles,
+        "turns": turns,
+        "battles_per_second": battles / elapsed,
+        "turns_per_second": turns / elapsed,
+        "choose_move_ms": {
+            name: {"decisions": len(samples), **percentiles(samples)}
+            for name, samples in latencies.items()
+        },
+        "loop_lag_ms": percentiles(lag),
+        "peak_rss_mb": peak_rss_mb(),
+        "matchups": matchups,
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"{report['battles']} battles, {report['turns']} turns in "
+        f"{report['seconds']:.1f}s: {report['battles_per_second']:.2f} battles/s, "
+        f"{report['turns_per_second']:.1f} turns/s"
+    )
+    print()
+
+    headers = ["Agent", "Decisions"] + [f"p{p} ms" for p in PERCENTILES] + ["max ms"]
+    rows = [
+        [name, stats["decisions"]]
+        + [stats[f"p{p}"] for p in PERCENTILES]
+        + [stats["max"]]
+        for name, stats in report["choose_move_ms"].items()
+    ]
+    print(tabulate(rows, headers=headers, floatfmt=".2f"))
+    print()
+
+    lag = report["loop_lag_ms"]
+    print(
+        f"Event-loop lag: p50 {lag['p50']:.2f} ms, p99 {lag['p99']:.2f} ms, "
+        f"max {lag['max']:.2f} ms"
+    )
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--battles", type=int, default=10, help="battles per matchup")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        default=os.path.join(os.path.dirname(__file__), "results", "benchmark.json"),
+        help="where to write the JSON report",
+    )
+    args = parser.parse_args()
+
+    report = benchmark(args.battles, args.seed)
+    print_report(report)
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
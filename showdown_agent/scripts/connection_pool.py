@@ -0,0 +1,186 @@
+# Caps how many agents hold a websocket to the Showdown server at once.
+#
+# Showdown ties one logged-in user to each websocket, so agents cannot share a
+# connection. Instead, agents are built without connecting
+# (start_listening=False). A ConnectionPool connects them only when a match
+# holds them, and keeps them connected between matches while there is room.
+# When the cap is reached, the least recently used idle agents are disconnected
+# to make room. A match whose agents cannot all be connected waits until enough
+# connections are released, so open sockets and logins scale with the matches
+# in flight rather than with the number of registered agents.
+
+
+import asyncio
+import contextlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from poke_env.concurrency import POKE_LOOP, handle_threaded_coroutines
+from poke_env.player.player import Player
+
+
+def parse_connections(options: Sequence[str]) -> Optional["ConnectionPool"]:
+    """The pool asked for by a --max-connections=N command line option, if any."""
+    for option in options:
+        if option.startswith("--max-connections="):
+            return ConnectionPool(max_connections=int(option.split("=", 1)[1]))
+    return None
+
+
+class ConnectionPool:
+    def __init__(self, max_connections: int = 16, login_timeout: float = 30.0):
+        """
+        :param max_connections: Most agents connected at the same time; a match
+            needs two.
+        :param login_timeout: Seconds an agent may take to connect and log in.
+        """
+        if max_connections < 2:
+            raise ValueError("A connection pool needs room for at least one match")
+
+        self.max_connections = max_connections
+        self.login_timeout = login_timeout
+
+        self.connects = 0
+        self.disconnects = 0
+        self.peak = 0
+        self.waits = 0
+
+        # Connected agents, least recently used first, and matches holding each
+        self._open: "OrderedDict[Player, None]" = OrderedDict()
+        self._holds: Dict[Player, int] = {}
+        # Connections of the open agents, possibly still logging in, and
+        # disconnections in progress, awaited before an agent connects again
+        self._ready: Dict[Player, asyncio.Future] = {}
+        self._closing: Dict[Player, asyncio.Future] = {}
+
+        self._changed: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Conditions are bound to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self._changed is None or self._loop is not loop:
+            self._changed = asyncio.Condition()
+            self._loop = loop
+        return self._changed
+
+    def _evictions(self, players: Sequence[Player]) -> Optional[List[Player]]:
+        """Idle agents to disconnect so that players can all be connected, or None
+        if there are not enough idle ones yet."""
+        missing = [player for player in players if player not in self._open]
+        excess = len(self._open) + len(missing) - self.max_connections
+        if excess <= 0:
+            return []
+
+        idle = [
+            player
+            for player in self._open
+            if not self._holds.get(player) and player not in players
+        ]
+        return idle[:excess] if len(idle) >= excess else None
+
+    @contextlib.asynccontextmanager
+    async def hold(self, *players: Player):
+        """Connects players, if they are not already, for the duration of a match."""
+        players = tuple(dict.fromkeys(players))
+        changed = self._condition()
+        async with changed:
+            evicted = self._evictions(players)
+            if evicted is None:
+                self.waits += 1
+            while evicted is None:
+                await changed.wait()
+                evicted = self._evictions(players)
+
+            for player in evicted:
+                del self._open[player]
+                del self._ready[player]
+                self._closing[player] = asyncio.ensure_future(self._disconnect(player))
+
+            for player in players:
+                if player not in self._open:
+                    self._ready[player] = asyncio.ensure_future(self._connect(player))
+                self._open[player] = None
+                self._open.move_to_end(player)
+                self._holds[player] = self._holds.get(player, 0) + 1
+            self.peak = max(self.peak, len(self._open))
+            # Matches sharing an agent wait on the same login
+            ready = [self._ready[player] for player in players]
+
+        try:
+            await asyncio.gather(*(asyncio.shield(login) for login in ready))
+            yield
+        finally:
+            async with changed:
+                for player, login in zip(players, ready):
+                    self._holds[player] -= 1
+                    if not self._holds[player]:
+                        del self._holds[player]
+                        # A failed login leaves nothing worth keeping open
+                        if login.done() and (
+                            login.cancelled() or login.exception() is not None
+                        ):
+                            self._open.pop(player, None)
+                            self._ready.pop(player, None)
+                changed.notify_all()
+
+    async def _connect(self, player: Player):
+        closing = self._closing.pop(player, None)
+        if closing is not None:
+            await closing
+
+        ps_client = player.ps_client
+        listening = getattr(ps_client, "_listening_coroutine", None)
+        if listening is not None and not listening.done():
+            # Built with start_listening=True, or still connected
+            return
+
+        await handle_threaded_coroutines(_clear_login(ps_client))
+        # The same call PSClient makes when it is built with start_listening=True
+        ps_client._listening_coroutine = asyncio.run_coroutine_threadsafe(
+            ps_client.listen(), POKE_LOOP
+        )
+        self.connects += 1
+
+        await handle_threaded_coroutines(
+            ps_client.wait_for_login(wait_for=self.login_timeout)
+        )
+        if not ps_client.logged_in.is_set():
+            await self._disconnect(player)
+            raise ConnectionError(
+                f"{player.username} not logged in after {self.login_timeout:g}s"
+            )
+
+    async def _disconnect(self, player: Player):
+        ps_client = player.ps_client
+        listening = getattr(ps_client, "_listening_coroutine", None)
+        if listening is None or listening.done():
+            return
+
+        await ps_client.stop_listening()
+        await asyncio.wrap_future(listening)
+        await handle_threaded_coroutines(_clear_login(ps_client))
+        self.disconnects += 1
+
+    async def close(self):
+        """Disconnects every agent the pool connected."""
+        changed = self._condition()
+        async with changed:
+            players = list(self._open)
+            self._open.clear()
+            self._ready.clear()
+        await asyncio.gather(*self._closing.values())
+        self._closing.clear()
+        await asyncio.gather(*(self._disconnect(player) for player in players))
+
+    def summary(self) -> str:
+        return (
+            f"{self.connects} connections opened, {self.disconnects} closed, "
+            f"at most {self.peak} of {self.max_connections} open, "
+            f"{self.waits} matches waited for a connection"
+        )
+
+
+async def _clear_login(ps_client):
+    # The login event belongs to poke_env's loop
+    ps_client.logged_in.clear()
@@ -0,0 +1,203 @@
+# Opt-in per-decision profiling for the agents loaded by the runners (--profile).
+#
+# Every choose_move of an instrumented agent records its wall time, the memory
+# it allocated (tracemalloc), the branch that picked the order and how many
+# candidates were considered. Agents that publish ``last_decision`` (see
+# ratk825) report their own branch and candidate count; for others the branch
+# is left empty and the candidates are the available moves and switches.
+#
+# While decisions are in flight a sampling thread records the stack of the
+# thread making them. The stacks of the slowest decisions are exported in the
+# collapsed "frame;frame;frame count" format read by flamegraph.pl and
+# speedscope, next to a JSON summary with per-agent histograms.
+
+
+import bisect
+import heapq
+import inspect
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from poke_env.player.player import Player
+
+# Upper bucket edges: milliseconds for wall time, kilobytes for allocations
+TIME_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+ALLOC_BUCKETS_KB = (1, 4, 16, 64, 256, 1024, 4096, 16384)
+
+
+def _histogram(values: List[float], edges) -> Dict[str, int]:
+    counts = [0] * (len(edges) + 1)
+    for value in values:
+        counts[bisect.bisect_left(edges, value)] += 1
+    labels = [f"<={edge}" for edge in edges] + [f">{edges[-1]}"]
+    return dict(zip(labels, counts))
+
+
+def _collapse(frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class DecisionProfiler:
+    def __init__(
+        self, output_dir: str, slowest: int = 20, sample_interval: float = 0.001
+    ):
+        """
+        :param output_dir: Where export writes decisions.json and the stacks.
+        :param slowest: Number of slowest decisions per agent whose stacks are kept.
+        :param sample_interval: Seconds between two stack samples.
+        """
+        self.output_dir = output_dir
+        self.slowest = slowest
+        self.sample_interval = sample_interval
+
+        self._records: Dict[str, List[dict]] = defaultdict(list)
+        # Per agent, a min-heap of (seconds, tie breaker, battle tag, stack counts)
+        self._slow: Dict[str, list] = defaultdict(list)
+        self._order = itertools.count()
+
+        # Decisions in flight: id -> (thread ident, stack counts)
+        self._active: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def instrument(self, player: Player) -> Player:
+        """Wraps player.choose_move so that every decision is profiled."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._start_sampler()
+
+        choose_move = player.choose_move
+
+        async def profiled_choose_move(battle):
+            decision = next(self._order)
+            stacks: Counter = Counter()
+            with self._lock:
+                self._active[decision] = (threading.get_ident(), stacks)
+
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                choice = choose_move(battle)
+                if inspect.isawaitable(choice):
+                    choice = await choice
+            finally:
+                elapsed = time.perf_counter() - start
+                allocated = tracemalloc.get_traced_memory()[1] - traced
+                with self._lock:
+                    del self._active[decision]
+
+            self._record(player, battle, elapsed, allocated, stacks)
+            return choice
+
+        player.choose_move = profiled_choose_move
+        return player
+
+    def _record(self, player: Player, battle, elapsed: float, allocated: int, stacks):
+        details = getattr(player, "last_decision", {}).get(battle.battle_tag, {})
+        candidates = details.get("candidates")
+        if candidates is None:
+            candidates = len(battle.available_moves) + len(battle.available_switches)
+
+        self._records[player.username].append(
+            {
+                "ms": elapsed * 1000.0,
+                # Peak traced memory above the start of the decision; decisions
+                # awaiting at the same time share the peak
+                "peak_kb": max(0, allocated) / 1024.0,
+                "branch": details.get("branch"),
+                "candidates": candidates,
+            }
+        )
+
+        slow = self._slow[player.username]
+        entry = (elapsed, next(self._order), battle.battle_tag, stacks)
+        if len(slow) < self.slowest:
+            heapq.heappush(slow, entry)
+        elif elapsed > slow[0][0]:
+            heapq.heapreplace(slow, entry)
+
+    def _start_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread, stacks in self._active.values():
+                    frame = frames.get(thread)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {}
+        for agent, records in self._records.items():
+            times = sorted(r["ms"] for r in records)
+            summary[agent] = {
+                "decisions": len(records),
+                "mean_ms": sum(times) / len(times),
+                "max_ms": times[-1],
+                "ms_histogram": _histogram(times, TIME_BUCKETS_MS),
+                "peak_kb_histogram": _histogram(
+                    [r["peak_kb"] for r in records], ALLOC_BUCKETS_KB
+                ),
+                "branches": Counter(str(r["branch"]) for r in records),
+                "candidates_histogram": dict(
+                    sorted(Counter(r["candidates"] for r in records).items())
+                ),
+                "slowest": [
+                    {"ms": seconds * 1000.0, "battle": battle_tag}
+                    for seconds, _, battle_tag, _ in sorted(
+                        self._slow[agent], reverse=True
+                    )
+                ],
+            }
+        return summary
+
+    def export(self) -> List[str]:
+        """Writes decisions.json and one <agent>.folded file of the slowest
+        decisions' stacks per agent, and returns the paths written."""
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        paths = [os.path.join(self.output_dir, "decisions.json")]
+        with open(paths[0], "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+
+        for agent, slow in self._slow.items():
+            merged: Counter = Counter()
+            with self._lock:
+                for _, _, _, stacks in slow:
+                    merged.update(stacks)
+            if not merged:
+                continue
+
+            path = os.path.join(self.output_dir, f"{agent}.folded")
+            with open(path, "w", encoding="utf-8") as file:
+                for stack, count in merged.most_common():
+                    file.write(f"{stack} {count}\n")
+            paths.append(path)
+        return paths
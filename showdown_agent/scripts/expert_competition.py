@@ -1,19 +1,54 @@
 # node pokemon-showdown start --no-security
+#
+# or, to spread the tournament over several servers:
+# python expert_competition.py 8000 8001 8002 (see server_pool.py)
+#
+# --adaptive plays each match until an SPRT decides it (see adaptive_eval.py)
+# --profile profiles the players' decisions into results/profile
+# (see decision_profiler.py)
+# --keep-battles=N keeps the last N finished battles whole, the others as summaries
+# (see battle_retention.py)
+# --html-replays saves one HTML file per knockout battle instead of one compressed
+# archive per round (see replay_archive.py)
+# --dataset records every decision into results/dataset (see battle_dataset.py)
+# --max-connections=N keeps at most N agents connected at once, connecting them
+# for their matches (see connection_pool.py)
+# --match-timeout=SECONDS bounds each knockout match attempt (0 for no limit);
+# a match that keeps timing out or failing is forfeited to the higher seed
+# --no-ratings leaves results/ratings.json, the Glicko-2 ratings every game
+# updates, untouched (see ratings.py)
 
 
 import asyncio
 import csv
-import importlib
 import os
 import random
 import sys
+import time
 from collections import defaultdict
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
-import poke_env as pke
 from poke_env import AccountConfiguration
+from poke_env.concurrency import handle_threaded_coroutines
+from poke_env.data.normalize import to_id_str
 from poke_env.player.player import Player
 
+import agent_registry
+from adaptive_eval import SPRT, cross_evaluate
+from agent_registry import AgentLike, LazyAgent, built, resolve, when_built
+from battle_dataset import DatasetRecorder
+from battle_retention import RetentionPolicy, parse_retention
+from connection_pool import ConnectionPool, parse_connections
+from decision_profiler import DecisionProfiler
+from ratings import RatingBook, rank_players_by_victories
+from replay_archive import ReplaySink
+from server_pool import ServerPool, parse_servers
+from team_registry import registry
+
+# Wall-clock limit of one attempt at a knockout match, and attempts per match
+KNOCKOUT_MATCH_TIMEOUT = 900.0
+KNOCKOUT_MATCH_ATTEMPTS = 2
+
 
 def convert_results_to_html(csv_file: str, html_file: str):
     with open(csv_file, newline="", encoding="utf-8") as infile:
@@ -65,10 +100,11 @@ def convert_results_to_html(csv_file: str, html_file: str):
 
 
 class Competitor:
-    def __init__(self, id: int, username: str, agent: Player):
+    def __init__(self, id: int, username: str, agent: AgentLike):
         self.id = id
         self.username = username
-        self.agent = agent
+        # The Player, or a LazyAgent until a match needs it
+        self.entry = agent
 
         self.wins = 0
         self.losses = 0
@@ -76,6 +112,10 @@ class Competitor:
         self.history: Set[int] = set()
         self.received_bye = False
 
+    @property
+    def agent(self) -> Player:
+        return resolve(self.entry)
+
     def is_active(self, win_cap: int, loss_cap: int) -> bool:
         return self.wins < win_cap and self.losses < loss_cap
 
@@ -88,62 +128,139 @@ class Competitor:
         self.history.clear()
 
 
-def gather_players():
+def gather_players(
+    profiler: Optional[DecisionProfiler] = None,
+    retention: Optional[RetentionPolicy] = None,
+    **agent_kwargs,
+):
     player_folders = os.path.join(os.path.dirname(__file__), "players")
 
     players = []
 
-    for module_name in os.listdir(player_folders):
-        if module_name.endswith(".py"):
-            module_path = f"{player_folders}/{module_name}"
-
-            spec = importlib.util.spec_from_file_location(module_name, module_path)
-            module = importlib.util.module_from_spec(spec)
-
-            sys.modules[module_name] = module
-            spec.loader.exec_module(module)
-
-            # Get the class
-            if hasattr(module, "CustomAgent"):
-                # Check if the class is a subclass of Player
-                agent_class = getattr(module, "CustomAgent")
-
-                config_name = f"{module_name[:-3]}"
-                account_config = AccountConfiguration(config_name, None)
-                players.append(
-                    agent_class(
-                        account_configuration=account_config,
-                        battle_format="gen9ubers",
-                    )
-                )
+    # Each module is imported once per run, however many servers ask for agents
+    for config_name, agent_class in agent_registry.discover(player_folders).items():
+        account_config = AccountConfiguration(config_name, None)
+        player = agent_class(
+            account_configuration=account_config,
+            battle_format="gen9ubers",
+            **agent_kwargs,
+        )
+        if not registry(player.format).admit(player):
+            continue
+        if profiler is not None:
+            profiler.instrument(player)
+        if retention is not None:
+            retention.apply(player)
+        players.append(player)
 
     return players
 
 
-def rank_players_by_victories(results_dict, top_k=10):
-    victory_scores = {}
-
-    for player, opponents in results_dict.items():
-        victories = [
-            1 if (score is not None and score > 0.5) else 0
-            for opp, score in opponents.items()
-            if opp != player
-        ]
-        if victories:
-            victory_scores[player] = sum(victories) / len(victories)
-        else:
-            victory_scores[player] = 0.0
-
-    # Sort by descending victory rate
-    sorted_players = sorted(victory_scores.items(), key=lambda x: x[1], reverse=True)
-
-    return sorted_players[:top_k]
+async def wait_for_logins(players: List[Player], timeout: float = 30.0):
+    """Waits until every agent is logged in, so no match pays for a connection."""
+    await asyncio.gather(
+        *(
+            handle_threaded_coroutines(
+                player.ps_client.wait_for_login(wait_for=timeout)
+            )
+            for player in players
+        )
+    )
 
+    missing = [p.username for p in players if not p.ps_client.logged_in.is_set()]
+    if missing:
+        print(f"⚠️ Not logged in after {timeout:.0f}s: {', '.join(missing)}")
+
+
+async def abandon(players: List[Player], grace: float = 10.0):
+    """Cleans up after a match that was cut short: withdraws its challenges,
+    forfeits its unfinished battles and waits up to grace seconds for them to end,
+    so that the players can be matched again."""
+    await asyncio.gather(
+        *(
+            handle_threaded_coroutines(
+                _abandon(
+                    player,
+                    [p.username for p in players if p is not player],
+                    grace,
+                )
+            )
+            for player in players
+        )
+    )
 
-async def run_battle(p1: Competitor, p2: Competitor) -> Tuple[Competitor, Competitor]:
-    players = [p1.agent, p2.agent]
 
-    cross_evaluation_results = await pke.cross_evaluate(players, n_challenges=3)
+async def _abandon(player: Player, opponents: List[str], grace: float):
+    # Runs on poke_env's loop, which owns the player's battles and queues
+    if player.ps_client.logged_in.is_set():
+        for opponent in opponents:
+            await player.ps_client.send_message(
+                f"/cancelchallenge {to_id_str(opponent)}"
+            )
+        for battle in player.battles.values():
+            if not battle.finished:
+                await player.ps_client.send_message("/forfeit", battle.battle_tag)
+
+    try:
+        await asyncio.wait_for(player._battle_count_queue.join(), grace)
+    except asyncio.TimeoutError:
+        pass
+
+    # Forget the challenges and battle starts the cut short match was waiting for
+    while not player._challenge_queue.empty():
+        player._challenge_queue.get_nowait()
+    player._battle_semaphore = asyncio.Semaphore(0)
+    # Battles that have not ended yet are kept so their last messages find them
+    player._battles = {
+        tag: battle for tag, battle in player._battles.items() if not battle.finished
+    }
+
+
+async def run_battle(
+    p1: Competitor,
+    p2: Competitor,
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    connections: Optional[ConnectionPool] = None,
+    timeout: Optional[float] = None,
+    replay_dir: Optional[str] = None,
+) -> Tuple[Competitor, Competitor]:
+    """Plays a match and returns (winner, loser).
+
+    :param timeout: Seconds the games may take, not counting the wait for a server
+        or a connection. A match that runs out of time, or fails, is abandoned
+        (see abandon) and raises.
+    :param replay_dir: Where p1 saves the match's replays, if not where it
+        otherwise would.
+    """
+
+    async def evaluate(players: List[Player]):
+        try:
+            return await asyncio.wait_for(
+                cross_evaluate(players, n_challenges=3, rule=rule), timeout
+            )
+        except BaseException:
+            await abandon(players)
+            raise
+
+    async def play(players: List[Player]):
+        if replay_dir is not None:
+            # Set on the instance that plays, so only the server the match lands
+            # on builds its agents
+            players[0]._save_replays = replay_dir
+        if connections is None:
+            await wait_for_logins(players)
+            return await evaluate(players)
+        # Connected for this match only, if the pool needs the room afterwards
+        async with connections.hold(*players):
+            return await evaluate(players)
+
+    if pool is not None:
+        # Only the replicas on the server the match lands on are built
+        async with pool.lease(p1.entry, p2.entry) as replicas:
+            cross_evaluation_results = await play(replicas)
+    else:
+        cross_evaluation_results = await play([p1.agent, p2.agent])
 
     top_players = rank_players_by_victories(
         cross_evaluation_results, top_k=len(cross_evaluation_results)
@@ -158,12 +275,36 @@ async def run_battle(p1: Competitor, p2: Competitor) -> Tuple[Competitor, Compet
     return winner, loser
 
 
-def run_swiss_round(
+async def run_battles(
+    pairings: List[Tuple[Competitor, Competitor]],
+    max_concurrent: int,
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    connections: Optional[ConnectionPool] = None,
+) -> List[Tuple[Competitor, Competitor]]:
+    """Runs independent pairings concurrently, at most max_concurrent at a time.
+
+    Returns (winner, loser) for each pairing, in the order of pairings.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def run(p1: Competitor, p2: Competitor):
+        async with semaphore:
+            return await run_battle(p1, p2, pool, rule, connections)
+
+    return await asyncio.gather(*(run(p1, p2) for p1, p2 in pairings))
+
+
+async def run_swiss_round(
     competitors: list[Competitor],
     results_file: str,
     summary_file: str,
     win_cap: int = 3,
     loss_cap: int = 2,
+    max_concurrent_matches: int = 8,
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    connections: Optional[ConnectionPool] = None,
 ):
     round_num = 0
 
@@ -194,6 +335,10 @@ def run_swiss_round(
             for competitor in active_players:
                 brackets[(competitor.wins, competitor.losses)].append(competitor)
 
+            # Pair the whole round first; every player is in at most one pairing,
+            # so the matches are independent and can be played concurrently
+            pairings: List[Tuple[Competitor, Competitor]] = []
+            entries = []
             for group_key in sorted(brackets.keys()):
                 group = brackets[group_key]
                 random.shuffle(group)
@@ -204,28 +349,27 @@ def run_swiss_round(
                     for i, p2 in enumerate(unpaired):
                         if p2.id not in p1.history:
                             unpaired.pop(i)
-                            winner, loser = asyncio.run(run_battle(p1, p2))
-                            print(
-                                f"Group {group_key}: {p1.username} vs {p2.username} → Winner: {winner.username}"
-                            )
-                            file.write(
-                                f"{round_num}\t{group_key}\t{p1.username}\t{p2.username}\t{winner.username}\tno\n"
-                            )
+                            entries.append((group_key, len(pairings), ""))
+                            pairings.append((p1, p2))
                             break
                     else:
                         # No unique opponent available — just pair with next
                         p2 = unpaired.pop(0)
-                        winner, loser = asyncio.run(run_battle(p1, p2))
-                        print(
-                            f"Group {group_key} (re-pair): {p1.username} vs {p2.username} → Winner: {winner.username}"
-                        )
-                        file.write(
-                            f"{round_num}\t{group_key}\t{p1.username}\t{p2.username}\t{winner.username}\tno\n"
-                        )
+                        entries.append((group_key, len(pairings), " (re-pair)"))
+                        pairings.append((p1, p2))
 
                 # Bye if odd number
                 if unpaired:
-                    bye_player = unpaired.pop()
+                    entries.append((group_key, None, unpaired.pop()))
+
+            results = await run_battles(
+                pairings, max_concurrent_matches, pool, rule, connections
+            )
+
+            # Report in pairing order, whatever order the matches finished in
+            for group_key, index, detail in entries:
+                if index is None:
+                    bye_player = detail
                     bye_player.wins += 1
                     print(
                         f"Group {group_key}: Player {bye_player.username} receives a BYE"
@@ -233,6 +377,16 @@ def run_swiss_round(
                     file.write(
                         f"{round_num}\t{group_key}\t{bye_player.username}\t' '\t {bye_player.username}\tyes\n"
                     )
+                    continue
+
+                p1, p2 = pairings[index]
+                winner, loser = results[index]
+                print(
+                    f"Group {group_key}{detail}: {p1.username} vs {p2.username} → Winner: {winner.username}"
+                )
+                file.write(
+                    f"{round_num}\t{group_key}\t{p1.username}\t{p2.username}\t{winner.username}\tno\n"
+                )
 
     print("\n🏁 Final Results:")
     final_sorted = sorted(competitors, key=lambda p: (-p.wins, p.losses, p.id))
@@ -255,7 +409,9 @@ def run_swiss_round(
     return [p for p in final_sorted if p.wins >= win_cap]
 
 
-def generate_bots(num_bots: int):
+def generate_bots(
+    num_bots: int, retention: Optional[RetentionPolicy] = None, **agent_kwargs
+):
     bot_folders = os.path.join(os.path.dirname(__file__), "bots")
     bot_teams_folders = os.path.join(bot_folders, "teams")
 
@@ -267,38 +423,30 @@ def generate_bots(num_bots: int):
     with open(
         os.path.join(bot_teams_folders, team_file), "r", encoding="utf-8"
     ) as file:
-        bot_team = file.read()
+        bot_team = registry("gen9ubers").get(file.read(), team_file)
+
+    # Imported once for all the bots
+    agent_class = agent_registry.load(os.path.join(bot_folders, f"{bot_to_add}.py"))
+    if agent_class is None:
+        raise ImportError(f"{bot_to_add}.py defines no CustomAgent.")
+
+    def build(config_name: str) -> Player:
+        bot = agent_class(
+            team=bot_team,
+            account_configuration=AccountConfiguration(config_name, None),
+            battle_format="gen9ubers",
+            **agent_kwargs,
+        )
+        if retention is not None:
+            retention.apply(bot)
+        return bot
 
+    # Filler bots are only built, and connected, once a match needs them
     for i in range(num_bots):
-        module_name = f"{bot_to_add}.py"
-        module_path = os.path.join(bot_folders, module_name)
-
-        spec = importlib.util.spec_from_file_location(module_name, module_path)
-        if spec is None or spec.loader is None:
-            print(f"⚠️ Could not load module {module_name}. Skipping.")
-            raise ImportError(
-                f"Could not load module {module_name}. Please check the file path."
-            )
-
-        module = importlib.util.module_from_spec(spec)
-
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
-
-        # Get the class
-        if hasattr(module, "CustomAgent"):
-            # Check if the class is a subclass of Player
-            agent_class = getattr(module, "CustomAgent")
-
-            config_name = f"{module_name[:-3]}-{i+1}"
-            account_config = AccountConfiguration(config_name, None)
-            bots.append(
-                agent_class(
-                    team=bot_team,
-                    account_configuration=account_config,
-                    battle_format="gen9ubers",
-                )
-            )
+        config_name = f"{bot_to_add}-{i+1}"
+        bots.append(
+            LazyAgent(config_name, lambda config_name=config_name: build(config_name))
+        )
 
     return bots
 
@@ -312,7 +460,14 @@ def bots_to_add_for_clean_halving(current_players: int, target_top_n: int) -> in
         multiplier += 1
 
 
-def run_swiss_phase(top_k: int, competitors: List[Competitor]):
+async def run_swiss_phase(
+    top_k: int,
+    competitors: List[Competitor],
+    max_concurrent_matches: int = 8,
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    connections: Optional[ConnectionPool] = None,
+):
 
     while len(competitors) > top_k:
         num_competitors = len(competitors)
@@ -343,8 +498,16 @@ def run_swiss_phase(top_k: int, competitors: List[Competitor]):
 
         cap = 3
 
-        competitors = run_swiss_round(
-            competitors, results_file, summary_file, win_cap=cap, loss_cap=cap
+        competitors = await run_swiss_round(
+            competitors,
+            results_file,
+            summary_file,
+            win_cap=cap,
+            loss_cap=cap,
+            max_concurrent_matches=max_concurrent_matches,
+            pool=pool,
+            rule=rule,
+            connections=connections,
         )
 
         convert_results_to_html(
@@ -374,8 +537,68 @@ def run_swiss_phase(top_k: int, competitors: List[Competitor]):
     return competitors
 
 
-def run_knockout_phase(players_ranked: list[Competitor]):
-    """players_ranked: list of player IDs sorted from best (0) to worst (15)"""
+async def run_knockout_match(
+    p1: Competitor,
+    p2: Competitor,
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    connections: Optional[ConnectionPool] = None,
+    timeout: Optional[float] = KNOCKOUT_MATCH_TIMEOUT,
+    attempts: int = KNOCKOUT_MATCH_ATTEMPTS,
+    replay_dir: Optional[str] = None,
+) -> Tuple[Competitor, Competitor, bool]:
+    """Plays a knockout match, replaying it if an attempt times out or fails.
+
+    Returns (winner, loser, forfeited). When every attempt fails, p1, the higher
+    seed, advances by forfeit.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            winner, loser = await run_battle(
+                p1, p2, pool, rule, connections, timeout, replay_dir
+            )
+            return winner, loser, False
+        except asyncio.TimeoutError:
+            # Without a match timeout this is a connection or login timing out
+            reason = "timed out" if timeout is None else f"no result after {timeout:g}s"
+        except Exception as error:
+            reason = f"{type(error).__name__}: {error}"
+        print(
+            f"⚠️ {p1.username} vs {p2.username}, attempt {attempt}/{attempts}: {reason}"
+        )
+
+    p1.wins += 1
+    p2.losses += 1
+    return p1, p2, True
+
+
+async def run_knockout_phase(
+    players_ranked: list[Competitor],
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    connections: Optional[ConnectionPool] = None,
+    max_concurrent_matches: int = 8,
+    match_timeout: Optional[float] = KNOCKOUT_MATCH_TIMEOUT,
+):
+    """players_ranked: list of player IDs sorted from best (0) to worst (15)
+
+    The matches of a round are independent and are played concurrently, each
+    attempt limited to match_timeout seconds (see run_knockout_match).
+    """
+    semaphore = asyncio.Semaphore(max_concurrent_matches)
+
+    async def run(p1: Competitor, p2: Competitor, replay_dir: str):
+        async with semaphore:
+            return await run_knockout_match(
+                p1,
+                p2,
+                pool,
+                rule,
+                connections,
+                match_timeout,
+                replay_dir=replay_dir,
+            )
+
     round_num = 1
     current_round = players_ranked
 
@@ -408,17 +631,21 @@ def run_knockout_phase(players_ranked: list[Competitor]):
             if not os.path.exists(current_dir):
                 os.makedirs(current_dir)
 
-            for i in range(num_matches):
-                p1 = current_round[i]
-                p2 = current_round[-(i + 1)]
-
-                p1.agent._save_replays = (
-                    current_dir + "/" + p1.username + "--vs--" + p2.username
+            pairings = [
+                (current_round[i], current_round[-(i + 1)]) for i in range(num_matches)
+            ]
+            results = await asyncio.gather(
+                *(
+                    run(p1, p2, current_dir + "/" + p1.username + "--vs--" + p2.username)
+                    for p1, p2 in pairings
                 )
+            )
 
-                winner, loser = asyncio.run(run_battle(p1, p2))
+            # Report in bracket order, whatever order the matches finished in
+            for (p1, p2), (winner, loser, forfeited) in zip(pairings, results):
                 print(
                     f"Match: {p1.username} vs {p2.username} → Winner: {winner.username}"
+                    + (" (forfeit)" if forfeited else "")
                 )
 
                 file.write(
@@ -441,10 +668,21 @@ def run_knockout_phase(players_ranked: list[Competitor]):
     return current_round[0]
 
 
-def run_competition(
+async def run_competition(
     players: List[Player],
     top_k: int = 16,
+    max_concurrent_matches: int = 8,
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    retention: Optional[RetentionPolicy] = None,
+    replays: Optional[ReplaySink] = None,
+    dataset: Optional[DatasetRecorder] = None,
+    connections: Optional[ConnectionPool] = None,
+    match_timeout: Optional[float] = KNOCKOUT_MATCH_TIMEOUT,
+    ratings: Optional[RatingBook] = None,
 ):
+    start = time.perf_counter()
+
     competitors = [Competitor(i + 1, p.username, p) for i, p in enumerate(players)]
 
     if len(competitors) < top_k:
@@ -455,7 +693,13 @@ def run_competition(
 
     print(f"🤖 Adding {bots_to_add} bots to make a clean halving for {top_k} players")
 
-    bots = generate_bots(bots_to_add)
+    bot_kwargs = {} if connections is None else {"start_listening": False}
+    if pool is not None:
+        bots = pool.replicate(
+            generate_bots, num_bots=bots_to_add, retention=retention, **bot_kwargs
+        )
+    else:
+        bots = generate_bots(bots_to_add, retention, **bot_kwargs)
 
     bot_competitors = [
         Competitor(i + len(players) + 1, p.username, p) for i, p in enumerate(bots)
@@ -463,18 +707,148 @@ def run_competition(
 
     competitors += bot_competitors
 
-    top_k_competitors = run_swiss_phase(top_k, competitors)
+    agents = [c.entry for c in competitors]
+    if pool is not None:
+        agents = [replica for agent in agents for replica in pool.replicas(agent)]
+    # Lazy agents are hooked up when a match builds them
+    if replays is not None:
+        for agent in agents:
+            when_built(agent, replays.attach)
+    if dataset is not None:
+        for agent in agents:
+            when_built(agent, dataset.attach)
+    if ratings is not None:
+        for agent in agents:
+            when_built(agent, ratings.attach)
+    if connections is None:
+        await wait_for_logins(built(agents))
+
+    setup_time = time.perf_counter() - start
+    start = time.perf_counter()
+
+    top_k_competitors = await run_swiss_phase(
+        top_k, competitors, max_concurrent_matches, pool, rule, connections
+    )
+
+    swiss_time = time.perf_counter() - start
+    start = time.perf_counter()
 
     print("\n🏁 Knockout Rounds:")
-    winner = run_knockout_phase(top_k_competitors)
+    winner = await run_knockout_phase(
+        top_k_competitors,
+        pool,
+        rule,
+        connections,
+        max_concurrent_matches,
+        match_timeout,
+    )
     print(f"\n🏆 Final Winner: {winner.username} (ID: {winner.id})")
 
+    knockout_time = time.perf_counter() - start
+    print(
+        f"\n⏱️ Setup (bots and logins): {setup_time:.1f}s | "
+        f"Swiss: {swiss_time:.1f}s | Knockout: {knockout_time:.1f}s"
+    )
+
+    if pool is not None:
+        print(pool.summary())
+    if rule is not None:
+        print(rule.summary())
+    if retention is not None:
+        print(retention.summary())
+    if replays is not None:
+        replays.close()
+        print(replays.summary())
+    if dataset is not None:
+        dataset.close()
+        print(dataset.summary())
+    if connections is not None:
+        await connections.close()
+        print(connections.summary())
+    if ratings is not None:
+        ratings.save()
+        print(ratings.summary())
+        for rank, rating in enumerate(ratings.leaderboard(top_k), 1):
+            print(
+                f"{rank}. {rating.name} - {rating.rating:.0f} ± {2 * rating.deviation:.0f}"
+            )
+
 
 def main():
+    options = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    servers = parse_servers([arg for arg in sys.argv[1:] if arg not in options])
+    rule = SPRT() if "--adaptive" in options else None
+    retention = parse_retention(options)
+    connections = parse_connections(options)
+    match_timeout: Optional[float] = KNOCKOUT_MATCH_TIMEOUT
+    for option in options:
+        if option.startswith("--match-timeout="):
+            match_timeout = float(option.split("=", 1)[1]) or None
+    ratings = None
+    if "--no-ratings" not in options:
+        ratings = RatingBook(
+            os.path.join(os.path.dirname(__file__), "results", "ratings.json")
+        )
+    # Agents under a connection pool connect when their first match starts
+    agent_kwargs = {} if connections is None else {"start_listening": False}
+    replays = None
+    if "--html-replays" not in options:
+        replays = ReplaySink(os.path.join(os.path.dirname(__file__), "replays"))
+    dataset = None
+    if "--dataset" in options:
+        dataset = DatasetRecorder(
+            os.path.join(os.path.dirname(__file__), "results", "dataset")
+        )
+
+    profiler = None
+    if "--profile" in options:
+        profiler = DecisionProfiler(
+            os.path.join(os.path.dirname(__file__), "results", "profile")
+        )
+
+    if servers:
+        # Keep every server busy; each one plays up to matches_per_server at once
+        pool = ServerPool(servers)
+        players = pool.replicate(
+            gather_players, profiler=profiler, retention=retention, **agent_kwargs
+        )
 
-    players = gather_players()
+        asyncio.run(
+            run_competition(
+                players,
+                top_k=16,
+                max_concurrent_matches=pool.capacity,
+                pool=pool,
+                rule=rule,
+                retention=retention,
+                replays=replays,
+                dataset=dataset,
+                connections=connections,
+                match_timeout=match_timeout,
+                ratings=ratings,
+            )
+        )
+    else:
+        players = gather_players(profiler, retention, **agent_kwargs)
+
+        asyncio.run(
+            run_competition(
+                players,
+                top_k=16,
+                rule=rule,
+                retention=retention,
+                replays=replays,
+                dataset=dataset,
+                connections=connections,
+                match_timeout=match_timeout,
+                ratings=ratings,
+            )
+        )
 
-    run_competition(players, top_k=16)
+    if profiler is not None:
+        profiler.stop()
+        for path in profiler.export():
+            print(f"Decision profile written to {path}")
 
 
 if __name__ == "__main__":
@@ -1,39 +1,49 @@
 # node pokemon-showdown start --no-security
+#
+# or, to spread the evaluation over several servers:
+# python expert_main.py 8000 8001 8002 (see server_pool.py)
+#
+# --adaptive plays each pair until an SPRT decides it (see adaptive_eval.py)
+# --no-cache replays every pair instead of reusing results/cross_eval_cache.json
+# --profile profiles every decision into results/profile (see decision_profiler.py)
+# --keep-battles=N keeps the last N finished battles whole, the others as summaries
+# (see battle_retention.py)
+# --html-replays saves one HTML file per battle instead of the compressed archives
+# (see replay_archive.py)
+# --dataset records every decision into results/dataset (see battle_dataset.py)
+# --rank-by-rating marks by the Glicko-2 ratings every game updates in
+# results/ratings.json instead of by the win rates of this run (see ratings.py)
+# --skip-stable also skips evaluations whose agents all have a stable rating
+# --no-ratings leaves results/ratings.json untouched
 
 
 import asyncio
-import importlib
 import os
 import sys
-from typing import List
+from typing import List, Optional
 
-import poke_env as pke
 from poke_env import AccountConfiguration
 from poke_env.player.player import Player
 from tabulate import tabulate
 
-
-def rank_players_by_victories(results_dict, top_k=10):
-    victory_scores = {}
-
-    for player, opponents in results_dict.items():
-        victories = [
-            1 if (score is not None and score > 0.5) else 0
-            for opp, score in opponents.items()
-            if opp != player
-        ]
-        if victories:
-            victory_scores[player] = sum(victories) / len(victories)
-        else:
-            victory_scores[player] = 0.0
-
-    # Sort by descending victory rate
-    sorted_players = sorted(victory_scores.items(), key=lambda x: x[1], reverse=True)
-
-    return sorted_players[:top_k]
-
-
-def gather_players():
+import adaptive_eval
+import agent_registry
+from adaptive_eval import SPRT
+from battle_dataset import DatasetRecorder
+from battle_retention import RetentionPolicy, parse_retention
+from decision_profiler import DecisionProfiler
+from ratings import RatingBook, rank_players_by_victories
+from replay_archive import ReplaySink
+from results_cache import ResultsCache
+from server_pool import ServerPool, parse_servers
+from team_registry import registry
+
+
+def gather_players(
+    profiler: Optional[DecisionProfiler] = None,
+    retention: Optional[RetentionPolicy] = None,
+    **agent_kwargs,
+):
     player_folders = os.path.join(os.path.dirname(__file__), "players")
 
     players = []
@@ -42,94 +52,107 @@ def gather_players():
     if not os.path.exists(replay_dir):
         os.makedirs(replay_dir)
 
-    for module_name in os.listdir(player_folders):
-        if module_name.endswith(".py"):
-            module_path = f"{player_folders}/{module_name}"
-
-            spec = importlib.util.spec_from_file_location(module_name, module_path)
-            module = importlib.util.module_from_spec(spec)
-
-            sys.modules[module_name] = module
-            spec.loader.exec_module(module)
-
-            # Get the class
-            if hasattr(module, "CustomAgent"):
-                # Check if the class is a subclass of Player
-
-                player_name = f"{module_name[:-3]}"
-
-                agent_class = getattr(module, "CustomAgent")
-
-                agent_replay_dir = os.path.join(replay_dir, f"{player_name}")
-                if not os.path.exists(agent_replay_dir):
-                    os.makedirs(agent_replay_dir)
-
-                account_config = AccountConfiguration(player_name, None)
-                player = agent_class(
-                    account_configuration=account_config,
-                    battle_format="gen9ubers",
-                )
-
-                player._save_replays = agent_replay_dir
-
-                players.append(player)
+    # Each module is imported once per run, however many servers ask for agents
+    for player_name, agent_class in agent_registry.discover(player_folders).items():
+        agent_replay_dir = os.path.join(replay_dir, f"{player_name}")
+        if not os.path.exists(agent_replay_dir):
+            os.makedirs(agent_replay_dir)
+
+        account_config = AccountConfiguration(player_name, None)
+        player = agent_class(
+            account_configuration=account_config,
+            battle_format="gen9ubers",
+            **agent_kwargs,
+        )
+
+        player._save_replays = agent_replay_dir
+        if not registry(player.format).admit(player):
+            continue
+        if profiler is not None:
+            profiler.instrument(player)
+        if retention is not None:
+            retention.apply(player)
+
+        players.append(player)
 
     return players
 
 
-def gather_bots():
+def gather_bots(
+    profiler: Optional[DecisionProfiler] = None,
+    retention: Optional[RetentionPolicy] = None,
+    **agent_kwargs,
+):
     bot_folders = os.path.join(os.path.dirname(__file__), "bots")
     bot_teams_folders = os.path.join(bot_folders, "teams")
 
     generic_bots = []
 
-    bot_teams = {}
-
-    for team_file in os.listdir(bot_teams_folders):
-        if team_file.endswith(".txt"):
-            with open(
-                os.path.join(bot_teams_folders, team_file), "r", encoding="utf-8"
-            ) as file:
-                bot_teams[team_file[:-4]] = file.read()
-
-    for module_name in os.listdir(bot_folders):
-        if module_name.endswith(".py"):
-            module_path = f"{bot_folders}/{module_name}"
-
-            spec = importlib.util.spec_from_file_location(module_name, module_path)
-            module = importlib.util.module_from_spec(spec)
-
-            sys.modules[module_name] = module
-            spec.loader.exec_module(module)
-
-            for team_name, team in bot_teams.items():
-                # Get the class
-                if hasattr(module, "CustomAgent"):
-                    # Check if the class is a subclass of Player
-                    agent_class = getattr(module, "CustomAgent")
-
-                    config_name = f"{module_name[:-3]}-{team_name}"
-                    account_config = AccountConfiguration(config_name, None)
-                    generic_bots.append(
-                        agent_class(
-                            team=team,
-                            account_configuration=account_config,
-                            battle_format="gen9ubers",
-                        )
-                    )
+    # Parsed and validated once, whatever the number of bots and servers
+    bot_teams = registry("gen9ubers").load(bot_teams_folders)
+
+    for bot_name, agent_class in agent_registry.discover(bot_folders).items():
+        for team_name, team in bot_teams.items():
+            config_name = f"{bot_name}-{team_name}"
+            account_config = AccountConfiguration(config_name, None)
+            bot = agent_class(
+                team=team,
+                account_configuration=account_config,
+                battle_format="gen9ubers",
+                **agent_kwargs,
+            )
+            if profiler is not None:
+                profiler.instrument(bot)
+            if retention is not None:
+                retention.apply(bot)
+            generic_bots.append(bot)
 
     return generic_bots
 
 
-async def cross_evaluate(agents: List[Player]):
-    return await pke.cross_evaluate(agents, n_challenges=3)
+async def cross_evaluate(
+    agents: List[Player],
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    cache: Optional[ResultsCache] = None,
+):
+    if pool is not None:
+        return await pool.cross_evaluate(
+            agents, n_challenges=3, rule=rule, cache=cache
+        )
+    return await adaptive_eval.cross_evaluate(
+        agents, n_challenges=3, rule=rule, cache=cache
+    )
 
 
-def evalute_againts_bots(players: List[Player]):
+def evalute_againts_bots(
+    players: List[Player],
+    pool: Optional[ServerPool] = None,
+    rule: Optional[SPRT] = None,
+    cache: Optional[ResultsCache] = None,
+    ratings: Optional[RatingBook] = None,
+    rank_by_rating: bool = False,
+    skip_stable: bool = False,
+):
+    """Cross-evaluates players and ranks them by victories, or by rating when
+    rank_by_rating is set (and ratings given).
+
+    :param skip_stable: Rank by rating without playing when every player's rating
+        is already stable.
+    """
     print(f"{len(players)} are competing in this challenge")
 
+    if ratings is not None:
+        # Cached games count towards the ratings even if they were never rated
+        if cache is not None:
+            ratings.sync(cache, players, adaptive_eval.evaluation_mode(3, rule))
+        if skip_stable and all(ratings.stable(player) for player in players):
+            print("Ratings are stable, no evaluation needed")
+            print("Rankings")
+            return ratings.rank_players(players, top_k=len(players))
+
     print("Running Cross Evaluations...")
-    cross_evaluation_results = asyncio.run(cross_evaluate(players))
+    cross_evaluation_results = asyncio.run(cross_evaluate(players, pool, rule, cache))
     print("Evaluations Complete")
 
     table = [["-"] + [p.username for p in players]]
@@ -143,6 +166,11 @@ def evalute_againts_bots(players: List[Player]):
     print(tabulate(data, headers=headers, floatfmt=".2f"))
 
     print("Rankings")
+    if ratings is not None:
+        ratings.save()
+        if rank_by_rating:
+            return ratings.rank_players(players, top_k=len(players))
+
     top_players = rank_players_by_victories(
         cross_evaluation_results, top_k=len(cross_evaluation_results)
     )
@@ -163,9 +191,63 @@ def assign_marks(rank: int) -> float:
 
 
 def main():
-    generic_bots = gather_bots()
-
-    players = gather_players()
+    options = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    servers = parse_servers([arg for arg in sys.argv[1:] if arg not in options])
+    pool = ServerPool(servers) if servers else None
+    rule = SPRT() if "--adaptive" in options else None
+    cache = None
+    if "--no-cache" not in options:
+        cache = ResultsCache(
+            os.path.join(os.path.dirname(__file__), "results", "cross_eval_cache.json")
+        )
+
+    profiler = None
+    if "--profile" in options:
+        profiler = DecisionProfiler(
+            os.path.join(os.path.dirname(__file__), "results", "profile")
+        )
+
+    retention = parse_retention(options)
+
+    if pool is not None:
+        generic_bots = pool.replicate(
+            gather_bots, profiler=profiler, retention=retention
+        )
+
+        players = pool.replicate(
+            gather_players, profiler=profiler, retention=retention
+        )
+    else:
+        generic_bots = gather_bots(profiler, retention)
+
+        players = gather_players(profiler, retention)
+
+    replays = None
+    if "--html-replays" not in options:
+        replays = ReplaySink(os.path.join(os.path.dirname(__file__), "replays"))
+        for agent in players + generic_bots:
+            for replica in pool.replicas(agent) if pool is not None else [agent]:
+                replays.attach(replica)
+
+    dataset = None
+    if "--dataset" in options:
+        dataset = DatasetRecorder(
+            os.path.join(os.path.dirname(__file__), "results", "dataset")
+        )
+        for agent in players + generic_bots:
+            for replica in pool.replicas(agent) if pool is not None else [agent]:
+                dataset.attach(replica)
+
+    skip_stable = "--skip-stable" in options
+    rank_by_rating = skip_stable or "--rank-by-rating" in options
+    ratings = None
+    if "--no-ratings" not in options:
+        ratings = RatingBook(
+            os.path.join(os.path.dirname(__file__), "results", "ratings.json")
+        )
+        for agent in players + generic_bots:
+            for replica in pool.replicas(agent) if pool is not None else [agent]:
+                ratings.attach(replica)
 
     results_file = os.path.join(
         os.path.dirname(__file__), "results", "marking_results.txt"
@@ -182,15 +264,19 @@ def main():
         agents.append(player)
         agents.extend(generic_bots)
 
-        agent_rankings = evalute_againts_bots(agents)
+        agent_rankings = evalute_againts_bots(
+            agents, pool, rule, cache, ratings, rank_by_rating, skip_stable
+        )
+        by_rating = ratings is not None and rank_by_rating
 
         player_rank = len(agents) + 1
         player_mark = 0.0
-        print("Rank. Player - Win Rate - Mark")
-        for rank, (agent, winrate) in enumerate(agent_rankings, 1):
+        print(f"Rank. Player - {'Rating' if by_rating else 'Win Rate'} - Mark")
+        for rank, (agent, score) in enumerate(agent_rankings, 1):
             mark = assign_marks(rank)
+            shown = f"{score:.0f}" if by_rating else f"{score:.2f}"
 
-            print(f"{rank}. {agent} - {winrate:.2f} - {mark}")
+            print(f"{rank}. {agent} - {shown} - {mark}")
             if agent == player.username:
                 player_rank = rank
                 player_mark = mark
@@ -200,6 +286,27 @@ def main():
         with open(results_file, "a", encoding="utf-8") as file:
             file.write(f"{player.username} #{player_rank} {player_mark}\n")
 
+    if pool is not None:
+        print(pool.summary())
+    if rule is not None:
+        print(rule.summary())
+    if cache is not None:
+        print(cache.summary())
+    if ratings is not None:
+        ratings.save()
+        print(ratings.summary())
+    print(retention.summary())
+    if replays is not None:
+        replays.close()
+        print(replays.summary())
+    if dataset is not None:
+        dataset.close()
+        print(dataset.summary())
+    if profiler is not None:
+        profiler.stop()
+        for path in profiler.export():
+            print(f"Decision profile written to {path}")
+
 
 if __name__ == "__main__":
     main()
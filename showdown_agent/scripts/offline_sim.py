@@ -0,0 +1,1183 @@
+# python offline_sim.py [n_challenges]
+#
+# Plays simplified gen 9 singles battles in-process so agents can be evaluated
+# without `node pokemon-showdown start` or a websocket. The engine writes the same
+# protocol messages and requests a Showdown server would send and feeds them
+# straight into each poke_env Player, which answers through its usual
+# choose_move/teampreview code path.
+#
+# Only the moves, items and abilities used by our teams are modelled in detail;
+# any other move falls back to its base power, accuracy and the generic effects
+# in the move data (boosts, status, healing, recoil, drain, hazards, switching).
+
+
+import asyncio
+import functools
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from poke_env.concurrency import handle_threaded_coroutines
+from poke_env.data import GenData
+from poke_env.data.normalize import to_id_str
+from poke_env.player.player import Player
+from poke_env.stats import compute_raw_stats
+from poke_env.teambuilder import Teambuilder
+from tabulate import tabulate
+
+STATS = ("hp", "atk", "def", "spa", "spd", "spe")
+BOOSTABLE = ("atk", "def", "spa", "spd", "spe", "accuracy", "evasion")
+MAX_TURNS = 1000
+
+TYPE_ITEMS = {
+    "dracoplate": "Dragon",
+    "dreadplate": "Dark",
+    "earthplate": "Ground",
+    "fistplate": "Fighting",
+    "flameplate": "Fire",
+    "icicleplate": "Ice",
+    "insectplate": "Bug",
+    "ironplate": "Steel",
+    "meadowplate": "Grass",
+    "mindplate": "Psychic",
+    "pixieplate": "Fairy",
+    "skyplate": "Flying",
+    "splashplate": "Water",
+    "spookyplate": "Ghost",
+    "stoneplate": "Rock",
+    "toxicplate": "Poison",
+    "zapplate": "Electric",
+}
+OGERPON_MASKS = {
+    "wellspringmask": "Water",
+    "hearthflamemask": "Fire",
+    "cornerstonemask": "Rock",
+}
+CHOICE_ITEMS = {"choiceband": "atk", "choicespecs": "spa", "choicescarf": "spe"}
+
+# 35% / 35% / 15% / 15% for 2 to 5 hits
+MULTIHIT_ROLLS = (2,) * 7 + (3,) * 7 + (4,) * 3 + (5,) * 3
+CRIT_CHANCES = {1: 1 / 24, 2: 1 / 8, 3: 1 / 2}
+SPIKES_DAMAGE = {1: 1 / 8, 2: 1 / 6, 3: 1 / 4}
+
+_battle_ids = itertools.count(1)
+
+
+def stage_multiplier(stage: int) -> float:
+    return (2 + stage) / 2 if stage >= 0 else 2 / (2 - stage)
+
+
+def accuracy_multiplier(stage: int) -> float:
+    return (3 + stage) / 3 if stage >= 0 else 3 / (3 - stage)
+
+
+class SimPokemon:
+    def __init__(self, role: str, team_mon, gen_data: GenData):
+        species_id = to_id_str(team_mon.species or team_mon.nickname)
+        entry = gen_data.pokedex[species_id]
+
+        self.role = role
+        self.species = entry["name"]
+        self.name = team_mon.nickname or self.species
+        self.level = team_mon.level or 100
+        self.gender = team_mon.gender or ""
+        self.base_types = list(entry["types"])
+        self.weight = entry.get("weightkg", 50)
+        self.stats = dict(
+            zip(
+                STATS,
+                compute_raw_stats(
+                    species_id,
+                    team_mon.evs,
+                    team_mon.ivs,
+                    self.level,
+                    (team_mon.nature or "serious").lower(),
+                    gen_data,
+                ),
+            )
+        )
+        self.max_hp = self.hp = self.stats["hp"]
+        self.item = to_id_str(team_mon.item or "")
+        self.ability = to_id_str(team_mon.ability or entry["abilities"]["0"])
+        self.moves = [
+            [to_id_str(m), gen_data.moves[to_id_str(m)]["pp"] * 8 // 5]
+            for m in team_mon.moves
+            if to_id_str(m) in gen_data.moves
+        ]
+        self.max_pp = {move_id: pp for move_id, pp in self.moves}
+        self.tera_type = (team_mon.tera_type or self.base_types[0]).capitalize()
+        self.terastallized = False
+
+        self.status = ""
+        self.sleep_turns = 0
+        self.toxic_turns = 0
+        self.fainted = False
+        self.entered = False
+        self.reset_volatiles()
+
+    def reset_volatiles(self):
+        self.boosts = dict.fromkeys(BOOSTABLE, 0)
+        self.choice_lock: Optional[str] = None
+        self.charging: Optional[str] = None
+        self.taunt = 0
+        self.salt_cure = False
+        self.protect_streak = 0
+        self.protected = False
+        self.flinched = False
+
+    @property
+    def ident(self) -> str:
+        return f"{self.role}a: {self.name}"
+
+    @property
+    def types(self) -> List[str]:
+        return [self.tera_type] if self.terastallized else self.base_types
+
+    @property
+    def details(self) -> str:
+        details = self.species
+        if self.level != 100:
+            details += f", L{self.level}"
+        if self.gender:
+            details += f", {self.gender}"
+        if self.terastallized:
+            details += f", tera:{self.tera_type}"
+        return details
+
+    def condition(self, exact: bool) -> str:
+        if self.fainted:
+            return "0 fnt"
+        if exact:
+            hp = f"{self.hp}/{self.max_hp}"
+        else:
+            hp = f"{max(1, math.ceil(100 * self.hp / self.max_hp))}/100"
+        return f"{hp} {self.status}" if self.status else hp
+
+    def stat(self, name: str, sun: bool = False, crit_attack: bool = False, crit_defense: bool = False) -> float:
+        stage = self.boosts[name]
+        if crit_attack:
+            stage = max(stage, 0)
+        if crit_defense:
+            stage = min(stage, 0)
+        value = self.stats[name] * stage_multiplier(stage)
+
+        if CHOICE_ITEMS.get(self.item) == name:
+            value *= 1.5
+        if name == "spd" and self.item == "assaultvest":
+            value *= 1.5
+        if name == "spe" and self.status == "par":
+            value *= 0.5
+        if name == "atk" and self.ability == "orichalcumpulse" and sun:
+            value *= 5461 / 4096
+        return value
+
+    def move_ids(self) -> List[str]:
+        return [move_id for move_id, _ in self.moves]
+
+
+class SimSide:
+    def __init__(self, role: str, player: Player, gen_data: GenData):
+        if player.next_team is None:
+            raise ValueError(f"{player.username} has no team; offline battles need a fixed team")
+
+        self.role = role
+        self.player = player
+        self.username = player.username
+        self.team = [
+            SimPokemon(role, mon, gen_data)
+            for mon in Teambuilder.parse_packed_team(player.next_team)
+        ]
+        self.conditions: Dict[str, int] = {}
+        self.used_tera = False
+        self.choice: Optional[str] = None
+        self.future_sight: Optional[Tuple[int, float, int]] = None
+
+    @property
+    def active(self) -> SimPokemon:
+        return self.team[0]
+
+    @property
+    def side_ident(self) -> str:
+        return f"{self.role}: {self.username}"
+
+    def bench(self) -> List[int]:
+        return [i for i, mon in enumerate(self.team) if i and not mon.fainted]
+
+    def defeated(self) -> bool:
+        return all(mon.fainted for mon in self.team)
+
+    def fainted_allies(self) -> int:
+        return sum(1 for mon in self.team if mon.fainted)
+
+
+class OfflineBattle:
+    """One battle between two players, driven turn by turn through their battle handlers."""
+
+    def __init__(self, battle_format: str, p1: Player, p2: Player, rng: random.Random):
+        self.battle_format = battle_format
+        self.battle_tag = f"battle-{battle_format}-{next(_battle_ids)}"
+        self.gen_data = GenData.from_format(battle_format)
+        self.rng = rng
+        self.sides = (SimSide("p1", p1, self.gen_data), SimSide("p2", p2, self.gen_data))
+        self.turn = 0
+        self.sun_turns = 0
+        self.rqid = 0
+        self.forfeited: Optional[SimSide] = None
+        self._log: List[list] = []
+        self._actions: Dict[str, tuple] = {}
+        # The pokemon of each side that still has to carry out its chosen move this turn
+        self._movers: Dict[str, Optional[SimPokemon]] = {}
+
+    async def play(self) -> Optional[str]:
+        """Plays the battle to the end and returns the winner's username, or None on a tie."""
+        p1, p2 = self.sides
+        self._add("init", "battle")
+        self._add("title", f"{p1.username} vs. {p2.username}")
+        for side in self.sides:
+            self._add("player", side.role, side.username, "1", "")
+        for side in self.sides:
+            self._add("teamsize", side.role, str(len(side.team)))
+        self._add("gen", str(self.gen_data.gen))
+        self._add("tier", self.battle_format)
+        self._add("clearpoke")
+        for side in self.sides:
+            for mon in side.team:
+                self._add("poke", side.role, mon.details, "")
+        self._add("teampreview")
+
+        choices = await self._exchange({side.role: self._request(side, "preview") for side in self.sides})
+        for side in self.sides:
+            self._apply_team_order(side, choices.get(side.role))
+
+        self._add("start")
+        for side in self._by_speed():
+            self._add("switch", side.active.ident, side.active.details, side.active)
+        for side in self._by_speed():
+            self._on_entry(side)
+
+        winner = None
+        while True:
+            self.turn += 1
+            if self.turn > MAX_TURNS:
+                break
+            self._add("turn", str(self.turn))
+
+            choices = await self._exchange({side.role: self._request(side, "move") for side in self.sides})
+            if self.forfeited is not None:
+                winner = self._other(self.forfeited)
+                break
+            self._actions = {side.role: self._parse_choice(side, choices.get(side.role), "move") for side in self.sides}
+
+            await self._run_turn()
+            winner = await self._replace_fainted()
+            if winner is not None or self._finished():
+                break
+
+        if winner is None and self._finished():
+            winner = self._winner()
+        self._add("", "")
+        if winner is not None:
+            self._add("win", winner.username)
+        else:
+            self._add("tie")
+        await self._exchange({})
+        return winner.username if winner is not None else None
+
+    def receive(self, username: str, message: str):
+        for side in self.sides:
+            if side.username == username and side.choice is None:
+                side.choice = message
+                return
+
+    # Messages and requests
+
+    def _add(self, *parts):
+        # HP is exact for the pokemon's owner and a percentage for everyone else
+        self._log.append(
+            [
+                (part.role, part.condition(True), part.condition(False)) if isinstance(part, SimPokemon) else part
+                for part in ("",) + parts
+            ]
+        )
+
+    def _render(self, line: list, role: str) -> List[str]:
+        return [
+            (part[1] if part[0] == role else part[2]) if isinstance(part, tuple) else part
+            for part in line
+        ]
+
+    async def _exchange(self, requests: Dict[str, dict]) -> Dict[str, str]:
+        """Sends the pending log to both players, plus a request to the ones in ``requests``."""
+        log, self._log = self._log, []
+        deliveries = []
+        for side in self.sides:
+            messages = [[f">{self.battle_tag}"]] + [self._render(line, side.role) for line in log]
+            side.choice = None
+            if side.role in requests:
+                messages.append(["", "request", json.dumps(requests[side.role])])
+            deliveries.append(side.player._handle_battle_message(messages))
+        await asyncio.gather(*deliveries)
+
+        choices = {}
+        for side in self.sides:
+            if side.role in requests:
+                choices[side.role] = side.choice
+                if side.choice is not None and side.choice.strip() == "/forfeit":
+                    self.forfeited = side
+        return choices
+
+    def _request(self, side: SimSide, kind: str) -> dict:
+        self.rqid += 1
+        request: dict = {"side": self._side_request(side), "rqid": self.rqid}
+        if kind == "preview":
+            request["teamPreview"] = True
+            request["maxTeamSize"] = len(side.team)
+        elif kind == "switch":
+            request["forceSwitch"] = [True]
+            request["noCancel"] = True
+        else:
+            active = {"moves": self._move_requests(side.active)}
+            if side.active.charging is not None:
+                active["trapped"] = True
+            elif not side.used_tera:
+                active["canTerastallize"] = side.active.tera_type
+            request["active"] = [active]
+        return request
+
+    def _side_request(self, side: SimSide) -> dict:
+        return {
+            "name": side.username,
+            "id": side.role,
+            "pokemon": [
+                {
+                    "ident": f"{side.role}: {mon.name}",
+                    "details": mon.details,
+                    "condition": mon.condition(True),
+                    "active": i == 0,
+                    "stats": {stat: mon.stats[stat] for stat in STATS[1:]},
+                    "moves": mon.move_ids(),
+                    "baseAbility": mon.ability,
+                    "item": mon.item,
+                    "pokeball": "pokeball",
+                    "ability": mon.ability,
+                    "commanding": False,
+                    "reviving": False,
+                    "teraType": mon.tera_type,
+                    "terastallized": mon.tera_type if mon.terastallized else "",
+                }
+                for i, mon in enumerate(side.team)
+            ],
+        }
+
+    def _move_requests(self, mon: SimPokemon) -> List[dict]:
+        moves = []
+        for move_id, pp in mon.moves:
+            if mon.charging is not None and move_id != mon.charging:
+                continue
+            info = self.gen_data.moves[move_id]
+            moves.append(
+                {
+                    "move": info["name"],
+                    "id": move_id,
+                    "pp": pp,
+                    "maxpp": mon.max_pp[move_id],
+                    "target": info["target"],
+                    "disabled": self._move_disabled(mon, move_id, pp),
+                }
+            )
+        if all(move["disabled"] for move in moves):
+            moves = [{"move": "Struggle", "id": "struggle", "target": "randomNormal", "disabled": False}]
+        return moves
+
+    def _move_disabled(self, mon: SimPokemon, move_id: str, pp: int) -> bool:
+        if pp <= 0:
+            return True
+        if mon.choice_lock is not None and move_id != mon.choice_lock:
+            return True
+        return mon.taunt > 0 and self.gen_data.moves[move_id]["category"] == "Status"
+
+    # Choices
+
+    def _apply_team_order(self, side: SimSide, choice: Optional[str]):
+        if not choice or not choice.startswith("/team"):
+            return
+        order = [int(c) - 1 for c in choice[5:] if c.isdigit()]
+        order = [i for i in dict.fromkeys(order) if 0 <= i < len(side.team)]
+        order += [i for i in range(len(side.team)) if i not in order]
+        side.team = [side.team[i] for i in order]
+
+    def _parse_choice(self, side: SimSide, choice: Optional[str], kind: str) -> tuple:
+        """Turns a ``/choose`` message into ("move", move id, tera) or ("switch", team slot)."""
+        body = (choice or "").strip()
+        body = body[len("/choose "):].strip() if body.startswith("/choose ") else ""
+        action = None
+
+        if body.startswith("move ") and kind == "move":
+            tokens = body[5:].split()
+            usable = [m["id"] for m in self._move_requests(side.active) if not m["disabled"]]
+            if tokens and tokens[0].isdigit():
+                slot = int(tokens[0]) - 1
+                options = [m["id"] for m in self._move_requests(side.active)]
+                move_id = options[slot] if 0 <= slot < len(options) else None
+            else:
+                move_id = to_id_str(tokens[0]) if tokens else None
+            if move_id in usable:
+                tera = "terastallize" in tokens[1:] and not side.used_tera and side.active.charging is None
+                action = ("move", move_id, tera)
+        elif body.startswith("switch ") and (kind == "switch" or side.active.charging is None):
+            token = body[7:].strip()
+            bench = side.bench()
+            if token.isdigit():
+                slot = int(token) - 1
+                action = ("switch", slot) if slot in bench else None
+            else:
+                for slot in bench:
+                    mon = side.team[slot]
+                    if to_id_str(token) in (to_id_str(mon.name), to_id_str(mon.species)):
+                        action = ("switch", slot)
+                        break
+
+        if action is None:
+            if body and body != "default":
+                side.player.logger.warning(
+                    "Offline battle %s turn %d: invalid %s choice %r", self.battle_tag, self.turn, kind, choice
+                )
+            action = self._default_action(side, kind)
+        return action
+
+    def _default_action(self, side: SimSide, kind: str) -> tuple:
+        if kind == "switch":
+            return ("switch", side.bench()[0])
+        usable = [m["id"] for m in self._move_requests(side.active) if not m["disabled"]]
+        return ("move", usable[0], False)
+
+    # Turn resolution
+
+    async def _run_turn(self):
+        switching = [side for side in self._by_speed() if self._actions[side.role][0] == "switch"]
+        for side in switching:
+            self._switch(side, self._actions[side.role][1])
+
+        moving = [side for side in self.sides if self._actions[side.role][0] == "move"]
+        for side in moving:
+            if self._actions[side.role][2]:
+                side.active.terastallized = True
+                side.used_tera = True
+                self._add("-terastallize", side.active.ident, side.active.tera_type)
+
+        self._movers = {side.role: side.active for side in moving}
+        moving.sort(key=self._move_order, reverse=True)
+        for side in moving:
+            user = side.active
+            # Fainted or forced out before its turn
+            if user is not self._movers[side.role] or user.fainted or self._finished():
+                continue
+            self._movers[side.role] = None
+            await self._use_move(side, self._actions[side.role][1])
+        self._movers = {}
+
+        if not self._finished():
+            self._end_of_turn()
+
+    def _move_order(self, side: SimSide) -> Tuple[int, float, float]:
+        move_id = self._actions[side.role][1]
+        priority = self.gen_data.moves[move_id]["priority"]
+        return priority, side.active.stat("spe"), self.rng.random()
+
+    def _by_speed(self) -> List[SimSide]:
+        return sorted(self.sides, key=lambda side: (side.active.stat("spe"), self.rng.random()), reverse=True)
+
+    async def _replace_fainted(self) -> Optional[SimSide]:
+        while True:
+            if self._finished():
+                return self._winner()
+            needing = [side for side in self.sides if side.active.fainted]
+            if not needing:
+                return None
+            choices = await self._exchange({side.role: self._request(side, "switch") for side in needing})
+            if self.forfeited is not None:
+                return self._other(self.forfeited)
+            for side in needing:
+                self._switch(side, self._parse_choice(side, choices.get(side.role), "switch")[1], announce=False)
+            for side in needing:
+                self._add("switch", side.active.ident, side.active.details, side.active)
+            for side in needing:
+                self._on_entry(side)
+
+    def _switch(self, side: SimSide, slot: int, announce: bool = True, kind: str = "switch"):
+        outgoing = side.active
+        if not outgoing.fainted and outgoing.ability == "regenerator":
+            outgoing.hp = min(outgoing.max_hp, outgoing.hp + outgoing.max_hp // 3)
+        outgoing.reset_volatiles()
+        outgoing.toxic_turns = 0
+
+        side.team[0], side.team[slot] = side.team[slot], side.team[0]
+        if announce:
+            self._add(kind, side.active.ident, side.active.details, side.active)
+            self._on_entry(side)
+
+    def _on_entry(self, side: SimSide):
+        mon = side.active
+        foe = self._other(side).active
+
+        if mon.item != "heavydutyboots":
+            if "stealthrock" in side.conditions:
+                fraction = self._effectiveness("Rock", mon) / 8
+                self._damage(mon, max(1, int(mon.max_hp * fraction)), "[from] Stealth Rock")
+            layers = side.conditions.get("spikes", 0)
+            if layers and self._grounded(mon) and not mon.fainted:
+                self._damage(mon, max(1, int(mon.max_hp * SPIKES_DAMAGE[layers])), "[from] Spikes")
+        if mon.fainted:
+            return
+
+        if mon.ability == "intimidate" and not foe.fainted:
+            self._add("-ability", mon.ident, "Intimidate", "boost")
+            if foe.ability in ("clearbody", "innerfocus"):
+                self._add("-fail", foe.ident, "unboost", f"[from] ability: {foe.ability}", f"[of] {foe.ident}")
+            else:
+                self._boost(foe, {"atk": -1}, by_foe=True)
+        elif mon.ability == "intrepidsword" and not mon.entered:
+            self._add("-ability", mon.ident, "Intrepid Sword", "boost")
+            self._boost(mon, {"atk": 1})
+        elif mon.ability == "orichalcumpulse" and not self.sun_turns:
+            self.sun_turns = 5
+            self._add("-weather", "SunnyDay", "[from] ability: Orichalcum Pulse", f"[of] {mon.ident}")
+        mon.entered = True
+
+    async def _use_move(self, side: SimSide, move_id: str):
+        user = side.active
+        foe_side = self._other(side)
+        info = self.gen_data.moves[move_id]
+
+        if not self._can_move(user, info):
+            return
+        if move_id == "sleeptalk" and user.status == "slp":
+            self._deduct_pp(user, move_id, foe_side.active)
+            self._add("move", user.ident, info["name"], user.ident)
+            options = [m for m in user.move_ids() if m != "sleeptalk" and "charge" not in self.gen_data.moves[m]["flags"]]
+            if options:
+                called = self.rng.choice(options)
+                await self._execute(side, called, self.gen_data.moves[called], f"[from] move: {info['name']}")
+            return
+        if user.status == "slp":
+            self._add("cant", user.ident, "slp")
+            return
+
+        if user.charging is None:
+            self._deduct_pp(user, move_id, foe_side.active)
+        if user.item in CHOICE_ITEMS and move_id in user.move_ids():
+            user.choice_lock = move_id
+        await self._execute(side, move_id, info)
+
+    def _can_move(self, user: SimPokemon, info: dict) -> bool:
+        if user.status == "slp":
+            if user.sleep_turns > 0:
+                user.sleep_turns -= 1
+                return True
+            user.status = ""
+            self._add("-curestatus", user.ident, "slp", "[msg]")
+        if user.status == "frz":
+            if self.rng.random() < 0.2:
+                user.status = ""
+                self._add("-curestatus", user.ident, "frz", "[msg]")
+            else:
+                self._add("cant", user.ident, "frz")
+                return False
+        if user.flinched:
+            self._add("cant", user.ident, "flinch")
+            return False
+        if user.status == "par" and self.rng.random() < 0.25:
+            self._add("cant", user.ident, "par")
+            return False
+        if user.taunt and info["category"] == "Status":
+            self._add("cant", user.ident, "move: Taunt", info["name"])
+            return False
+        return True
+
+    def _deduct_pp(self, user: SimPokemon, move_id: str, foe: SimPokemon):
+        for slot in user.moves:
+            if slot[0] == move_id:
+                slot[1] = max(0, slot[1] - (2 if foe.ability == "pressure" and not foe.fainted else 1))
+
+    async def _execute(self, side: SimSide, move_id: str, info: dict, source: str = ""):
+        user = side.active
+        foe_side = self._other(side)
+        target = foe_side.active
+        targets_foe = info["target"] not in ("self", "allies", "allySide", "allyTeam", "foeSide", "all")
+        shown_target = target if targets_foe or info["target"] == "foeSide" else user
+
+        line = ["move", user.ident, info["name"], shown_target.ident]
+        if source:
+            line.append(source)
+
+        # Two-turn moves charge first unless a Power Herb skips the wait
+        if "charge" in info["flags"] and user.charging is None:
+            self._add(*line[:3])
+            self._add("-prepare", user.ident, info["name"])
+            if move_id == "meteorbeam":
+                self._boost(user, {"spa": 1})
+            if user.item != "powerherb":
+                user.charging = move_id
+                return
+            self._add("-enditem", user.ident, "Power Herb", "[consumed]")
+            user.item = ""
+            line = ["move", user.ident, info["name"], target.ident]
+        user.charging = None
+
+        if targets_foe and target.fainted:
+            self._add(*line, "[notarget]")
+            self._add("-fail", user.ident)
+            return
+        if targets_foe and target.protected and info["flags"].get("protect"):
+            self._add(*line)
+            self._add("-activate", target.ident, "move: Protect")
+            return
+        if move_id == "suckerpunch" and not self._foe_attacking(foe_side):
+            self._add(*line)
+            self._add("-fail", user.ident)
+            return
+
+        if targets_foe and info["accuracy"] is not True and info["target"] != "self":
+            accuracy = info["accuracy"] * accuracy_multiplier(user.boosts["accuracy"] - target.boosts["evasion"])
+            if self.rng.random() * 100 >= accuracy:
+                self._add(*line, "[miss]")
+                self._add("-miss", user.ident, target.ident)
+                return
+
+        self._add(*line)
+        if info["category"] == "Status":
+            self._status_move(side, move_id, info)
+        else:
+            await self._damaging_move(side, move_id, info)
+
+    def _foe_attacking(self, foe_side: SimSide) -> bool:
+        if self._movers.get(foe_side.role) is not foe_side.active:
+            return False
+        return self.gen_data.moves[self._actions[foe_side.role][1]]["category"] != "Status"
+
+    def _status_move(self, side: SimSide, move_id: str, info: dict):
+        user = side.active
+        foe_side = self._other(side)
+        target = foe_side.active
+
+        if info.get("stallingMove"):
+            if self.rng.random() < 1 / 3 ** user.protect_streak:
+                user.protected = True
+                user.protect_streak += 1
+                self._add("-singleturn", user.ident, info["name"])
+            else:
+                user.protect_streak = 0
+                self._add("-fail", user.ident)
+            return
+
+        if move_id == "rest":
+            if user.hp == user.max_hp or user.status == "slp":
+                self._add("-fail", user.ident)
+                return
+            user.status, user.sleep_turns = "slp", 2
+            self._add("-status", user.ident, "slp", "[from] move: Rest")
+            user.hp = user.max_hp
+            self._add("-heal", user.ident, user, "[silent]")
+            return
+        if move_id == "painsplit":
+            average = (user.hp + target.hp) // 2
+            user.hp, target.hp = min(user.max_hp, average), min(target.max_hp, average)
+            self._add("-sethp", target.ident, target, "[from] move: Pain Split", "[silent]")
+            self._add("-sethp", user.ident, user, "[from] move: Pain Split")
+            return
+        if move_id == "trick":
+            if not user.item and not target.item:
+                self._add("-fail", user.ident)
+                return
+            user.item, target.item = target.item, user.item
+            user.choice_lock = target.choice_lock = None
+            self._add("-activate", user.ident, "move: Trick", f"[of] {target.ident}")
+            if user.item:
+                self._add("-item", user.ident, user.item, "[from] move: Trick")
+            if target.item:
+                self._add("-item", target.ident, target.item, "[from] move: Trick")
+            return
+        if move_id == "futuresight":
+            if foe_side.future_sight is not None:
+                self._add("-fail", user.ident)
+                return
+            foe_side.future_sight = (self.turn + 2, user.stat("spa"), user.level)
+            self._add("-start", user.ident, "move: Future Sight")
+            return
+
+        if info.get("heal") or move_id in ("synthesis", "moonlight", "morningsun"):
+            fraction = info["heal"][0] / info["heal"][1] if info.get("heal") else (2 / 3 if self.sun_turns else 1 / 2)
+            if user.hp == user.max_hp:
+                self._add("-fail", user.ident)
+            else:
+                self._heal(user, max(1, int(user.max_hp * fraction)))
+            if move_id == "junglehealing" and user.status:
+                self._add("-curestatus", user.ident, user.status, "[msg]")
+                user.status = ""
+            return
+
+        if info.get("sideCondition") in ("spikes", "stealthrock", "toxicspikes"):
+            condition = info["sideCondition"]
+            layers = foe_side.conditions.get(condition, 0)
+            limit = {"spikes": 3, "toxicspikes": 2}.get(condition, 1)
+            if layers >= limit:
+                self._add("-fail", user.ident)
+                return
+            foe_side.conditions[condition] = layers + 1
+            label = "Spikes" if condition == "spikes" else f"move: {info['name']}"
+            self._add("-sidestart", foe_side.side_ident, label)
+            return
+
+        if info.get("volatileStatus") == "taunt":
+            if target.taunt:
+                self._add("-fail", target.ident)
+                return
+            target.taunt = 3
+            self._add("-start", target.ident, "move: Taunt")
+            return
+
+        if info.get("forceSwitch"):
+            bench = foe_side.bench()
+            if not bench:
+                self._add("-fail", user.ident)
+                return
+            self._switch(foe_side, self.rng.choice(bench), kind="drag")
+            return
+
+        if info.get("status"):
+            if info["type"] == "Electric" and self._effectiveness("Electric", target) == 0:
+                self._add("-immune", target.ident)
+            elif not self._set_status(target, info["status"]):
+                self._add("-fail", target.ident)
+            return
+
+        if info.get("boosts"):
+            if info["target"] in ("self", "allySide", "allies"):
+                self._boost(user, info["boosts"])
+            else:
+                self._boost(target, info["boosts"], by_foe=True)
+            return
+
+        self._add("-fail", user.ident)
+
+    async def _damaging_move(self, side: SimSide, move_id: str, info: dict):
+        user = side.active
+        foe_side = self._other(side)
+        target = foe_side.active
+        move_type = self._move_type(user, move_id, info)
+        contact = bool(info["flags"].get("contact"))
+
+        effectiveness = self._effectiveness(move_type, target)
+        if move_type == "Ground" and info["target"] != "self" and not self._grounded(target):
+            effectiveness = 0.0
+        if effectiveness == 0 and not info.get("ignoreImmunity"):
+            self._add("-immune", target.ident)
+            return
+        if move_type == "Water" and target.ability == "waterabsorb":
+            if target.hp < target.max_hp:
+                self._heal(target, target.max_hp // 4, "[from] ability: Water Absorb", f"[of] {user.ident}")
+            else:
+                self._add("-immune", target.ident, "[from] ability: Water Absorb")
+            return
+
+        multihit = info.get("multihit")
+        if isinstance(multihit, list):
+            hits = self.rng.choice(MULTIHIT_ROLLS) if multihit == [2, 5] else self.rng.randint(*multihit)
+        else:
+            hits = multihit or 1
+
+        dealt, landed = 0, 0
+        for _ in range(hits):
+            if target.fainted or user.fainted:
+                break
+            crit = self.rng.random() < CRIT_CHANCES.get(info.get("critRatio", 1), 1.0) or bool(info.get("willCrit"))
+            damage = self._calc_damage(user, target, move_id, info, move_type, effectiveness, crit)
+            if target.item == "focussash" and target.hp == target.max_hp and damage >= target.hp:
+                damage = target.hp - 1
+                self._add("-enditem", target.ident, "Focus Sash")
+                target.item = ""
+            if crit:
+                self._add("-crit", target.ident)
+            damage = min(damage, target.hp)
+            self._damage(target, damage)
+            dealt += damage
+            landed += 1
+
+            if contact and not user.fainted:
+                if target.item == "rockyhelmet":
+                    self._damage(user, max(1, user.max_hp // 6), "[from] item: Rocky Helmet", f"[of] {target.ident}")
+                if target.ability == "flamebody" and self.rng.random() < 0.3:
+                    self._set_status(user, "brn")
+                if user.ability == "poisontouch" and not target.fainted and self.rng.random() < 0.3:
+                    self._set_status(target, "psn")
+
+        if effectiveness > 1:
+            self._add("-supereffective", target.ident)
+        elif effectiveness < 1:
+            self._add("-resisted", target.ident)
+        if hits > 1:
+            self._add("-hitcount", target.ident, str(landed))
+
+        if move_id == "knockoff" and target.item and not target.fainted and not self._fixed_item(target):
+            self._add("-enditem", target.ident, target.item, "[from] move: Knock Off", f"[of] {user.ident}")
+            target.item = ""
+
+        if not user.fainted:
+            if info.get("drain") and dealt:
+                self._heal(user, max(1, dealt * info["drain"][0] // info["drain"][1]), "[from] drain", f"[of] {target.ident}")
+            if info.get("recoil") and dealt:
+                self._damage(user, max(1, dealt * info["recoil"][0] // info["recoil"][1]), "[from] Recoil")
+            if info.get("struggleRecoil"):
+                self._damage(user, max(1, user.max_hp // 4), "[from] Recoil")
+            if user.item == "lifeorb" and dealt and not user.fainted:
+                self._damage(user, max(1, user.max_hp // 10), "[from] item: Life Orb")
+
+        if not user.fainted:
+            if info.get("self") and info["self"].get("boosts"):
+                self._boost(user, info["self"]["boosts"])
+            if info.get("selfBoost") and info["selfBoost"].get("boosts"):
+                self._boost(user, info["selfBoost"]["boosts"])
+            if move_id == "rapidspin":
+                for condition, label in (("spikes", "Spikes"), ("stealthrock", "move: Stealth Rock")):
+                    if side.conditions.pop(condition, None):
+                        self._add("-sideend", side.side_ident, label, "[from] move: Rapid Spin", f"[of] {user.ident}")
+        self._secondaries(user, target, info)
+
+        if info.get("forceSwitch") and not target.fainted and foe_side.bench():
+            self._switch(foe_side, self.rng.choice(foe_side.bench()), kind="drag")
+        if info.get("selfSwitch") and not user.fainted and side.bench() and not self._finished():
+            await self._pivot(side)
+
+    def _secondaries(self, user: SimPokemon, target: SimPokemon, info: dict):
+        secondaries = info.get("secondaries") or ([info["secondary"]] if info.get("secondary") else [])
+        for secondary in secondaries:
+            chance = secondary.get("chance", 100) * (2 if user.ability == "serenegrace" else 1)
+            if self.rng.random() * 100 >= chance:
+                continue
+            if secondary.get("self") and secondary["self"].get("boosts") and not user.fainted:
+                self._boost(user, secondary["self"]["boosts"])
+            if target.fainted:
+                continue
+            if secondary.get("status"):
+                self._set_status(target, secondary["status"])
+            if secondary.get("boosts"):
+                self._boost(target, secondary["boosts"], by_foe=True)
+            if secondary.get("volatileStatus") == "flinch" and target.ability != "innerfocus":
+                target.flinched = True
+            elif secondary.get("volatileStatus") == "saltcure" and not target.salt_cure:
+                target.salt_cure = True
+                self._add("-start", target.ident, "Salt Cure")
+
+    async def _pivot(self, side: SimSide):
+        choices = await self._exchange({side.role: self._request(side, "switch")})
+        if self.forfeited is None:
+            self._switch(side, self._parse_choice(side, choices.get(side.role), "switch")[1])
+
+    def _end_of_turn(self):
+        if self.sun_turns:
+            self.sun_turns -= 1
+            if self.sun_turns:
+                self._add("-weather", "SunnyDay", "[upkeep]")
+            else:
+                self._add("-weather", "none")
+
+        for side in self.sides:
+            if side.future_sight is not None and side.future_sight[0] <= self.turn:
+                _, attack, level = side.future_sight
+                side.future_sight = None
+                target = side.active
+                if not target.fainted:
+                    self._add("-end", target.ident, "move: Future Sight")
+                    if self._effectiveness("Psychic", target) > 0:
+                        base = (2 * level // 5 + 2) * 120 * attack / target.stat("spd") // 50 + 2
+                        damage = int(base * self.rng.randint(85, 100) / 100 * self._effectiveness("Psychic", target))
+                        self._damage(target, min(target.hp, max(1, damage)))
+
+        for side in self._by_speed():
+            mon = side.active
+            if mon.fainted:
+                continue
+            if mon.item == "leftovers" and mon.hp < mon.max_hp:
+                self._heal(mon, max(1, mon.max_hp // 16), "[from] item: Leftovers")
+            if mon.salt_cure and not mon.fainted:
+                fraction = 4 if {"Water", "Steel"} & set(mon.types) else 8
+                self._damage(mon, max(1, mon.max_hp // fraction), "[from] Salt Cure")
+            if mon.status == "brn" and not mon.fainted:
+                self._damage(mon, max(1, mon.max_hp // 16), "[from] brn")
+            elif mon.status == "psn" and not mon.fainted:
+                self._damage(mon, max(1, mon.max_hp // 8), "[from] psn")
+            elif mon.status == "tox" and not mon.fainted:
+                mon.toxic_turns = min(15, mon.toxic_turns + 1)
+                self._damage(mon, max(1, mon.max_hp * mon.toxic_turns // 16), "[from] psn")
+            if mon.taunt:
+                mon.taunt -= 1
+                if not mon.taunt:
+                    self._add("-end", mon.ident, "move: Taunt")
+
+        for side in self.sides:
+            mon = side.active
+            if not mon.protected:
+                mon.protect_streak = 0
+            mon.protected = mon.flinched = False
+        self._add("upkeep")
+
+    # Mechanics
+
+    def _calc_damage(
+        self, user: SimPokemon, target: SimPokemon, move_id: str, info: dict, move_type: str,
+        effectiveness: float, crit: bool,
+    ) -> int:
+        sun = self.sun_turns > 0
+        physical = info["category"] == "Physical"
+        if move_id == "bodypress":
+            attack = user.stat("def", sun, crit_attack=crit)
+        else:
+            attack = user.stat("atk" if physical else "spa", sun, crit_attack=crit)
+        defense = target.stat("def" if physical else "spd", sun, crit_defense=crit)
+
+        base = (2 * user.level // 5 + 2) * self._base_power(user, target, move_id, info, move_type) * attack / defense
+        damage = base // 50 + 2
+
+        if sun and move_type == "Fire":
+            damage *= 1.5
+        elif sun and move_type == "Water":
+            damage *= 0.5
+        if crit:
+            damage *= 1.5
+        damage = damage * self.rng.randint(85, 100) / 100
+
+        if user.terastallized and move_type == user.tera_type and move_type in user.base_types:
+            damage *= 2
+        elif move_type in user.types or move_type in user.base_types:
+            damage *= 1.5
+        damage *= effectiveness
+
+        if physical and user.status == "brn" and move_id != "facade":
+            damage *= 0.5
+        if user.item == "lifeorb":
+            damage *= 1.3
+        if target.ability == "multiscale" and target.hp == target.max_hp:
+            damage *= 0.5
+        if target.ability == "purifyingsalt" and move_type == "Ghost":
+            damage *= 0.5
+        return max(1, int(damage))
+
+    def _base_power(self, user: SimPokemon, target: SimPokemon, move_id: str, info: dict, move_type: str) -> float:
+        power = info["basePower"]
+        if move_id == "heavyslam":
+            ratio = user.weight / max(target.weight, 0.1)
+            power = 120 if ratio >= 5 else 100 if ratio >= 4 else 80 if ratio >= 3 else 60 if ratio >= 2 else 40
+        if move_id == "knockoff" and target.item and not self._fixed_item(target):
+            power *= 1.5
+        if TYPE_ITEMS.get(user.item) == move_type or user.item in OGERPON_MASKS:
+            power *= 1.2
+        if user.ability == "supremeoverlord":
+            power *= 1 + 0.1 * min(5, self._side_of(user).fainted_allies())
+        return power
+
+    def _move_type(self, user: SimPokemon, move_id: str, info: dict) -> str:
+        if move_id == "judgment" and user.item in TYPE_ITEMS:
+            return TYPE_ITEMS[user.item]
+        if move_id == "ivycudgel" and user.item in OGERPON_MASKS:
+            return OGERPON_MASKS[user.item]
+        if move_id == "terablast" and user.terastallized:
+            return user.tera_type
+        return info["type"]
+
+    def _effectiveness(self, move_type: str, target: SimPokemon) -> float:
+        chart = self.gen_data.type_chart
+        multiplier = 1.0
+        for defender_type in target.types:
+            multiplier *= chart.get(defender_type.upper(), {}).get(move_type.upper(), 1)
+        return multiplier
+
+    def _grounded(self, mon: SimPokemon) -> bool:
+        return "Flying" not in mon.types and mon.ability != "levitate" and mon.item != "airballoon"
+
+    def _fixed_item(self, mon: SimPokemon) -> bool:
+        # Items that are part of the holder's forme can not be removed
+        return (
+            (mon.item in TYPE_ITEMS and mon.ability == "multitype")
+            or mon.item in OGERPON_MASKS
+            or mon.item == "rustedsword"
+        )
+
+    def _damage(self, mon: SimPokemon, amount: int, *source: str):
+        if mon.fainted:
+            return
+        mon.hp = max(0, mon.hp - amount)
+        if mon.hp == 0:
+            mon.fainted = True
+            mon.status = ""
+            mon.reset_volatiles()
+        self._add("-damage", mon.ident, mon, *source)
+        if mon.fainted:
+            self._add("faint", mon.ident)
+
+    def _heal(self, mon: SimPokemon, amount: int, *source: str):
+        mon.hp = min(mon.max_hp, mon.hp + amount)
+        self._add("-heal", mon.ident, mon, *source)
+
+    def _boost(self, mon: SimPokemon, boosts: Dict[str, int], by_foe: bool = False):
+        for stat, amount in boosts.items():
+            before = mon.boosts[stat]
+            mon.boosts[stat] = max(-6, min(6, before + amount))
+            change = mon.boosts[stat] - before
+            self._add("-boost" if amount > 0 else "-unboost", mon.ident, stat, str(abs(change)))
+            if by_foe and amount < 0 and change and mon.ability == "defiant":
+                self._add("-ability", mon.ident, "Defiant", "boost")
+                self._boost(mon, {"atk": 2})
+
+    def _set_status(self, mon: SimPokemon, status: str) -> bool:
+        immune_types = {
+            "par": {"Electric"},
+            "brn": {"Fire"},
+            "psn": {"Poison", "Steel"},
+            "tox": {"Poison", "Steel"},
+            "frz": {"Ice"},
+        }
+        if mon.fainted or mon.status or immune_types.get(status, set()) & set(mon.types):
+            return False
+        if mon.ability == "purifyingsalt" or (status == "frz" and self.sun_turns):
+            return False
+        mon.status = status
+        mon.sleep_turns = self.rng.randint(1, 3) if status == "slp" else 0
+        mon.toxic_turns = 0
+        self._add("-status", mon.ident, status)
+        return True
+
+    def _side_of(self, mon: SimPokemon) -> SimSide:
+        return self.sides[0] if mon.role == "p1" else self.sides[1]
+
+    def _other(self, side: SimSide) -> SimSide:
+        return self.sides[1] if side is self.sides[0] else self.sides[0]
+
+    def _finished(self) -> bool:
+        return any(side.defeated() for side in self.sides)
+
+    def _winner(self) -> Optional[SimSide]:
+        p1_out, p2_out = (side.defeated() for side in self.sides)
+        if p1_out == p2_out:
+            return None
+        return self.sides[1] if p1_out else self.sides[0]
+
+
+class OfflineServer:
+    """Routes the messages attached players send to the offline battles they are in.
+
+    Attached players save no replays: offline battle tags repeat the server's, so
+    they would overwrite the replays of real games.
+    """
+
+    def __init__(self, battle_format: str = "gen9ubers", seed: Optional[int] = None):
+        self.battle_format = battle_format
+        self._rng = random.Random(seed)
+        self._battles: Dict[str, OfflineBattle] = {}
+        self._senders: Dict[int, object] = {}
+        self._save_replays: Dict[int, object] = {}
+
+    def attach(self, player: Player):
+        if id(player) not in self._senders:
+            self._senders[id(player)] = player.ps_client.send_message
+            player.ps_client.send_message = functools.partial(self._receive, player)
+            self._save_replays[id(player)] = player._save_replays
+            player._save_replays = False
+
+    def detach(self, player: Player):
+        sender = self._senders.pop(id(player), None)
+        if sender is not None:
+            player.ps_client.send_message = sender
+            player._save_replays = self._save_replays.pop(id(player))
+
+    async def _receive(self, player: Player, message: str, room: str = "", message_2: Optional[str] = None):
+        battle = self._battles.get(room)
+        if battle is not None:
+            battle.receive(player.username, message)
+
+    async def play(self, p1: Player, p2: Player) -> Optional[str]:
+        """Plays one battle between attached players and returns the winner's username."""
+        battle = OfflineBattle(self.battle_format, p1, p2, random.Random(self._rng.getrandbits(64)))
+        self._battles[battle.battle_tag] = battle
+        try:
+            return await battle.play()
+        finally:
+            del self._battles[battle.battle_tag]
+
+
+async def battle_against(p1: Player, p2: Player, n_battles: int = 1, seed: Optional[int] = None):
+    """Offline counterpart of ``Player.battle_against``."""
+    await handle_threaded_coroutines(_battle_against(p1, p2, n_battles, seed))
+
+
+async def _battle_against(p1: Player, p2: Player, n_battles: int, seed: Optional[int]):
+    server = OfflineServer(p1.format, seed)
+    server.attach(p1)
+    server.attach(p2)
+    try:
+        for _ in range(n_battles):
+            await server.play(p1, p2)
+    finally:
+        server.detach(p1)
+        server.detach(p2)
+
+
+async def cross_evaluate(
+    players: List[Player], n_challenges: int, seed: Optional[int] = None
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """Offline counterpart of ``poke_env.cross_evaluate``, returning results in the same shape."""
+    return await handle_threaded_coroutines(_cross_evaluate(players, n_challenges, seed))
+
+
+async def _cross_evaluate(
+    players: List[Player], n_challenges: int, seed: Optional[int]
+) -> Dict[str, Dict[str, Optional[float]]]:
+    results: Dict[str, Dict[str, Optional[float]]] = {
+        p1.username: {p2.username: None for p2 in players} for p1 in players
+    }
+    rng = random.Random(seed)
+    for i, p1 in enumerate(players):
+        for j, p2 in enumerate(players):
+            if j <= i:
+                continue
+            await _battle_against(p1, p2, n_challenges, rng.getrandbits(64))
+            results[p1.username][p2.username] = p1.win_rate
+            results[p2.username][p1.username] = p2.win_rate
+            p1.reset_battles()
+            p2.reset_battles()
+    return results
+
+
+def main():
+    from expert_main import gather_bots, gather_players, rank_players_by_victories
+
+    n_challenges = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    generic_bots = gather_bots(start_listening=False)
+    players = gather_players(start_listening=False)
+
+    for player in players:
+        agents = [player] + generic_bots
+        print(f"Evaluating player offline: {player.username}")
+
+        start = time.time()
+        results = asyncio.run(cross_evaluate(agents, n_challenges))
+        elapsed = time.time() - start
+        n_games = n_challenges * len(agents) * (len(agents) - 1) // 2
+        print(f"{n_games} games in {elapsed:.1f}s ({n_games / elapsed:.1f} games/s)")
+
+        headers = ["-"] + [p.username for p in agents]
+        table = [[p_1] + [results[p_1][p_2] for p_2 in row] for p_1, row in results.items()]
+        print(tabulate(table, headers=headers, floatfmt=".2f"))
+
+        print("Rank. Player - Win Rate")
+        for rank, (agent, winrate) in enumerate(rank_players_by_victories(results, top_k=len(results)), 1):
+            print(f"{rank}. {agent} - {winrate:.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,23 @@
-from poke_env.battle import AbstractBattle, Move
-from poke_env.player import Player
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import site
+import sys
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from poke_env.battle import AbstractBattle, Move, SideCondition
+from poke_env.player import BattleOrder, Player
 from poke_env.data import GenData
+from poke_env.data.normalize import to_id_str
 import numpy as np
-from poke_env.teambuilder import Teambuilder
+from poke_env.stats import compute_raw_stats
+from poke_env.teambuilder import ConstantTeambuilder
 
 team = """
 Deoxys-Speed @ Focus Sash  
@@ -69,7 +84,8 @@ Jolly Nature
 - Close Combat  
 """
 
-pokemons = team.strip().split('\n\n')
+# Parsed once, and shared by every agent and battle built from this module
+_TEAMBUILDER = ConstantTeambuilder(team)
 
 
 def _acc_to_pct(acc) -> float:
@@ -83,273 +99,1817 @@ def _acc_to_pct(acc) -> float:
         return 100.0
 
 
-class CustomAgent(Player):
-    def __init__(self, *args, **kwargs):
-        super().__init__(team=team, *args, **kwargs)
+_SETUP_MOVES = frozenset({"swordsdance", "calmmind", "agility"})
+_OPP_SETUP_MOVES = frozenset({"swordsdance", "calmmind", "agility", "recover"})
+
+
+class _MoveEntry(NamedTuple):
+    base_power: float
+    accuracy: float
+    category: str
+    priority: int
+    type_index: int
+
+
+class _LookupCache(dict):
+    """A memo dict that counts how often lookups were served from it."""
+
+    def __init__(self):
+        super().__init__()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+class _FormatTables:
+    """Move and type-chart lookups for one battle format, precompiled from GenData.
+
+    Rows of ``type_matrix`` are attacking types and columns defending types, both
+    indexed through ``type_index``. Moves whose type is not on the chart get a
+    ``type_index`` of -1 and are treated as neutral.
+
+    Type lookups of pokemon and matchups are memoized for every battle in the
+    format, since most turns repeat the same few matchups.
+    """
+
+    def __init__(self, battle_format: str):
+        gen_data = GenData.from_format(battle_format)
+
+        self.battle_format = battle_format
+        self.type_names: List[str] = list(gen_data.type_chart)
+        self.type_index: Dict[str, int] = {
+            name: i for i, name in enumerate(self.type_names)
+        }
+
+        self.type_matrix = np.ones((len(self.type_names), len(self.type_names)))
+        for defender, row in gen_data.type_chart.items():
+            for attacker, multiplier in row.items():
+                self.type_matrix[
+                    self.type_index[attacker], self.type_index[defender]
+                ] = multiplier
+
+        self.moves: Dict[str, _MoveEntry] = {
+            move_id: _MoveEntry(
+                base_power=info.get("basePower", 0),
+                accuracy=_acc_to_pct(info.get("accuracy", True)),
+                category=info.get("category", "Status"),
+                priority=info.get("priority", 0),
+                type_index=self.type_index.get(str(info.get("type", "")).upper(), -1),
+            )
+            for move_id, info in gen_data.moves.items()
+        }
+
+        self._type_cache = _LookupCache()
+        self._stab_cache = _LookupCache()
+        self._effectiveness_cache = _LookupCache()
+
+    def type_indices(self, pokemon) -> Tuple[int, ...]:
+        """Chart indices of a pokemon's current types, tera included.
+
+        Keyed by the current type pair, which poke_env switches to the tera type on
+        terastallization (and to any temporary types), so a terastallized pokemon
+        never reads the entry of its original types.
+        """
+        key = (pokemon.type_1, pokemon.type_2)
+        indices = self._type_cache.get(key)
+        if indices is None:
+            self._type_cache.misses += 1
+            indices = self._type_cache[key] = tuple(
+                self.type_index[t.name] for t in key if t is not None and t.name in self.type_index
+            )
+        else:
+            self._type_cache.hits += 1
+        return indices
+
+    def stab_types(self, pokemon) -> Tuple[int, ...]:
+        """Chart indices of a pokemon's pre-tera types, which only depend on its species."""
+        indices = self._stab_cache.get(pokemon.species)
+        if indices is None:
+            self._stab_cache.misses += 1
+            indices = self._stab_cache[pokemon.species] = tuple(
+                self.type_index[t.name]
+                for t in pokemon.original_types
+                if t is not None and t.name in self.type_index
+            )
+        else:
+            self._stab_cache.hits += 1
+        return indices
+
+    def effectiveness(self, attack_index: int, defender_indices: Tuple[int, ...]) -> float:
+        if attack_index < 0:
+            return 1.0
+        key = (attack_index, defender_indices)
+        multiplier = self._effectiveness_cache.get(key)
+        if multiplier is None:
+            self._effectiveness_cache.misses += 1
+            multiplier = 1.0
+            for defender_index in defender_indices:
+                multiplier *= self.type_matrix[attack_index, defender_index]
+            multiplier = self._effectiveness_cache[key] = float(multiplier)
+        else:
+            self._effectiveness_cache.hits += 1
+        return multiplier
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "types": self._type_cache.stats(),
+            "stab_types": self._stab_cache.stats(),
+            "effectiveness": self._effectiveness_cache.stats(),
+        }
+
+
+_FORMAT_TABLES: Dict[str, _FormatTables] = {}
+
+
+def _get_format_tables(battle_format: str) -> _FormatTables:
+    if battle_format not in _FORMAT_TABLES:
+        _FORMAT_TABLES[battle_format] = _FormatTables(battle_format)
+    return _FORMAT_TABLES[battle_format]
+
+
+_PLATE_TYPES = {
+    "dracoplate": "DRAGON", "dreadplate": "DARK", "earthplate": "GROUND",
+    "fistplate": "FIGHTING", "flameplate": "FIRE", "icicleplate": "ICE",
+    "insectplate": "BUG", "ironplate": "STEEL", "meadowplate": "GRASS",
+    "mindplate": "PSYCHIC", "pixieplate": "FAIRY", "skyplate": "FLYING",
+    "splashplate": "WATER", "spookyplate": "GHOST", "stoneplate": "ROCK",
+    "toxicplate": "POISON", "zapplate": "ELECTRIC",
+}
+
+# Opponent spreads are unknown, so damage ranges span an uninvested target hit by
+# a fully invested attacker down to a fully invested target hit by an uninvested one
+_MAX_INVESTMENT = ([252] * 6, "hardy", 1.1)
+_NO_INVESTMENT = ([0] * 6, "hardy", 1.0)
+
+
+_NO_BOOSTS = {"atk": 0, "def": 0, "spa": 0, "spd": 0, "spe": 0}
+
+
+class _CalcMove(NamedTuple):
+    base_power: int
+    physical: bool
+    type_index: int
+    min_hits: int
+    max_hits: int
+    fixed_damage: int
+
+
+class _Combatant(NamedTuple):
+    """Battle-ready stats of one side of a damage calculation.
+
+    Stats are in [hp, atk, def, spa, spd, spe] order with boosts already applied.
+    ``stab_types`` are the pre-tera types and ``tera_index`` is -1 unless the
+    pokemon has terastallized.
+    """
+
+    stats: Tuple[int, ...]
+    types: Tuple[int, ...]
+    stab_types: Tuple[int, ...]
+    tera_index: int
+    item: str
+    ability: str
+    burned: bool
+    fainted_allies: int
+
+
+def _boosted(stat: int, stage: int) -> int:
+    if stage >= 0:
+        return stat * (2 + stage) // 2
+    return stat * 2 // (2 - stage)
+
+
+class _DamageCalculator:
+    """Gen 9 singles damage ranges from precomputed stat tables.
+
+    Our six sets are parsed from ``team`` and their level 100 stats computed once.
+    Opponent stats come from ``GenData.pokedex`` base stats under the two spread
+    assumptions above, cached per species. Results are percentages of the
+    defender's max HP as a ``(min, max)`` pair covering damage rolls, multi-hit
+    counts and unknown opponent investment.
+    """
+
+    def __init__(self, tables: _FormatTables):
+        self.tables = tables
+        self._gen_data = GenData.from_format(tables.battle_format)
+        self._opponent_stats: Dict[Tuple[str, bool], Tuple[int, ...]] = {}
+
+        self.own_stats: Dict[str, Tuple[int, ...]] = {}
+        self.own_items: Dict[str, str] = {}
+        self.own_abilities: Dict[str, str] = {}
+        for mon in _TEAMBUILDER.team:
+            species = to_id_str(mon.species or mon.nickname)
+            self.own_stats[species] = tuple(
+                compute_raw_stats(
+                    species, mon.evs, mon.ivs, mon.level or 100,
+                    (mon.nature or "hardy").lower(), self._gen_data,
+                )
+            )
+            self.own_items[species] = to_id_str(mon.item or "")
+            self.own_abilities[species] = to_id_str(mon.ability or "")
+
+        self.moves: Dict[str, _CalcMove] = {}
+        for move_id, info in self._gen_data.moves.items():
+            hits = info.get("multihit", 1)
+            min_hits, max_hits = hits if isinstance(hits, list) else (hits, hits)
+            damage = info.get("damage")
+            self.moves[move_id] = _CalcMove(
+                base_power=info.get("basePower", 0),
+                physical=info.get("category") == "Physical",
+                type_index=tables.moves[move_id].type_index,
+                min_hits=min_hits,
+                max_hits=max_hits,
+                fixed_damage=100 if damage == "level" else (damage if isinstance(damage, int) else 0),
+            )
+
+    def species_stats(self, species: str, invested: bool) -> Tuple[int, ...]:
+        key = (species, invested)
+        if key not in self._opponent_stats:
+            evs, nature, multiplier = _MAX_INVESTMENT if invested else _NO_INVESTMENT
+            if species in self._gen_data.pokedex:
+                stats = compute_raw_stats(species, evs, [31] * 6, 100, nature, self._gen_data)
+                stats = [stats[0]] + [int(stat * multiplier) for stat in stats[1:]]
+            else:
+                stats = [300] * 6
+            self._opponent_stats[key] = tuple(stats)
+        return self._opponent_stats[key]
+
+    def combatant(
+        self, pokemon, battle: AbstractBattle, own: bool, invested: bool, boosted: bool = True
+    ) -> _Combatant:
+        """Builds a combatant for ``pokemon``; ``invested`` only matters for opponents."""
+        species = pokemon.species
+        if own and species in self.own_stats:
+            stats = self.own_stats[species]
+            # "" is an item knocked off or used up, not one the request left out
+            if pokemon.item in (None, GenData.UNKNOWN_ITEM):
+                item = self.own_items[species]
+            else:
+                item = to_id_str(pokemon.item)
+            ability = to_id_str(pokemon.ability or "") or self.own_abilities[species]
+        else:
+            stats = self.species_stats(species, invested)
+            item = "" if pokemon.item in (None, GenData.UNKNOWN_ITEM) else to_id_str(pokemon.item)
+            ability = to_id_str(pokemon.ability or "")
+
+        boosts = pokemon.boosts if boosted else _NO_BOOSTS
+        stats = (
+            stats[0],
+            _boosted(stats[1], boosts["atk"]),
+            _boosted(stats[2], boosts["def"]),
+            _boosted(stats[3], boosts["spa"]),
+            _boosted(stats[4], boosts["spd"]),
+            _boosted(stats[5], boosts["spe"]),
+        )
+
+        stab_types = self.tables.stab_types(pokemon)
+        tera_type = pokemon.tera_type if pokemon.is_terastallized else None
+        tera_index = self.tables.type_index.get(tera_type.name, -1) if tera_type else -1
+
+        team = battle.team if own else battle.opponent_team
+        return _Combatant(
+            stats=stats,
+            types=self.tables.type_indices(pokemon),
+            stab_types=stab_types,
+            tera_index=tera_index,
+            item=item,
+            ability=ability,
+            burned=pokemon.status is not None and pokemon.status.name == "BRN",
+            fainted_allies=sum(1 for p in team.values() if p.fainted),
+        )
+
+    def move_type(self, move_id: str, attacker: _Combatant) -> int:
+        if move_id == "judgment" and attacker.item in _PLATE_TYPES:
+            return self.tables.type_index[_PLATE_TYPES[attacker.item]]
+        move = self.moves.get(move_id)
+        return move.type_index if move is not None else -1
+
+    def damage_range(
+        self,
+        move_id: str,
+        attacker: _Combatant,
+        defender: _Combatant,
+        sun: bool = False,
+        rain: bool = False,
+        screens: Tuple[bool, bool] = (False, False),
+    ) -> Tuple[float, float]:
+        """Damage of ``move_id`` as a percentage of the defender's max HP.
+
+        ``screens`` flags Reflect and Light Screen on the defender's side.
+        """
+        move = self.moves.get(move_id)
+        if move is None:
+            return 0.0, 0.0
+        return self.move_damage(
+            move, self.move_type(move_id, attacker), attacker, defender, sun, rain, screens
+        )
+
+    def move_damage(
+        self,
+        move: _CalcMove,
+        type_index: int,
+        attacker: _Combatant,
+        defender: _Combatant,
+        sun: bool = False,
+        rain: bool = False,
+        screens: Tuple[bool, bool] = (False, False),
+    ) -> Tuple[float, float]:
+        """``damage_range`` for a move that may not exist in the move data."""
+        if move.base_power == 0 and move.fixed_damage == 0:
+            return 0.0, 0.0
+
+        effectiveness = self.tables.effectiveness(type_index, defender.types)
+        if effectiveness == 0:
+            return 0.0, 0.0
+        if move.fixed_damage:
+            pct = 100.0 * move.fixed_damage / defender.stats[0]
+            return pct, pct
+
+        base_power = move.base_power
+        if attacker.item in _PLATE_TYPES and type_index == self.tables.type_index[_PLATE_TYPES[attacker.item]]:
+            base_power = base_power * 4915 // 4096
+        if attacker.ability == "supremeoverlord" and attacker.fainted_allies:
+            base_power = base_power * (4096 + 410 * min(attacker.fainted_allies, 5)) // 4096
+
+        if move.physical:
+            attack, defense = attacker.stats[1], defender.stats[2]
+            if attacker.ability == "orichalcumpulse" and sun:
+                attack = attack * 5461 // 4096
+        else:
+            attack, defense = attacker.stats[3], defender.stats[4]
+
+        damage = 42 * base_power * attack // defense // 50 + 2
+
+        fire, water = self.tables.type_index["FIRE"], self.tables.type_index["WATER"]
+        if (sun and type_index == fire) or (rain and type_index == water):
+            damage = damage * 3 // 2
+        elif (sun and type_index == water) or (rain and type_index == fire):
+            damage = damage // 2
+
+        rolls = [damage * 85 // 100, damage]
+        for i, roll in enumerate(rolls):
+            if type_index in attacker.stab_types or type_index == attacker.tera_index:
+                tera_stab = attacker.tera_index == type_index and type_index in attacker.stab_types
+                roll = roll * 2 if tera_stab else roll * 3 // 2
+            roll = int(roll * effectiveness)
+            if attacker.burned and move.physical and attacker.ability != "guts":
+                roll //= 2
+            if screens[0 if move.physical else 1]:
+                roll //= 2
+            if attacker.item == "lifeorb":
+                roll = roll * 5324 // 4096
+            rolls[i] = max(roll, 1)
+
+        max_hp = defender.stats[0]
+        return (
+            100.0 * rolls[0] * move.min_hits / max_hp,
+            100.0 * rolls[1] * move.max_hits / max_hp,
+        )
+
+
+_DAMAGE_CALCULATORS: Dict[str, _DamageCalculator] = {}
+
+
+def _get_damage_calculator(battle_format: str) -> _DamageCalculator:
+    if battle_format not in _DAMAGE_CALCULATORS:
+        _DAMAGE_CALCULATORS[battle_format] = _DamageCalculator(_get_format_tables(battle_format))
+    return _DAMAGE_CALCULATORS[battle_format]
+
+
+# Likely sets of common opponents per format: species -> [weight, moves, item,
+# ability]. Weights are relative usage within a species. A JSON file of the same
+# shape next to this one (ratk825_sets.json) replaces the listed species' sets.
+_EMBEDDED_SETS = {
+    "gen9ubers": {
+        "koraidon": [
+            [4, ["swordsdance", "scaleshot", "flamecharge", "closecombat"], "lifeorb", "orichalcumpulse"],
+            [3, ["flareblitz", "collisioncourse", "uturn", "outrage"], "choicescarf", "orichalcumpulse"],
+            [2, ["swordsdance", "flareblitz", "collisioncourse", "dragonclaw"], "lifeorb", "orichalcumpulse"],
+        ],
+        "miraidon": [
+            [3, ["electrodrift", "dracometeor", "voltswitch", "overheat"], "choicespecs", "hadronengine"],
+            [2, ["electrodrift", "dracometeor", "voltswitch", "overheat"], "choicescarf", "hadronengine"],
+            [1, ["calmmind", "electrodrift", "dracometeor", "overheat"], "lifeorb", "hadronengine"],
+        ],
+        "zaciancrowned": [
+            [4, ["swordsdance", "behemothblade", "closecombat", "wildcharge"], "rustedsword", "intrepidsword"],
+            [3, ["swordsdance", "behemothblade", "playrough", "closecombat"], "rustedsword", "intrepidsword"],
+            [1, ["behemothblade", "playrough", "crunch", "closecombat"], "rustedsword", "intrepidsword"],
+        ],
+        "zamazentacrowned": [
+            [1, ["irondefense", "bodypress", "heavyslam", "crunch"], "rustedshield", "dauntlessshield"],
+        ],
+        "kyogre": [
+            [2, ["waterspout", "originpulse", "icebeam", "thunder"], "choicescarf", "drizzle"],
+            [2, ["waterspout", "originpulse", "icebeam", "thunder"], "choicespecs", "drizzle"],
+        ],
+        "groudon": [
+            [2, ["stealthrock", "precipiceblades", "lavaplume", "dragontail"], "leftovers", "drought"],
+            [1, ["swordsdance", "precipiceblades", "heatcrash", "stealthrock"], "lifeorb", "drought"],
+        ],
+        "eternatus": [
+            [4, ["agility", "meteorbeam", "dynamaxcannon", "fireblast"], "powerherb", "pressure"],
+            [3, ["toxic", "flamethrower", "recover", "dynamaxcannon"], "blacksludge", "pressure"],
+        ],
+        "arceusfairy": [
+            [4, ["calmmind", "judgment", "taunt", "recover"], "pixieplate", "multitype"],
+            [1, ["calmmind", "judgment", "earthpower", "recover"], "pixieplate", "multitype"],
+        ],
+        "arceusground": [
+            [1, ["judgment", "icebeam", "recover", "stealthrock"], "earthplate", "multitype"],
+        ],
+        "kingambit": [
+            [4, ["swordsdance", "kowtowcleave", "ironhead", "suckerpunch"], "dreadplate", "supremeoverlord"],
+            [2, ["swordsdance", "kowtowcleave", "ironhead", "suckerpunch"], "leftovers", "supremeoverlord"],
+        ],
+        "deoxysspeed": [
+            [4, ["thunderwave", "spikes", "taunt", "psychoboost"], "focussash", "pressure"],
+            [1, ["spikes", "taunt", "knockoff", "psychoboost"], "focussash", "pressure"],
+        ],
+        "calyrexshadow": [
+            [2, ["nastyplot", "astralbarrage", "psyshock", "drainingkiss"], "lifeorb", "asonespectrier"],
+            [1, ["astralbarrage", "psyshock", "pollenpuff", "nastyplot"], "choicespecs", "asonespectrier"],
+        ],
+        "calyrexice": [
+            [1, ["trickroom", "glaciallance", "highhorsepower", "closecombat"], "leftovers", "asoneglastrier"],
+        ],
+        "necrozmaduskmane": [
+            [1, ["dragondance", "sunsteelstrike", "earthquake", "morningsun"], "weaknesspolicy", "prismarmor"],
+        ],
+        "hooh": [
+            [1, ["bravebird", "sacredfire", "recover", "earthquake"], "heavydutyboots", "regenerator"],
+        ],
+        "lunala": [
+            [1, ["moongeistbeam", "moonblast", "calmmind", "roost"], "leftovers", "shadowshield"],
+        ],
+    },
+}
+
+# Likelihood of revealing a move, item or ability that a set does not have, which
+# keeps off-table variants from zeroing out every set
+_SET_MISMATCH = 0.05
+# Sets below this posterior are left out of threat estimates
+_SET_CUTOFF = 0.02
+
+
+class _OpponentSet(NamedTuple):
+    weight: float
+    moves: frozenset
+    item: str
+    ability: str
+
+
+_SET_TABLES: Dict[str, Dict[str, List[_OpponentSet]]] = {}
+
+
+def _get_set_table(battle_format: str) -> Dict[str, List[_OpponentSet]]:
+    if battle_format not in _SET_TABLES:
+        sets = dict(_EMBEDDED_SETS.get(battle_format, {}))
+        override = os.path.splitext(os.path.abspath(__file__))[0] + "_sets.json"
+        if os.path.exists(override):
+            with open(override, "r", encoding="utf-8") as file:
+                sets.update(json.load(file).get(battle_format, {}))
+        _SET_TABLES[battle_format] = {
+            to_id_str(species): [
+                _OpponentSet(weight, frozenset(to_id_str(m) for m in moves), to_id_str(item), to_id_str(ability))
+                for weight, moves, item, ability in entries
+            ]
+            for species, entries in sets.items()
+        }
+    return _SET_TABLES[battle_format]
+
+
+class _SetBelief:
+    """Posterior over one opposing pokemon's candidate sets.
+
+    Only events revealed since the last update are applied, each as a single
+    multiplicative likelihood, so an update costs O(new events) and nothing is
+    rescanned on turns where nothing was revealed.
+    """
+
+    __slots__ = ("sets", "probabilities", "moves_seen", "item_seen", "ability_seen")
+
+    def __init__(self, sets: List[_OpponentSet]):
+        total = sum(s.weight for s in sets)
+        self.sets = sets
+        self.probabilities = [s.weight / total for s in sets]
+        self.moves_seen: set = set()
+        self.item_seen = ""
+        self.ability_seen = ""
+
+    def update(self, pokemon):
+        if len(pokemon.moves) != len(self.moves_seen):
+            for move_id in pokemon.moves:
+                if move_id not in self.moves_seen:
+                    self.moves_seen.add(move_id)
+                    self._observe([move_id in s.moves for s in self.sets])
+
+        # None or UNKNOWN_ITEM is unrevealed, "" means the item is gone
+        item = pokemon.item
+        if item and item != GenData.UNKNOWN_ITEM and item != self.item_seen:
+            self.item_seen = item
+            self._observe([s.item == item for s in self.sets])
+
+        ability = pokemon.ability
+        if ability and ability != self.ability_seen:
+            self.ability_seen = ability
+            self._observe([s.ability == ability for s in self.sets])
+
+    def _observe(self, matches: List[bool]):
+        posterior = [p * (1.0 if match else _SET_MISMATCH) for p, match in zip(self.probabilities, matches)]
+        total = sum(posterior)
+        self.probabilities = [p / total for p in posterior]
+
+    def likely_sets(self) -> List[Tuple[float, _OpponentSet]]:
+        return [(p, s) for p, s in zip(self.probabilities, self.sets) if p >= _SET_CUTOFF]
+
+
+class _SetInference:
+    """Set beliefs for the opposing pokemon of every live battle."""
+
+    def __init__(self, battle_format: str):
+        self.table = _get_set_table(battle_format)
+        self._beliefs: Dict[str, Dict[str, _SetBelief]] = {}
+
+    def belief(self, battle: AbstractBattle, pokemon) -> Optional[_SetBelief]:
+        """The updated belief over pokemon's sets, or None for species off the table."""
+        species = to_id_str(pokemon.species)
+        sets = self.table.get(species)
+        if not sets:
+            return None
+        beliefs = self._beliefs.setdefault(battle.battle_tag, {})
+        belief = beliefs.get(species)
+        if belief is None:
+            belief = beliefs[species] = _SetBelief(sets)
+        belief.update(pokemon)
+        return belief
+
+    def forget(self, battle_tag: str):
+        self._beliefs.pop(battle_tag, None)
+
+
+def _screens(side_conditions) -> Tuple[bool, bool]:
+    """Whether physical and special damage into this side is halved."""
+    veil = SideCondition.AURORA_VEIL in side_conditions
+    return (
+        veil or SideCondition.REFLECT in side_conditions,
+        veil or SideCondition.LIGHT_SCREEN in side_conditions,
+    )
+
+
+def _padded_type_indices(tables: _FormatTables, pokemon) -> List[int]:
+    indices = tables.type_indices(pokemon)
+    return list(indices) + [-1] * (2 - len(indices))
+
+
+# Score per % of the opponent's max HP a move is expected to deal, which keeps a
+# typical neutral STAB hit on the same scale as the fixed bonuses below
+_DAMAGE_WEIGHT = 3
+
+# Species-specific move logic, keyed off the active pokemon's species string
+_SPECIES_NONE, _SPECIES_DEOXYS, _SPECIES_KINGAMBIT, _SPECIES_ARCEUS = range(4)
+
+# Mirror match switch-in bonuses, keyed off the switch target's species string
+_SWITCH_NONE, _SWITCH_ARCEUS, _SWITCH_KINGAMBIT, _SWITCH_ZACIAN = range(4)
+
+
+# Column name -> dtype for the per-battle context and the per-action rows. Type
+# columns hold the two padded chart indices of a pokemon; opp_move_types is ragged
+# and padded separately.
+_CONTEXT_COLUMNS = {
+    "turn": int, "mirror": bool, "my_hp": float, "my_hp_raw": float,
+    "opp_hp": float, "opp_status": bool, "sun": bool, "species": int,
+    "predicted": float, "opp_setup": bool, "spikes_ok": bool,
+    "fainted_allies": int, "hazards": bool, "opp_electric": bool,
+    "opp_fairy": bool, "opp_steel": bool, "opp_dragon_fighting_dark": bool,
+    "my_types": int, "opp_types": int, "opp_move_types": object,
+}
+_MOVE_COLUMNS = {
+    "battle": int, "id": str, "known": bool, "base_power": float,
+    "accuracy": float, "status": bool, "priority": int, "type": int,
+    "setup": bool, "min_damage": float, "max_damage": float,
+}
+_SWITCH_COLUMNS = {"battle": int, "hp": float, "types": int, "kind": int}
+_TYPE_COLUMNS = frozenset({"my_types", "opp_types", "types"})
+
+
+def _as_arrays(columns: Dict[str, List], dtypes: Dict) -> Dict[str, np.ndarray]:
+    arrays = {}
+    for name, dtype in dtypes.items():
+        if dtype is object:
+            continue
+        array = np.asarray(columns[name], dtype=dtype)
+        arrays[name] = array.reshape(-1, 2) if name in _TYPE_COLUMNS else array
+    return arrays
+
+
+class _DecisionBatch:
+    """Feature arrays for every candidate action of one or more battles.
+
+    Each battle contributes one entry to the per-battle context columns and one row
+    per available move or switch. Rows point back at their battle through their
+    ``battle`` column, so the scorers work unchanged on a single battle or on many
+    battles stacked together.
+
+    With ``inference``, the opponent's threat is estimated over its likely sets
+    rather than only the moves it has revealed.
+    """
+
+    def __init__(self, tables: _FormatTables, inference: Optional[_SetInference] = None):
+        self.tables = tables
+        self.inference = inference
+        self.calc = _get_damage_calculator(tables.battle_format)
+        self.battles: List[AbstractBattle] = []
+        self.moves: List[Move] = []
+        self.switches: List = []
+
+        self._ctx: Dict[str, List] = {name: [] for name in _CONTEXT_COLUMNS}
+        self._move_rows: Dict[str, List] = {name: [] for name in _MOVE_COLUMNS}
+        self._switch_rows: Dict[str, List] = {name: [] for name in _SWITCH_COLUMNS}
+
+    def add(self, battle: AbstractBattle):
+        tables = self.tables
+        ctx = self._ctx
+        index = len(self.battles)
+        self.battles.append(battle)
 
-    def choose_move(self, battle: AbstractBattle):
-        gen_data = GenData.from_format(battle.format)
         my_pokemon = battle.active_pokemon
         opp_pokemon = battle.opponent_active_pokemon
+        opp_types = [tables.type_names[i] for i in tables.type_indices(opp_pokemon)]
+
+        ctx["turn"].append(battle.turn)
+        ctx["mirror"].append(
+            battle.teampreview_opponent_team is not None
+            and len(battle.teampreview_opponent_team) == 6
+        )
+        ctx["my_hp"].append(my_pokemon.current_hp_fraction or 1.0)
+        ctx["my_hp_raw"].append(my_pokemon.current_hp_fraction or 0)
+        ctx["opp_hp"].append(opp_pokemon.current_hp_fraction or 1.0)
+        ctx["opp_status"].append(bool(getattr(opp_pokemon, "status", None)))
+        weather = [str(w).lower() for w in battle.weather] if getattr(battle, "weather", None) else []
+        sun = any("sun" in w for w in weather)
+        rain = any("rain" in w for w in weather)
+        ctx["sun"].append(sun)
+        ctx["opp_electric"].append("ELECTRIC" in opp_types)
+        ctx["opp_fairy"].append("FAIRY" in opp_types)
+        ctx["opp_steel"].append("STEEL" in opp_types)
+        ctx["opp_dragon_fighting_dark"].append(
+            any(t in {"DRAGON", "FIGHTING", "DARK"} for t in opp_types)
+        )
+        ctx["my_types"].append(_padded_type_indices(tables, my_pokemon))
+        ctx["opp_types"].append(_padded_type_indices(tables, opp_pokemon))
+
+        opp_moves = list(opp_pokemon.moves.values()) if getattr(opp_pokemon, "moves", None) else []
+        ctx["opp_move_types"].append(
+            [tables.type_index.get(mv.type.name, -1) for mv in opp_moves if mv.type]
+        )
+        ctx["opp_setup"].append(any(m.id in _OPP_SETUP_MOVES for m in opp_moves))
+
+        calc = self.calc
+        me = calc.combatant(my_pokemon, battle, own=True, invested=True)
+        opp_bulky = calc.combatant(opp_pokemon, battle, own=False, invested=True)
+        opp_frail = calc.combatant(opp_pokemon, battle, own=False, invested=False)
+
+        # Worst case damage of the opponent's revealed moves, in % of our max HP,
+        # or its expectation over the opponent's likely sets
+        try:
+            my_screens = _screens(battle.side_conditions)
+            revealed = [opp_move.id for opp_move in opp_moves]
+            belief = self.inference.belief(battle, opp_pokemon) if self.inference is not None else None
+            if belief is None:
+                predicted_damage = self._threat(revealed, opp_bulky, me, sun, rain, my_screens)
+            else:
+                predicted_damage = 0.0
+                for probability, opp_set in belief.likely_sets():
+                    # Unrevealed items and abilities are taken from the set
+                    attacker = opp_bulky._replace(
+                        item=opp_bulky.item or opp_set.item, ability=opp_bulky.ability or opp_set.ability
+                    )
+                    moves = opp_set.moves.union(revealed)
+                    predicted_damage += probability * self._threat(moves, attacker, me, sun, rain, my_screens)
+        except Exception:
+            predicted_damage = np.nan
+        ctx["predicted"].append(predicted_damage)
+
+        species = _SPECIES_NONE
+        spikes_ok = False
+        fainted_allies = 0
+        if my_pokemon.species:
+            if "Deoxys-Speed" in my_pokemon.species:
+                species = _SPECIES_DEOXYS
+                try:
+                    spikes_layers = battle.opponent_side_conditions.get("spikes", 0)
+                    remaining_opponents = sum(1 for p in battle.opponent_team.values() if not p.fainted)
+                    spikes_ok = remaining_opponents >= 2 and spikes_layers < 2 and battle.turn <= 8
+                except:
+                    pass
+            elif "Kingambit" in my_pokemon.species:
+                species = _SPECIES_KINGAMBIT
+                fainted_allies = sum(1 for p in battle.team.values() if p.fainted)
+            elif "Arceus-Fairy" in my_pokemon.species:
+                species = _SPECIES_ARCEUS
+        ctx["species"].append(species)
+        ctx["spikes_ok"].append(spikes_ok)
+        ctx["fainted_allies"].append(fainted_allies)
+        ctx["hazards"].append(
+            bool(
+                battle.opponent_side_conditions.get("stealthrock", 0)
+                or battle.opponent_side_conditions.get("spikes", 0)
+            )
+        )
+
+        opp_screens = _screens(battle.opponent_side_conditions)
+        rows = self._move_rows
+        for move in battle.available_moves:
+            entry = tables.moves.get(move.id)
+            self.moves.append(move)
+            rows["battle"].append(index)
+            rows["id"].append(move.id)
+            rows["setup"].append(move.id in _SETUP_MOVES)
+            rows["min_damage"].append(
+                calc.damage_range(move.id, me, opp_bulky, sun, rain, opp_screens)[0]
+            )
+            rows["max_damage"].append(
+                calc.damage_range(move.id, me, opp_frail, sun, rain, opp_screens)[1]
+            )
+            rows["known"].append(entry is not None)
+            if entry is None:
+                entry = _MoveEntry(0, 0.0, "Status", 0, -1)
+            rows["base_power"].append(entry.base_power)
+            rows["accuracy"].append(entry.accuracy)
+            rows["status"].append(entry.category == "Status")
+            rows["priority"].append(entry.priority)
+            # Judgment takes its type from the held plate
+            rows["type"].append(calc.move_type(move.id, me) if entry.type_index >= 0 else -1)
+
+        rows = self._switch_rows
+        for switch in battle.available_switches:
+            self.switches.append(switch)
+            rows["battle"].append(index)
+            rows["hp"].append(
+                switch.current_hp_fraction if switch.current_hp_fraction is not None else 1.0
+            )
+            rows["types"].append(_padded_type_indices(tables, switch))
+            if switch.species == "Arceus-Fairy":
+                rows["kind"].append(_SWITCH_ARCEUS)
+            elif switch.species == "Kingambit":
+                rows["kind"].append(_SWITCH_KINGAMBIT)
+            elif switch.species == "Zacian-Crowned":
+                rows["kind"].append(_SWITCH_ZACIAN)
+            else:
+                rows["kind"].append(_SWITCH_NONE)
+
+    def _threat(self, move_ids, attacker: _Combatant, defender: _Combatant, sun, rain, screens) -> float:
+        threat = 0.0
+        for move_id in move_ids:
+            damage = self.calc.damage_range(move_id, attacker, defender, sun, rain, screens)[1]
+            if damage > threat:
+                threat = damage
+        return threat
+
+    def snapshot(self) -> "_BatchSnapshot":
+        """The numeric part of the batch, detached from the battle objects."""
+        return _BatchSnapshot(
+            battle_format=self.tables.battle_format,
+            context=self._ctx,
+            move_rows=self._move_rows,
+            switch_rows=self._switch_rows,
+        )
+
+    def scores(self) -> np.ndarray:
+        """Scores of every move row followed by every switch row."""
+        return _score_snapshot(self.snapshot())
+
+    def actions(self) -> List:
+        return self.moves + self.switches
+
+    def action_battles(self) -> np.ndarray:
+        return np.concatenate(
+            [
+                np.asarray(self._move_rows["battle"], dtype=int),
+                np.asarray(self._switch_rows["battle"], dtype=int),
+            ]
+        )
+
+
+class _BatchSnapshot(NamedTuple):
+    """Feature columns of a _DecisionBatch, detached from the battle objects."""
+
+    battle_format: str
+    context: Dict[str, List]
+    move_rows: Dict[str, List]
+    switch_rows: Dict[str, List]
+
+
+def _score_snapshot(snapshot: _BatchSnapshot) -> np.ndarray:
+    tables = _get_format_tables(snapshot.battle_format)
+
+    ctx = _as_arrays(snapshot.context, _CONTEXT_COLUMNS)
+    opp_move_types = snapshot.context["opp_move_types"]
+    width = max((len(t) for t in opp_move_types), default=0)
+    ctx["opp_move_types"] = np.full((len(opp_move_types), width), -1, dtype=int)
+    for i, types in enumerate(opp_move_types):
+        ctx["opp_move_types"][i, : len(types)] = types
+
+    return np.concatenate(
+        [
+            _score_moves(tables, ctx, _as_arrays(snapshot.move_rows, _MOVE_COLUMNS)),
+            _score_switches(tables, ctx, _as_arrays(snapshot.switch_rows, _SWITCH_COLUMNS)),
+        ]
+    )
+
+
+def _lookup_effectiveness(type_matrix: np.ndarray, attack: np.ndarray, defend: np.ndarray) -> np.ndarray:
+    """Vectorized chart lookup; index -1 on either side is neutral."""
+    valid = (attack >= 0) & (defend >= 0)
+    return np.where(valid, type_matrix[np.maximum(attack, 0), np.maximum(defend, 0)], 1.0)
+
+
+def _score_moves(tables: _FormatTables, ctx: Dict[str, np.ndarray], rows: Dict[str, np.ndarray]) -> np.ndarray:
+    b = rows["battle"]
+    move_id = rows["id"]
+    move_type = rows["type"]
+    accuracy = rows["accuracy"]
+    status = rows["status"]
+
+    turn = ctx["turn"][b]
+    mirror = ctx["mirror"][b]
+    my_hp = ctx["my_hp"][b]
+    opp_hp = ctx["opp_hp"][b]
+    opp_types = ctx["opp_types"][b]
+    my_types = ctx["my_types"][b]
+    species = ctx["species"][b]
+
+    is_setup = rows["setup"]
+    is_recover = move_id == "recover"
+    is_taunt = move_id == "taunt"
+    is_thunderwave = move_id == "thunderwave"
+    is_suckerpunch = move_id == "suckerpunch"
+
+    # Type effectiveness calculation
+    effectiveness = _lookup_effectiveness(
+        tables.type_matrix, move_type, opp_types[:, 0]
+    ) * _lookup_effectiveness(tables.type_matrix, move_type, opp_types[:, 1])
+
+    blocked = ~rows["known"] | (effectiveness <= 0)
+    # Gate obviously bad moves early
+    blocked |= is_thunderwave & (ctx["opp_status"][b] | ctx["opp_electric"][b])
+    # CRITICAL FIX: Don't use Dynamax Cannon against Fairy types
+    blocked |= (move_id == "dynamaxcannon") & ctx["opp_fairy"][b]
+    # CRITICAL FIX: Don't use Psycho Boost against Steel types
+    blocked |= (move_id == "psychoboost") & ctx["opp_steel"][b]
+
+    score = np.zeros(len(b))
+    base_power = rows["base_power"]
+
+    # STAB calculation
+    stab = (move_type >= 0) & ((move_type == my_types[:, 0]) | (move_type == my_types[:, 1]))
+    base_power = base_power * np.where(stab, 1.5, 1.0)
+
+    # Weather boost
+    base_power = base_power * np.where((move_type == tables.type_index["FIRE"]) & ctx["sun"][b], 1.5, 1.0)
 
-        if my_pokemon is None or opp_pokemon is None:
+    # Mirror match specific logic
+    early = mirror & (turn <= 3)
+    # In mirror matches, prioritize setup and defensive plays early
+    score += (early & is_setup & (my_hp >= 0.7)) * 200
+    score += (early & is_recover & (my_hp <= 0.8)) * 180
+    # Prioritize Taunt to prevent opponent setup
+    score += (mirror & is_taunt & (turn <= 5)) * 160
+    # Speed control with Thunder Wave
+    score += (mirror & is_thunderwave & ~ctx["opp_status"][b]) * 140
+
+    # Setup move logic - more conservative
+    predicted = ctx["predicted"][b]
+    can_setup = is_setup & (my_hp >= np.where(mirror, 0.7, 0.5))
+    # Only setup if we won't be KO'd next turn
+    score += (can_setup & (predicted < my_hp * 100)) * 150
+    score += (can_setup & np.isnan(predicted)) * 100
+
+    # Core damage calculation, in % of the target's max HP with overkill ignored
+    base_power = base_power * effectiveness
+    opp_hp_pct = opp_hp * 100
+    expected_damage = np.minimum((rows["min_damage"] + rows["max_damage"]) / 2, opp_hp_pct)
+    score = score + expected_damage * _DAMAGE_WEIGHT * (accuracy / 100)
+    # Guaranteed knockouts
+    score += ((rows["min_damage"] >= opp_hp_pct) & (rows["min_damage"] > 0)) * 100
+
+    # Status move improvements
+    score += (status & is_recover & (my_hp <= 0.5)) * 200
+    score += (status & is_recover & (my_hp > 0.5) & (my_hp <= 0.8)) * 120
+    # Higher priority early game and against setup threats
+    score += (status & is_taunt & (turn <= 8)) * 130
+    score += (status & is_taunt & ctx["opp_setup"][b]) * 150
+
+    # Species-specific logic improvements
+    score += ((species == _SPECIES_DEOXYS) & (move_id == "spikes") & ctx["spikes_ok"][b]) * 170
+    # Supreme Overlord boost calculation
+    kingambit_moves = (move_id == "suckerpunch") | (move_id == "kowtowcleave") | (move_id == "ironhead")
+    score += ((species == _SPECIES_KINGAMBIT) & kingambit_moves) * (ctx["fainted_allies"][b] * 15)
+    # Extra damage vs Dragons and Fighting types
+    score += ((species == _SPECIES_ARCEUS) & (move_id == "judgment") & ctx["opp_dragon_fighting_dark"][b]) * 80
+
+    # Priority move handling
+    priority = rows["priority"] > 0
+    score += priority * 60
+    # Extra bonus if opponent is low on HP
+    score += (priority & (opp_hp <= 0.3)) * 80
+
+    # Sucker Punch specific logic
+    score += is_suckerpunch * np.where(opp_hp <= 0.4, 100, 40)
+    # Penalty against Fairy types
+    score -= (is_suckerpunch & ctx["opp_fairy"][b]) * 50
+
+    # Accuracy penalties
+    score -= ((accuracy < 85) & ~status) * 60
+
+    # High power move bonus
+    score += ((base_power >= 120) & (effectiveness >= 1)) * 70
+
+    return np.where(blocked, -np.inf, score)
+
+
+def _score_switches(tables: _FormatTables, ctx: Dict[str, np.ndarray], rows: Dict[str, np.ndarray]) -> np.ndarray:
+    b = rows["battle"]
+    types = rows["types"]
+    opp_move_types = ctx["opp_move_types"][b]
+
+    # Check defensive matchup against every revealed opponent move
+    effectiveness = _lookup_effectiveness(
+        tables.type_matrix, opp_move_types, types[:, :1]
+    ) * _lookup_effectiveness(tables.type_matrix, opp_move_types, types[:, 1:])
+    score = np.sum((effectiveness < 0.5) * 100 - (effectiveness > 2) * 120, axis=1)
+
+    # HP consideration
+    hp_frac = rows["hp"]
+    score = score + hp_frac * 100
+
+    # Hazard damage consideration
+    score -= (ctx["hazards"][b] & (hp_frac < 0.7)) * 80
+
+    # Mirror match switching logic
+    opp_types = ctx["opp_dragon_fighting_dark"][b]
+    kind = rows["kind"]
+    mirror = ctx["mirror"][b]
+    score += (mirror & (kind == _SWITCH_ARCEUS) & opp_types) * 120
+    score += (mirror & (kind == _SWITCH_KINGAMBIT) & ctx["opp_fairy"][b]) * 100
+    # Generally strong
+    score += (mirror & (kind == _SWITCH_ZACIAN)) * 80
+
+    # Don't switch if current Pokemon can still be useful
+    score -= (ctx["my_hp_raw"][b] > 0.6) * 50
+
+    return score
+
+
+_WIN_VALUE = 10000.0
+_HP_BUCKET = 5
+# Search actions below this are move slots, from it upwards switches to team slot
+# ``action - _SWITCH_ACTION``
+_SWITCH_ACTION = 10
+# Base power assumed for each STAB type of an opponent that has not revealed moves
+_ASSUMED_BASE_POWER = 90
+
+_EFFECT_NONE, _EFFECT_BOOST, _EFFECT_HEAL, _EFFECT_PARALYZE, _EFFECT_SPIKES, _EFFECT_ROCKS = range(6)
+_STATUS_NONE, _STATUS_PAR, _STATUS_BRN, _STATUS_OTHER = range(4)
+_BOOST_STATS = ("atk", "def", "spa", "spd", "spe")
+_SPIKES_DAMAGE = (0.0, 12.5, 100 / 6, 25.0)
+
+
+class _SearchMove(NamedTuple):
+    """A move as the search plays it.
+
+    ``damage`` holds the expected % of max HP dealt to each opposing team slot
+    before boosts; for paralysis it holds 1.0 for the slots that can be paralysed.
+    """
+
+    damage: Tuple[float, ...]
+    physical: bool
+    accuracy: float
+    priority: int
+    effect: int
+    boosts: Tuple[int, ...]
+    heal: float
+
+
+def _status_code(pokemon) -> int:
+    if pokemon.status is None:
+        return _STATUS_NONE
+    return {"PAR": _STATUS_PAR, "BRN": _STATUS_BRN}.get(pokemon.status.name, _STATUS_OTHER)
+
+
+def _stage_multiplier(stage: int) -> float:
+    return (2 + stage) / 2 if stage >= 0 else 2 / (2 - stage)
+
+
+class _SearchModel:
+    """Simplified two-sided battle that the search plays forward.
+
+    Side 0 is us and side 1 the opponent's revealed pokemon. Damage from every
+    move into every opposing team slot is precomputed with the damage calculator,
+    so a turn is a handful of table lookups. A state is a pair of side tuples
+    ``(active, hp, boosts, status, spikes, rocks)`` where hazards are the ones on
+    that side of the field. Everything is plain tuples so the model pickles into
+    decision workers.
+    """
+
+    def __init__(self, battle: AbstractBattle, calc: _DamageCalculator, root_actions: List[int]):
+        tables = calc.tables
+        gen_data = calc._gen_data
+        self.battle_tag = battle.battle_tag
+        self.root_actions = tuple(root_actions)
+
+        teams = (list(battle.team.values()), list(battle.opponent_team.values()))
+        actives = (battle.active_pokemon, battle.opponent_active_pokemon)
+        self.hidden_opponents = max(0, 6 - len(teams[1]))
+
+        weather = [str(w).lower() for w in battle.weather] if getattr(battle, "weather", None) else []
+        sun = any("sun" in w for w in weather)
+        rain = any("rain" in w for w in weather)
+
+        # Attacking and defending profiles bracket the opponent's unknown spread
+        attackers = (
+            [calc.combatant(p, battle, True, True, False)._replace(burned=False) for p in teams[0]],
+            [calc.combatant(p, battle, False, False, False)._replace(burned=False) for p in teams[1]],
+            [calc.combatant(p, battle, False, True, False)._replace(burned=False) for p in teams[1]],
+        )
+        defenders = (
+            attackers[0],
+            [calc.combatant(p, battle, False, True, False) for p in teams[1]],
+            [calc.combatant(p, battle, False, False, False) for p in teams[1]],
+        )
+
+        rock = tables.type_index["ROCK"]
+        electric = tables.type_index["ELECTRIC"]
+        flying = tables.type_index["FLYING"]
+        moves, speeds, rock_weakness, grounded = [], [], [], []
+        for side in (0, 1):
+            side_moves = []
+            for slot, pokemon in enumerate(teams[side]):
+                if side == 0 and pokemon is actives[0]:
+                    move_ids = [m.id for m in battle.available_moves]
+                else:
+                    move_ids = list(pokemon.moves)
+
+                if side == 0:
+                    pairs = [
+                        (attackers[0][slot], attackers[0][slot], d_min, d_max)
+                        for d_min, d_max in zip(defenders[1], defenders[2])
+                    ]
+                else:
+                    pairs = [(attackers[1][slot], attackers[2][slot], d, d) for d in defenders[0]]
+
+                mon_moves = []
+                for move_id in move_ids:
+                    if move_id not in calc.moves:
+                        # Keeps move slots lined up with the battle's available moves
+                        mon_moves.append(_SearchMove((0.0,) * len(pairs), False, 1.0, 0, _EFFECT_NONE, (0,) * 5, 0.0))
+                        continue
+                    info = gen_data.moves[move_id]
+                    move = calc.moves[move_id]
+                    mon_moves.append(
+                        self._search_move(info, move, calc.move_type(move_id, pairs[0][0]), calc, pairs, sun, rain, electric)
+                    )
+                if side == 1 and not mon_moves:
+                    physical = pokemon.base_stats["atk"] >= pokemon.base_stats["spa"]
+                    for type_index in attackers[1][slot].stab_types:
+                        move = _CalcMove(_ASSUMED_BASE_POWER, physical, type_index, 1, 1, 0)
+                        info = {"category": "Physical" if physical else "Special", "accuracy": 100}
+                        mon_moves.append(
+                            self._search_move(info, move, type_index, calc, pairs, sun, rain, electric)
+                        )
+                side_moves.append(tuple(mon_moves))
+
+            moves.append(tuple(side_moves))
+            speeds.append(tuple(c.stats[5] for c in attackers[0 if side == 0 else 2]))
+            rock_weakness.append(
+                tuple(tables.effectiveness(rock, c.types) for c in defenders[0 if side == 0 else 1])
+            )
+            grounded.append(
+                tuple(
+                    flying not in c.types and c.ability != "levitate" and c.item != "airballoon"
+                    for c in defenders[0 if side == 0 else 1]
+                )
+            )
+
+        self.moves = tuple(moves)
+        self.speeds = tuple(speeds)
+        self.rock_weakness = tuple(rock_weakness)
+        self.grounded = tuple(grounded)
+
+        sides = []
+        for side, conditions in ((0, battle.side_conditions), (1, battle.opponent_side_conditions)):
+            active = teams[side].index(actives[side]) if actives[side] in teams[side] else 0
+            sides.append(
+                (
+                    active,
+                    tuple(
+                        0.0 if p.fainted else round((p.current_hp_fraction or 0) * 100, 1)
+                        for p in teams[side]
+                    ),
+                    tuple(actives[side].boosts[stat] for stat in _BOOST_STATS),
+                    tuple(_status_code(p) for p in teams[side]),
+                    conditions.get(SideCondition.SPIKES, 0),
+                    int(SideCondition.STEALTH_ROCK in conditions),
+                )
+            )
+        self.root = tuple(sides)
+        # Searched values only carry over to models built from the same moves,
+        # reveals and damage tables
+        self.signature = hash(
+            (self.battle_tag, self.hidden_opponents, self.moves, self.speeds, self.rock_weakness, self.grounded)
+        )
+
+    @staticmethod
+    def _search_move(info, move, type_index, calc, pairs, sun, rain, electric) -> _SearchMove:
+        effect, boosts, heal = _EFFECT_NONE, (0,) * 5, 0.0
+        if info.get("boosts") and info.get("target") == "self":
+            effect = _EFFECT_BOOST
+            boosts = tuple(info["boosts"].get(stat, 0) for stat in _BOOST_STATS)
+        elif info.get("heal"):
+            effect, heal = _EFFECT_HEAL, info["heal"][0] / info["heal"][1]
+        elif info.get("status") == "par":
+            effect = _EFFECT_PARALYZE
+        elif info.get("sideCondition") == "spikes":
+            effect = _EFFECT_SPIKES
+        elif info.get("sideCondition") == "stealthrock":
+            effect = _EFFECT_ROCKS
+
+        if effect == _EFFECT_PARALYZE:
+            damage = tuple(
+                float(electric not in d.types and calc.tables.effectiveness(type_index, d.types) > 0)
+                for _, _, d, _ in pairs
+            )
+        else:
+            damage = tuple(
+                (
+                    calc.move_damage(move, type_index, a_min, d_max, sun, rain)[0]
+                    + calc.move_damage(move, type_index, a_max, d_min, sun, rain)[1]
+                ) / 2
+                for a_min, a_max, d_max, d_min in pairs
+            )
+
+        return _SearchMove(
+            damage=damage,
+            physical=move.physical,
+            accuracy=_acc_to_pct(info.get("accuracy", True)) / 100,
+            priority=info.get("priority", 0),
+            effect=effect,
+            boosts=boosts,
+            heal=heal,
+        )
+
+    def actions(self, state, side: int) -> List[int]:
+        active, hp = state[side][0], state[side][1]
+        actions = list(range(len(self.moves[side][active]))) if hp[active] > 0 else []
+        actions.extend(_SWITCH_ACTION + slot for slot, h in enumerate(hp) if h > 0 and slot != active)
+        return actions
+
+    def winner(self, state) -> Optional[int]:
+        if not any(state[0][1]):
+            return 1
+        if not any(state[1][1]) and not self.hidden_opponents:
+            return 0
+        return None
+
+    def evaluate(self, state) -> float:
+        winner = self.winner(state)
+        if winner is not None:
+            return _WIN_VALUE if winner == 0 else -_WIN_VALUE
+        mine, theirs = state
+        value = sum(mine[1]) + 30 * sum(1 for h in mine[1] if h > 0)
+        value -= sum(theirs[1]) + 30 * sum(1 for h in theirs[1] if h > 0) + 130 * self.hidden_opponents
+        value += 8 * (mine[2][0] + mine[2][2] + mine[2][4]) - 8 * (theirs[2][0] + theirs[2][2] + theirs[2][4])
+        return value
+
+    def greedy_action(self, state, side: int, rng: random.Random, explore: float = 0.1) -> int:
+        """The rollout policy: the move expected to deal the most damage right now."""
+        actions = self.actions(state, side)
+        if not actions:
+            return _SWITCH_ACTION + state[side][0]
+        if rng.random() < explore:
+            return rng.choice(actions)
+
+        user, target = state[side], state[1 - side]
+        best_action, best_damage = actions[0], -1.0
+        for action in actions:
+            if action >= _SWITCH_ACTION:
+                break
+            move = self.moves[side][user[0]][action]
+            if move.effect == _EFFECT_PARALYZE:
+                continue
+            attack, defense = (0, 1) if move.physical else (2, 3)
+            damage = (
+                move.damage[target[0]] * move.accuracy
+                * _stage_multiplier(user[2][attack]) / _stage_multiplier(target[2][defense])
+            )
+            if damage > best_damage:
+                best_action, best_damage = action, damage
+        return best_action
+
+    def accuracy(self, state, side: int, action: int) -> float:
+        if action >= _SWITCH_ACTION:
+            return 1.0
+        return self.moves[side][state[side][0]][action].accuracy
+
+    def play(self, state, actions: Tuple[int, int], hits: Tuple[bool, bool]):
+        """The state after both sides take ``actions``; ``hits`` says which moves land."""
+        sides = [[side[0], list(side[1]), list(side[2]), list(side[3]), side[4], side[5]] for side in state]
+
+        # Switches go first; "switching" to the active pokemon passes the turn
+        for side in (0, 1):
+            if actions[side] >= _SWITCH_ACTION and actions[side] - _SWITCH_ACTION != sides[side][0]:
+                self._switch_in(sides, side, actions[side] - _SWITCH_ACTION)
+
+        movers = [side for side in (0, 1) if actions[side] < _SWITCH_ACTION]
+        if len(movers) == 2:
+            movers.sort(key=lambda side: self._turn_order(sides, side, actions[side]), reverse=True)
+        for side in movers:
+            if sides[side][1][sides[side][0]] > 0 and hits[side]:
+                self._use_move(sides, side, actions[side])
+
+        for side in (0, 1):
+            active, hp, status = sides[side][0], sides[side][1], sides[side][3]
+            if hp[active] > 0 and status[active] == _STATUS_BRN:
+                hp[active] = max(0.0, hp[active] - 6.25)
+            if hp[active] <= 0:
+                replacements = [slot for slot, h in enumerate(hp) if h > 0]
+                if replacements:
+                    self._switch_in(sides, side, max(replacements, key=lambda slot: hp[slot]))
+
+        return tuple(
+            (side[0], tuple(side[1]), tuple(side[2]), tuple(side[3]), side[4], side[5])
+            for side in sides
+        )
+
+    def _turn_order(self, sides, side: int, action: int) -> Tuple[int, float, int]:
+        active = sides[side][0]
+        speed = self.speeds[side][active] * _stage_multiplier(sides[side][2][4])
+        if sides[side][3][active] == _STATUS_PAR:
+            speed /= 2
+        # Speed ties go to us, keeping the search deterministic
+        return self.moves[side][active][action].priority, speed, -side
+
+    def _switch_in(self, sides, side: int, slot: int):
+        mon = sides[side]
+        mon[0] = slot
+        mon[2] = [0] * 5
+        damage = 12.5 * self.rock_weakness[side][slot] * mon[5]
+        if self.grounded[side][slot]:
+            damage += _SPIKES_DAMAGE[min(mon[4], 3)]
+        mon[1][slot] = max(0.0, mon[1][slot] - damage)
+
+    def _use_move(self, sides, side: int, action: int):
+        user, target = sides[side], sides[1 - side]
+        move = self.moves[side][user[0]][action]
+        if move.effect == _EFFECT_BOOST:
+            user[2] = [max(-6, min(6, b + d)) for b, d in zip(user[2], move.boosts)]
+        elif move.effect == _EFFECT_HEAL:
+            user[1][user[0]] = min(100.0, user[1][user[0]] + 100 * move.heal)
+        elif move.effect == _EFFECT_PARALYZE:
+            if move.damage[target[0]] and target[3][target[0]] == _STATUS_NONE:
+                target[3][target[0]] = _STATUS_PAR
+        elif move.effect == _EFFECT_SPIKES:
+            target[4] = min(3, target[4] + 1)
+        elif move.effect == _EFFECT_ROCKS:
+            target[5] = 1
+
+        damage = move.damage[target[0]] if move.effect != _EFFECT_PARALYZE else 0.0
+        if damage:
+            attack, defense = (0, 1) if move.physical else (2, 3)
+            damage *= _stage_multiplier(user[2][attack]) / _stage_multiplier(target[2][defense])
+            if move.physical and user[3][user[0]] == _STATUS_BRN:
+                damage /= 2
+            target[1][target[0]] = max(0.0, round(target[1][target[0]] - damage, 1))
+
+
+class _TranspositionTable:
+    """Searched values keyed by model signature and bucketed state, evicting the least
+    recently used."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: "OrderedDict[tuple, Tuple[int, float, Optional[int]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(signature: int, state) -> tuple:
+        return (signature,) + tuple(
+            (side[0], tuple(int(h) // _HP_BUCKET for h in side[1])) + side[2:] for side in state
+        )
+
+    def get(self, key: tuple) -> Optional[Tuple[int, float, Optional[int]]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, depth: int, value: float, action: Optional[int]):
+        self._entries[key] = (depth, value, action)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+# Shared by every search in this process, so work carries over between turns
+# for as long as the model it was done on is unchanged (_SearchModel.signature)
+_SEARCH_TABLE = _TranspositionTable(capacity=200_000)
+
+
+def _search_node(model: _SearchModel, state, depth: int, deadline: float, table: _TranspositionTable, root: bool = False):
+    """Value of ``state`` for us and our best action, searching ``depth`` turns.
+
+    We maximise over our actions, the opponent minimises knowing our choice and
+    move accuracy is averaged over as a chance node.
+    """
+    if time.time() > deadline:
+        raise _SearchTimeout()
+    if depth == 0 or model.winner(state) is not None:
+        return model.evaluate(state), None
+
+    key = table.key(model.signature, state)
+    entry = table.get(key)
+    if entry is not None and entry[0] >= depth and not root:
+        return entry[1], entry[2]
+
+    my_actions = list(model.root_actions) if root else model.actions(state, 0)
+    if entry is not None and entry[2] in my_actions:
+        my_actions.remove(entry[2])
+        my_actions.insert(0, entry[2])
+    opp_actions = model.actions(state, 1) or [None]
+
+    best_value, best_action = -float("inf"), None
+    for mine in my_actions:
+        worst = float("inf")
+        for theirs in opp_actions:
+            value = _expected_value(model, state, mine, theirs, depth, deadline, table)
+            worst = min(worst, value)
+            # The opponent already holds us below our best line
+            if worst <= best_value:
+                break
+        if worst > best_value:
+            best_value, best_action = worst, mine
+
+    table.put(key, depth, best_value, best_action)
+    return best_value, best_action
+
+
+def _expected_value(model: _SearchModel, state, mine: int, theirs: Optional[int], depth: int, deadline: float, table) -> float:
+    if theirs is None:
+        # The opponent has nothing left to act with; only our own move matters
+        theirs = _SWITCH_ACTION + state[1][0]
+        opp_accuracy = 1.0
+    else:
+        opp_accuracy = model.accuracy(state, 1, theirs)
+    my_accuracy = model.accuracy(state, 0, mine)
+
+    value = 0.0
+    for my_hit, my_p in ((True, my_accuracy), (False, 1 - my_accuracy)):
+        if my_p <= 0:
+            continue
+        for opp_hit, opp_p in ((True, opp_accuracy), (False, 1 - opp_accuracy)):
+            if opp_p <= 0:
+                continue
+            child = model.play(state, (mine, theirs), (my_hit, opp_hit))
+            value += my_p * opp_p * _search_node(model, child, depth - 1, deadline, table)[0]
+    return value
+
+
+def _run_search(model: _SearchModel, max_depth: int, budget: float) -> Tuple[Optional[int], int]:
+    """Iteratively deepens until ``max_depth`` or until ``budget`` seconds pass.
+
+    Returns the best root action of the deepest completed search and that depth.
+    """
+    deadline = time.time() + budget
+    best_action, completed = None, 0
+    for depth in range(1, max_depth + 1):
+        try:
+            _, action = _search_node(model, model.root, depth, deadline, _SEARCH_TABLE, root=True)
+        except _SearchTimeout:
+            break
+        best_action, completed = action, depth
+    return best_action, completed
+
+
+_ROLLOUT_SCALE = 400.0
+
+
+def _rollout(model: _SearchModel, action: int, depth: int, rng: random.Random) -> float:
+    """Plays ``action`` and then the greedy policy for both sides for up to ``depth`` turns.
+
+    Returns 1 for a win, -1 for a loss and the scaled evaluation in between when
+    the depth limit is reached first.
+    """
+    state = model.root
+    for turn in range(depth):
+        winner = model.winner(state)
+        if winner is not None:
+            return 1.0 if winner == 0 else -1.0
+
+        mine = action if turn == 0 else model.greedy_action(state, 0, rng)
+        theirs = model.greedy_action(state, 1, rng)
+        hits = (
+            rng.random() < model.accuracy(state, 0, mine),
+            rng.random() < model.accuracy(state, 1, theirs),
+        )
+        state = model.play(state, (mine, theirs), hits)
+
+    return max(-1.0, min(1.0, model.evaluate(state) / _ROLLOUT_SCALE))
+
+
+def _run_rollouts(model: _SearchModel, depth: int, deadline: float, seed: int) -> Tuple[Dict[int, float], Dict[int, int]]:
+    """Rolls out the root actions in turn until the wall clock passes ``deadline``.
+
+    Returns the summed outcome and the number of rollouts of each root action.
+    """
+    rng = random.Random(seed)
+    totals = {action: 0.0 for action in model.root_actions}
+    counts = {action: 0 for action in model.root_actions}
+    while time.time() < deadline:
+        for action in model.root_actions:
+            totals[action] += _rollout(model, action, depth, rng)
+            counts[action] += 1
+    return totals, counts
+
+
+def _best_mean(totals: Dict[int, float], counts: Dict[int, int]) -> Optional[int]:
+    rolled = [action for action in totals if counts[action]]
+    if not rolled:
+        return None
+    # Ties keep the heuristic's root order
+    return max(rolled, key=lambda action: totals[action] / counts[action])
+
+
+def _worker_module():
+    """This file as a top-level module named after it, the name decision workers
+    import it by.
+
+    The agent loaders register this file under a namespaced module name
+    ("agent_plugins.players.ratk825") that pickle cannot import, so the search
+    models and functions sent to workers come from this module instead. Workers
+    find it once the file's folder is on their path (see ``CustomAgent``).
+    """
+    name = os.path.splitext(os.path.basename(__file__))[0]
+    if __name__ == name:
+        return sys.modules[__name__]
+    module = sys.modules.get(name)
+    if module is None or os.path.abspath(getattr(module, "__file__", "")) != os.path.abspath(__file__):
+        spec = importlib.util.spec_from_file_location(name, __file__)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def _action_label(action) -> str:
+    """How an action is named in the decision records: "move <id>" or "switch <species>"."""
+    if isinstance(action, Move):
+        return f"move {action.id}"
+    return f"switch {action.species}"
+
+
+class CustomAgent(Player):
+    def __init__(
+        self,
+        *args,
+        batch_window: float = 0.0,
+        decision_workers: int = 0,
+        search_depth: int = 0,
+        search_time: float = 0.5,
+        rollout_time: float = 0.0,
+        rollout_depth: int = 30,
+        **kwargs,
+    ):
+        """
+        :param batch_window: Seconds to hold decision requests so that every battle
+            waiting within the window is scored by one ``choose_moves`` call. 0
+            scores each request as soon as it arrives.
+        :type batch_window: float
+        :param decision_workers: Number of worker processes that run the search and
+            the rollouts off the event loop; scoring stays in process, as it takes
+            less time than sending a battle to a worker. 0, or neither search nor
+            rollouts enabled, runs everything on the event loop.
+        :type decision_workers: int
+        :param search_depth: Maximum number of turns to search ahead before
+            committing to a move. 0 plays the heuristic scores directly.
+        :type search_depth: int
+        :param search_time: Seconds each search may take; deeper searches that do
+            not finish in time are abandoned for the deepest completed one.
+        :type search_time: float
+        :param rollout_time: Seconds to spend per decision on Monte Carlo rollouts,
+            split across the decision workers when there are any. The action with
+            the best mean outcome is played instead of the search's choice. 0
+            disables rollouts.
+        :type rollout_time: float
+        :param rollout_depth: Turns a rollout plays before it is scored by the
+            search evaluation instead of its outcome.
+        :type rollout_depth: int
+        """
+        super().__init__(team=_TEAMBUILDER, *args, **kwargs)
+        self._tables = _get_format_tables(self.format)
+        self._set_inference = _SetInference(self.format)
+
+        # How the latest decision of each battle was made, for profiling and
+        # the decision dataset:
+        # {"branch": "heuristic" | "fallback" | "random" | "search" | "rollout",
+        #  "candidates": number of actions considered,
+        #  "scores": [(action label, heuristic score), ...]}
+        self.last_decision: Dict[str, Dict[str, object]] = {}
+
+        self._batch_window = batch_window
+        self._pending_decisions: List[Tuple[AbstractBattle, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self._search_depth = search_depth
+        self._search_time = search_time
+        self._rollout_time = rollout_time
+        self._rollout_depth = rollout_depth
+        self._rollout_seed = random.Random()
+
+        self._decision_workers = decision_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if decision_workers > 0 and (search_depth > 0 or rollout_time > 0):
+            self._workers = _worker_module()
+            self._executor = ProcessPoolExecutor(
+                max_workers=decision_workers,
+                # Workers import this file by name, as the tasks they unpickle ask
+                initializer=site.addsitedir,
+                initargs=(os.path.dirname(os.path.abspath(__file__)),),
+            )
+            # Also shuts the workers down if the agent is dropped without close()
+            self._shutdown_workers = weakref.finalize(
+                self, self._executor.shutdown, wait=False, cancel_futures=True
+            )
+
+    def close(self):
+        """Shuts down the decision workers, if any."""
+        if self._executor is not None:
+            self._shutdown_workers()
+            self._executor = None
+
+    def choose_move(self, battle: AbstractBattle):
+        if battle.active_pokemon is None or battle.opponent_active_pokemon is None:
+            self._record_decision(battle, "random", 0, [])
             return self.choose_random_move(battle)
 
-        def get_pokemon_types(pokemon):
-            """Get types as strings for a pokemon"""
-            types = []
-            try:
-                if pokemon.type_1 and hasattr(pokemon.type_1, 'name'):
-                    types.append(pokemon.type_1.name)
-                if pokemon.type_2 and hasattr(pokemon.type_2, 'name'):
-                    types.append(pokemon.type_2.name)
-            except:
-                pass
-            return types
-
-        def is_mirror_match():
-            """Check if we're in a mirror match (same team)"""
-            return battle.teampreview_opponent_team is not None and len(battle.teampreview_opponent_team) == 6
-
-        def move_score(move):
-            move_info = gen_data.moves.get(move.id, {})
-            if not move_info:
-                return -float('inf')
-
-            base_power = move_info.get("basePower", move.base_power or 0)
-            accuracy = _acc_to_pct(move_info.get("accuracy", move.accuracy))
-            category = move_info.get("category", "Status")
-
-            # Type effectiveness calculation
-            effectiveness = 1.0
-            opp_types = get_pokemon_types(opp_pokemon)
+        if self._batch_window > 0:
+            return self._queue_decision(battle)
 
-            try:
-                if move.type and move.type.name:
-                    for t in opp_types:
-                        eff = move.type.damage_multiplier(t)
-                        effectiveness *= eff
-                    if effectiveness <= 0:
-                        return -float('inf')
-            except Exception:
-                effectiveness = 1.0
+        if self._executor is not None:
+            return self._choose_move_in_pool(battle)
 
-            # Gate obviously bad moves early
-            if move.id == "thunderwave" and (getattr(opp_pokemon, "status", None) or "ELECTRIC" in opp_types):
-                return -float('inf')
+        return self.choose_moves([battle])[0]
 
-            # CRITICAL FIX: Don't use Dynamax Cannon against Fairy types
-            if move.id == "dynamaxcannon" and "FAIRY" in opp_types:
-                return -float('inf')
+    def choose_moves(self, battles: List[AbstractBattle]) -> List[BattleOrder]:
+        """Scores the candidate actions of several battles in a single batch."""
+        batch = self._encode(battles)
+        scores = batch.scores()
+        orders = self._orders_from_batch(batch, scores)
+        for i, model, targets in self._search_models(batch, scores):
+            if self._rollout_time > 0:
+                started = time.time()
+                results = [_run_rollouts(model, self._rollout_depth, started + self._rollout_time, self._next_seed())]
+                action = self._pick_rollout(model, results, started)
+            else:
+                action, _ = _run_search(model, self._search_depth, self._search_time)
+            if action is not None:
+                orders[i] = self.create_order(targets[action])
+                self._record_decision(batch.battles[i], self._search_branch(), len(targets))
+        return orders
 
-            # CRITICAL FIX: Don't use Psycho Boost against Steel types
-            if move.id == "psychoboost" and "STEEL" in opp_types:
-                return -float('inf')
+    async def choose_moves_in_pool(self, battles: List[AbstractBattle]) -> List[BattleOrder]:
+        """Like ``choose_moves``, but searches or rolls out in the worker processes."""
+        batch = self._encode(battles)
+        loop = asyncio.get_running_loop()
+        scores = batch.scores()
+        orders = self._orders_from_batch(batch, scores)
 
-            score = 0
+        plans = self._search_models(batch, scores)
+        if self._rollout_time > 0:
+            actions = await asyncio.gather(*(self._rollouts_in_pool(model) for _, model, _ in plans))
+        else:
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        self._executor, self._workers._run_search, model, self._search_depth, self._search_time
+                    )
+                    for _, model, _ in plans
+                )
+            )
+            actions = [action for action, _ in results]
+        for (i, _, targets), action in zip(plans, actions):
+            if action is not None:
+                orders[i] = self.create_order(targets[action])
+                self._record_decision(batch.battles[i], self._search_branch(), len(targets))
+        return orders
 
-            # STAB calculation
-            my_types = []
-            try:
-                if my_pokemon.type_1:
-                    my_types.append(my_pokemon.type_1)
-                if my_pokemon.type_2:
-                    my_types.append(my_pokemon.type_2)
-                if move.type in my_types:
-                    base_power *= 1.5
-            except Exception:
-                pass
-
-            # Weather boost
-            if move.type and move.type.name == "FIRE" and hasattr(battle, 'weather') and battle.weather:
-                if any("sun" in str(w).lower() for w in battle.weather):
-                    base_power *= 1.5
-
-            # Mirror match specific logic
-            if is_mirror_match():
-                # In mirror matches, prioritize setup and defensive plays early
-                if battle.turn <= 3:
-                    if move.id in {"swordsdance", "calmmind", "agility"} and (
-                            my_pokemon.current_hp_fraction or 1.0) >= 0.7:
-                        score += 200
-                    if move.id == "recover" and (my_pokemon.current_hp_fraction or 1.0) <= 0.8:
-                        score += 180
-
-                # Prioritize Taunt to prevent opponent setup
-                if move.id == "taunt" and battle.turn <= 5:
-                    score += 160
-
-                # Speed control with Thunder Wave
-                if move.id == "thunderwave" and not getattr(opp_pokemon, "status", None):
-                    score += 140
-
-            # Setup move logic - more conservative
-            if move.id in {"swordsdance", "calmmind", "agility"}:
-                hp_threshold = 0.7 if is_mirror_match() else 0.5
-                if (my_pokemon.current_hp_fraction or 1.0) >= hp_threshold:
-                    # Check if we have time to setup
-                    try:
-                        predicted_damage = 0
-                        if hasattr(opp_pokemon, 'moves') and opp_pokemon.moves:
-                            for opp_move in opp_pokemon.moves.values():
-                                if opp_move.base_power and opp_move.base_power > predicted_damage:
-                                    predicted_damage = opp_move.base_power
-
-                        # Only setup if we won't be KO'd next turn
-                        if predicted_damage < (my_pokemon.current_hp_fraction or 1.0) * 300:
-                            score += 150
-                    except Exception:
-                        score += 100
-
-            # Core damage calculation
-            base_power *= effectiveness
-            score += base_power * (accuracy / 100)
-
-            # Status move improvements
-            if category == "Status":
-                if move.id == "recover":
-                    hp_frac = my_pokemon.current_hp_fraction or 1.0
-                    if hp_frac <= 0.5:
-                        score += 200
-                    elif hp_frac <= 0.8:
-                        score += 120
-
-                if move.id == "taunt":
-                    # Higher priority early game and against setup threats
-                    if battle.turn <= 8:
-                        score += 130
-                    try:
-                        if hasattr(opp_pokemon, 'moves') and opp_pokemon.moves:
-                            setup_moves = {"swordsdance", "calmmind", "agility", "recover"}
-                            if any(m.id in setup_moves for m in opp_pokemon.moves.values()):
-                                score += 150
-                    except:
-                        pass
-
-            # Species-specific logic improvements
-            if my_pokemon.species:
-                if "Deoxys-Speed" in my_pokemon.species:
-                    if move.id == "spikes":
-                        try:
-                            spikes_layers = battle.opponent_side_conditions.get("spikes", 0)
-                            remaining_opponents = sum(1 for p in battle.opponent_team.values() if not p.fainted)
-                            if remaining_opponents >= 2 and spikes_layers < 2 and battle.turn <= 8:
-                                score += 170
-                        except:
-                            pass
-
-                elif "Kingambit" in my_pokemon.species:
-                    # Supreme Overlord boost calculation
-                    fainted_allies = sum(1 for p in battle.team.values() if p.fainted)
-                    if move.id in {"suckerpunch", "kowtowcleave", "ironhead"}:
-                        score += fainted_allies * 15
-
-                elif "Arceus-Fairy" in my_pokemon.species:
-                    if move.id == "judgment":
-                        # Extra damage vs Dragons and Fighting types
-                        if any(t in {"DRAGON", "FIGHTING", "DARK"} for t in opp_types):
-                            score += 80
-
-            # Priority move handling
-            if hasattr(move, 'priority') and move.priority > 0:
-                score += 60
-                # Extra bonus if opponent is low on HP
-                if (opp_pokemon.current_hp_fraction or 1.0) <= 0.3:
-                    score += 80
-
-            # Sucker Punch specific logic
-            if move.id == "suckerpunch":
-                try:
-                    # Predict if opponent will use an attacking move
-                    if (opp_pokemon.current_hp_fraction or 1.0) <= 0.4:
-                        score += 100
-                    else:
-                        score += 40
-
-                    # Penalty against Fairy types
-                    if "FAIRY" in opp_types:
-                        score -= 50
-                except:
-                    score += 40
+    async def _rollouts_in_pool(self, model: _SearchModel) -> Optional[int]:
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        # Workers share the wall clock, so a queued job only gets what is left of the budget
+        deadline = started + self._rollout_time
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self._executor, self._workers._run_rollouts, model, self._rollout_depth, deadline, self._next_seed()
+                )
+                for _ in range(self._decision_workers)
+            )
+        )
+        return self._pick_rollout(model, results, started)
 
-            # Accuracy penalties
-            if accuracy < 85 and category != "Status":
-                score -= 60
+    def lookup_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters of the memoized type lookups shared by this format's agents."""
+        return self._tables.cache_stats()
 
-            # High power move bonus
-            if base_power >= 120 and effectiveness >= 1:
-                score += 70
+    def _search_branch(self) -> str:
+        return "rollout" if self._rollout_time > 0 else "search"
 
-            return score
+    def _record_decision(
+        self,
+        battle: AbstractBattle,
+        branch: str,
+        candidates: int,
+        scores: Optional[List[Tuple[str, float]]] = None,
+    ):
+        # A search overrides the heuristic's choice but keeps its scores
+        if scores is None:
+            scores = self.last_decision.get(battle.battle_tag, {}).get("scores", [])
+        self.last_decision[battle.battle_tag] = {
+            "branch": branch,
+            "candidates": candidates,
+            "scores": scores,
+        }
 
-        def switch_score(switch):
-            score = 0
-            try:
-                # Type matchup evaluation
-                switch_types = get_pokemon_types(switch)
-                opp_types = get_pokemon_types(opp_pokemon)
-
-                # Check defensive matchup
-                if hasattr(opp_pokemon, 'moves') and opp_pokemon.moves:
-                    for mv in opp_pokemon.moves.values():
-                        if mv.type and switch.type_1:
-                            eff = mv.type.damage_multiplier(switch.type_1, switch.type_2) if mv.type else 1.0
-                            if eff < 0.5:
-                                score += 100
-                            elif eff > 2:
-                                score -= 120
-
-                # HP consideration
-                hp_frac = switch.current_hp_fraction if switch.current_hp_fraction is not None else 1.0
-                score += hp_frac * 100
-
-                # Hazard damage consideration
-                if battle.opponent_side_conditions.get("stealthrock", 0) or battle.opponent_side_conditions.get(
-                        "spikes", 0):
-                    if hp_frac < 0.7:
-                        score -= 80
-
-                # Mirror match switching logic
-                if is_mirror_match():
-                    # Specific advantageous switches in mirrors
-                    if switch.species == "Arceus-Fairy" and any(t in {"DRAGON", "FIGHTING", "DARK"} for t in opp_types):
-                        score += 120
-                    elif switch.species == "Kingambit" and "FAIRY" in opp_types:
-                        score += 100
-                    elif switch.species == "Zacian-Crowned":
-                        score += 80  # Generally strong
-
-                # Don't switch if current Pokemon can still be useful
-                if (my_pokemon.current_hp_fraction or 0) > 0.6:
-                    score -= 50
+    def _battle_finished_callback(self, battle: AbstractBattle):
+        self.last_decision.pop(battle.battle_tag, None)
+        self._set_inference.forget(battle.battle_tag)
 
-            except Exception:
-                pass
+    def _next_seed(self) -> int:
+        return self._rollout_seed.getrandbits(32)
+
+    def _pick_rollout(
+        self, model: _SearchModel, results: List[Tuple[Dict[int, float], Dict[int, int]]], started: float
+    ) -> Optional[int]:
+        totals = {action: sum(r[0][action] for r in results) for action in model.root_actions}
+        counts = {action: sum(r[1][action] for r in results) for action in model.root_actions}
+
+        rollouts = sum(counts.values())
+        elapsed = time.time() - started
+        self.logger.info(
+            "%s: %d rollouts in %.2fs (%.0f rollouts/s)",
+            model.battle_tag, rollouts, elapsed, rollouts / elapsed if elapsed else 0.0,
+        )
+        return _best_mean(totals, counts)
+
+    async def _choose_move_in_pool(self, battle: AbstractBattle) -> BattleOrder:
+        return (await self.choose_moves_in_pool([battle]))[0]
+
+    def _encode(self, battles: List[AbstractBattle]) -> _DecisionBatch:
+        batch = _DecisionBatch(self._tables, self._set_inference)
+        for battle in battles:
+            batch.add(battle)
+        return batch
 
-            return score
+    def _orders_from_batch(self, batch: _DecisionBatch, scores: np.ndarray) -> List[BattleOrder]:
+        actions = batch.actions()
+        owners = batch.action_battles()
 
+        orders = []
+        for i, battle in enumerate(batch.battles):
+            rows = np.flatnonzero(owners == i)
+            orders.append(
+                self._order_from_scores(battle, [actions[j] for j in rows], scores[rows])
+            )
+        return orders
+
+    def _search_models(
+        self, batch: _DecisionBatch, scores: np.ndarray
+    ) -> List[Tuple[int, _SearchModel, Dict[int, object]]]:
+        """Search models for the batch's battles, with root actions in heuristic order.
+
+        Rollouts play the same model as the search.
+        """
+        if self._search_depth <= 0 and self._rollout_time <= 0:
+            return []
+
+        actions = batch.actions()
+        owners = batch.action_battles()
+        # Models for the workers must pickle by a name they can import
+        model_class = self._workers._SearchModel if self._executor is not None else _SearchModel
+
+        models = []
+        for i, battle in enumerate(batch.battles):
+            # Forced switches are left to the heuristic
+            if not battle.available_moves:
+                continue
+            team = list(battle.team.values())
+            rows = np.flatnonzero(owners == i)
+            targets = {}
+            for j in rows[np.argsort(-scores[rows], kind="stable")]:
+                action = actions[j]
+                if isinstance(action, Move):
+                    targets[battle.available_moves.index(action)] = action
+                else:
+                    targets[_SWITCH_ACTION + team.index(action)] = action
+            models.append((i, model_class(battle, batch.calc, list(targets)), targets))
+        return models
+
+    def _queue_decision(self, battle: AbstractBattle) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending_decisions.append((battle, future))
+
+        # Every live battle is already waiting on us, holding the batch open any
+        # longer only delays them
+        live_battles = sum(1 for b in self._battles.values() if not b.finished)
+        if len(self._pending_decisions) >= live_battles:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush_decisions()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._batch_window, self._flush_decisions)
+
+        return future
+
+    def _flush_decisions(self):
+        pending, self._pending_decisions = self._pending_decisions, []
+        self._flush_handle = None
+        if not pending:
+            return
+
+        if self._executor is not None:
+            asyncio.ensure_future(self._settle_in_pool(pending))
+            return
+
+        try:
+            orders = self.choose_moves([battle for battle, _ in pending])
+        except Exception:
+            self._settle_singly(pending)
+            return
+        self._settle(pending, orders)
+
+    async def _settle_in_pool(self, pending: List[Tuple[AbstractBattle, asyncio.Future]]):
+        try:
+            orders = await self.choose_moves_in_pool([battle for battle, _ in pending])
+        except Exception:
+            self._settle_singly(pending)
+            return
+        self._settle(pending, orders)
+
+    @staticmethod
+    def _settle(pending: List[Tuple[AbstractBattle, asyncio.Future]], orders: List[BattleOrder]):
+        for i, (_, future) in enumerate(pending):
+            if not future.done():
+                future.set_result(orders[i])
+
+    def _settle_singly(self, pending: List[Tuple[AbstractBattle, asyncio.Future]]):
+        """Decides a failed batch one battle at a time, so that a battle that cannot
+        be scored costs only its own turn; that battle moves at random."""
+        for battle, future in pending:
+            if future.done():
+                continue
+            try:
+                order = self.choose_moves([battle])[0]
+            except Exception:
+                self.logger.exception("%s: no order could be built, moving at random", battle.battle_tag)
+                order = self.choose_random_move(battle)
+            future.set_result(order)
+
+    def _order_from_scores(self, battle: AbstractBattle, actions: List, scores: np.ndarray):
         # Evaluate all possible actions
         best_action = None
         best_score = float("-inf")
 
-        # Evaluate moves
-        for mv in battle.available_moves:
-            sc = move_score(mv)
-            if sc > best_score:
-                best_score = sc
-                best_action = self.create_order(mv)
+        if len(scores):
+            best = int(np.argmax(scores))
+            if scores[best] > best_score:
+                best_score = float(scores[best])
+                best_action = self.create_order(actions[best])
 
-        # Evaluate switches
-        for sw in battle.available_switches:
-            sc = switch_score(sw)
-            if sc > best_score:
-                best_score = sc
-                best_action = self.create_order(sw)
+        branch = "heuristic"
 
         # Emergency fallback - if no good action found, prefer attacking moves
         if best_action is None or best_score < -100:
             attacking_moves = [m for m in battle.available_moves if (m.base_power or 0) > 0]
             if attacking_moves:
                 best_action = self.create_order(max(attacking_moves, key=lambda x: x.base_power or 0))
+                branch = "fallback"
+
+        if best_action is None:
+            branch = "random"
+        self._record_decision(
+            battle,
+            branch,
+            len(actions),
+            [(_action_label(action), float(score)) for action, score in zip(actions, scores)],
+        )
 
-        return best_action or self.choose_random_move(battle)
\ No newline at end of file
+        return best_action or self.choose_random_move(battle)
@@ -0,0 +1,295 @@
+# Glicko-2 ratings of every agent, updated game by game and kept across runs.
+#
+# A RatingBook attached to agents rates each game the moment it finishes, as a
+# rating period of one game for both sides, so rankings draw on every game ever
+# played rather than on the win rates of a single cross-evaluation. Agents are
+# identified the same way as in the results cache (results_cache.agent_key), so
+# editing an agent or its team starts it over at the default rating, and pairs
+# recalled from the cache that were never rated are rated from their counts
+# (sync).
+#
+# Each rating comes with a deviation (RD): once an agent's RD is below
+# max_deviation its rating is stable and it needs no further games. With one
+# game per rating period the RD settles around 60, and reaches the default of 75
+# after some 30 games against established opponents. The book
+# keeps its agents in a list sorted by rating, so an agent's rank is found by
+# bisection and the top k are the first k entries.
+#
+# Ratings are stored in results/ratings.json, written by save().
+
+
+import bisect
+import json
+import math
+import os
+from typing import Dict, Iterable, List, Tuple, Union
+
+from poke_env.player.player import Player
+
+from results_cache import ResultsCache, agent_key
+
+# Glicko-2 constants: the rating scale factor, the volatility constraint and
+# the convergence tolerance of the volatility iteration
+SCALE = 173.7178
+TAU = 0.5
+EPSILON = 1e-6
+
+DEFAULT_RATING = 1500.0
+DEFAULT_DEVIATION = 350.0
+DEFAULT_VOLATILITY = 0.06
+
+
+def rank_players_by_victories(results_dict, top_k=10):
+    """Ranks a cross-evaluation by the fraction of opponents each player beat; the
+    default ranking, unless expert_main is run with --rank-by-rating."""
+    victory_scores = {}
+
+    for player, opponents in results_dict.items():
+        victories = [
+            1 if (score is not None and score > 0.5) else 0
+            for opp, score in opponents.items()
+            if opp != player
+        ]
+        if victories:
+            victory_scores[player] = sum(victories) / len(victories)
+        else:
+            victory_scores[player] = 0.0
+
+    # Sort by descending victory rate
+    sorted_players = sorted(victory_scores.items(), key=lambda x: x[1], reverse=True)
+
+    return sorted_players[:top_k]
+
+
+class Rating:
+    __slots__ = ("name", "rating", "deviation", "volatility", "games")
+
+    def __init__(
+        self,
+        name: str,
+        rating: float = DEFAULT_RATING,
+        deviation: float = DEFAULT_DEVIATION,
+        volatility: float = DEFAULT_VOLATILITY,
+        games: int = 0,
+    ):
+        self.name = name
+        self.rating = rating
+        self.deviation = deviation
+        self.volatility = volatility
+        self.games = games
+
+    def __repr__(self):
+        return f"Rating({self.name}, {self.rating:.0f} ± {2 * self.deviation:.0f})"
+
+
+def _g(phi: float) -> float:
+    return 1.0 / math.sqrt(1.0 + 3.0 * phi * phi / (math.pi * math.pi))
+
+
+def _expected(mu: float, mu_j: float, phi_j: float) -> float:
+    return 1.0 / (1.0 + math.exp(-_g(phi_j) * (mu - mu_j)))
+
+
+def glicko2(
+    rating: Rating, results: List[Tuple[Rating, float]]
+) -> Tuple[float, float, float]:
+    """rating's new (rating, deviation, volatility) after one rating period with
+    results, a list of (opponent, score) with scores of 1, 0.5 or 0.
+
+    The opponents' ratings are read as they were before the period.
+    """
+    mu = (rating.rating - DEFAULT_RATING) / SCALE
+    phi = rating.deviation / SCALE
+    sigma = rating.volatility
+
+    inverse_v = 0.0
+    improvement = 0.0
+    for opponent, score in results:
+        mu_j = (opponent.rating - DEFAULT_RATING) / SCALE
+        g = _g(opponent.deviation / SCALE)
+        expected = _expected(mu, mu_j, opponent.deviation / SCALE)
+        inverse_v += g * g * expected * (1.0 - expected)
+        improvement += g * (score - expected)
+    v = 1.0 / inverse_v
+    delta = v * improvement
+
+    # New volatility, by the Illinois variant of regula falsi on f(x) = 0
+    a = math.log(sigma * sigma)
+
+    def f(x: float) -> float:
+        ex = math.exp(x)
+        return (ex * (delta * delta - phi * phi - v - ex)) / (
+            2.0 * (phi * phi + v + ex) ** 2
+        ) - (x - a) / (TAU * TAU)
+
+    upper = a
+    if delta * delta > phi * phi + v:
+        lower = math.log(delta * delta - phi * phi - v)
+    else:
+        k = 1
+        while f(a - k * TAU) < 0:
+            k += 1
+        lower = a - k * TAU
+    f_upper, f_lower = f(upper), f(lower)
+    while abs(lower - upper) > EPSILON:
+        c = upper + (upper - lower) * f_upper / (f_lower - f_upper)
+        f_c = f(c)
+        if f_c * f_lower <= 0:
+            upper, f_upper = lower, f_lower
+        else:
+            f_upper /= 2.0
+        lower, f_lower = c, f_c
+    sigma = math.exp(upper / 2.0)
+
+    phi_star = math.sqrt(phi * phi + sigma * sigma)
+    phi = 1.0 / math.sqrt(1.0 / (phi_star * phi_star) + 1.0 / v)
+    mu += phi * phi * improvement
+    return mu * SCALE + DEFAULT_RATING, phi * SCALE, sigma
+
+
+AgentRef = Union[Player, str]
+
+
+class RatingBook:
+    def __init__(self, path: str, max_deviation: float = 75.0):
+        """
+        :param path: The JSON store, read if it exists.
+        :param max_deviation: RD under which a rating counts as stable.
+        """
+        self.path = path
+        self.max_deviation = max_deviation
+        self.rated = 0
+
+        self._ratings: Dict[str, Rating] = {}
+        # "key1|key2" -> games rated between key1 and key2, key1 < key2
+        self._pairs: Dict[str, int] = {}
+        # (-rating, key) of every agent, best first
+        self._index: List[Tuple[float, str]] = []
+        # Username -> key of the attached agents, to find their opponents
+        self._keys: Dict[str, str] = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                stored = json.load(file)
+            for key, entry in stored["agents"].items():
+                self._ratings[key] = Rating(**entry)
+            self._pairs = stored["pairs"]
+            self._index = sorted(
+                (-rating.rating, key) for key, rating in self._ratings.items()
+            )
+
+    def _key(self, agent: AgentRef) -> str:
+        if isinstance(agent, str):
+            return agent
+        key = self._keys.get(agent.username)
+        if key is None:
+            key = self._keys[agent.username] = agent_key(agent)
+        return key
+
+    def get(self, agent: AgentRef) -> Rating:
+        """The rating of an agent, or of an agent key; new agents start at the
+        default rating."""
+        key = self._key(agent)
+        rating = self._ratings.get(key)
+        if rating is None:
+            name = agent if isinstance(agent, str) else agent.username
+            rating = self._ratings[key] = Rating(name)
+            bisect.insort(self._index, (-rating.rating, key))
+        elif not isinstance(agent, str):
+            rating.name = agent.username
+        return rating
+
+    def rank(self, agent: AgentRef) -> int:
+        """1-based position of the agent among every rated agent."""
+        rating = self.get(agent)
+        return bisect.bisect_left(self._index, (-rating.rating, self._key(agent))) + 1
+
+    def leaderboard(self, top_k: int = 10) -> List[Rating]:
+        return [self._ratings[key] for _, key in self._index[:top_k]]
+
+    def stable(self, agent: AgentRef) -> bool:
+        return self.get(agent).deviation <= self.max_deviation
+
+    def rank_players(
+        self, players: Iterable[Player], top_k=10
+    ) -> List[Tuple[str, float]]:
+        """(username, rating) of players, best first, like rank_players_by_victories."""
+        ranked = sorted(players, key=self.rank)
+        return [(player.username, self.get(player).rating) for player in ranked[:top_k]]
+
+    def record(self, p1: AgentRef, p2: AgentRef, score: float, games: int = 1):
+        """Rates games between p1 and p2 where p1 scored score per game on average
+        (1 won, 0.5 tied, 0 lost), as one rating period for both."""
+        k1, k2 = self._key(p1), self._key(p2)
+        if k1 == k2:
+            # Two copies of one agent tell nothing about its strength
+            return
+        r1, r2 = self.get(p1), self.get(p2)
+        # Both sides are rated against the other's rating from before the games
+        update1 = glicko2(r1, [(r2, score)] * games)
+        update2 = glicko2(r2, [(r1, 1.0 - score)] * games)
+        for key, rating, update in ((k1, r1, update1), (k2, r2, update2)):
+            del self._index[bisect.bisect_left(self._index, (-rating.rating, key))]
+            rating.rating, rating.deviation, rating.volatility = update
+            rating.games += games
+            bisect.insort(self._index, (-rating.rating, key))
+
+        pair = f"{min(k1, k2)}|{max(k1, k2)}"
+        self._pairs[pair] = self._pairs.get(pair, 0) + games
+        self.rated += games
+
+    def attach(self, player: Player) -> Player:
+        """Rates every game player finishes against another attached agent."""
+        self.get(player)
+        battle_finished_callback = player._battle_finished_callback
+
+        def rating_battle_finished_callback(battle):
+            battle_finished_callback(battle)
+            opponent = battle.opponent_username
+            # Both sides see the game; only the one whose name sorts first rates it
+            if opponent in self._keys and player.username < opponent:
+                score = 1.0 if battle.won else 0.0 if battle.lost else 0.5
+                self.record(player, self._keys[opponent], score)
+
+        player._battle_finished_callback = rating_battle_finished_callback
+        return player
+
+    def sync(self, cache: ResultsCache, players: List[Player], mode: str):
+        """Rates the pairs of players the results cache has in the evaluation mode
+        and this book does not, so that games played before ratings were kept count
+        too."""
+        for i, p1 in enumerate(players):
+            for p2 in players[i + 1 :]:
+                k1, k2 = self._key(p1), self._key(p2)
+                if self._pairs.get(f"{min(k1, k2)}|{max(k1, k2)}"):
+                    continue
+                counts = cache.peek(p1, p2, mode)
+                if counts is None or not counts[2]:
+                    continue
+                wins, losses, games = counts
+                self.record(p1, p2, (wins + (games - wins - losses) / 2) / games, games)
+
+    def save(self):
+        # Write then rename, as the results cache does
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        stored = {
+            "agents": {
+                key: {slot: getattr(rating, slot) for slot in Rating.__slots__}
+                for key, rating in self._ratings.items()
+            },
+            "pairs": self._pairs,
+        }
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(stored, file, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def summary(self) -> str:
+        stable = sum(r.deviation <= self.max_deviation for r in self._ratings.values())
+        return (
+            f"{self.rated} games rated, {stable} of {len(self._ratings)} agents "
+            f"with a stable rating (RD <= {self.max_deviation:g})"
+        )
@@ -0,0 +1,239 @@
+# python replay_archive.py replays/round_1 [name] [--output DIR]
+#
+# Streams battle logs into compressed, append-only archives instead of one HTML
+# file per battle. A ReplaySink attached to an agent takes over the replays the
+# agent would have saved (player._save_replays) and hands them to a background
+# writer thread, so replay I/O never runs on the event loop.
+#
+# Replays are grouped into one archive per top-level directory under the replay
+# root, so replays/ratk825 holds one agent's games and replays/round_1 a
+# knockout round. Each game is its own gzip member in <archive>.replays.gz,
+# which zcat reads as one stream, and <archive>.index.jsonl records where each
+# member starts, keyed by the name the HTML file would have had (for example
+# "a--vs--b/a - battle-gen9ubers-1.html"). Only the log is stored; the HTML
+# is rebuilt from poke_env's replay template when a game is read back.
+#
+# Run as a script, it lists an archive or writes one game (or all) back as HTML.
+
+
+import argparse
+import gzip
+import json
+import os
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from poke_env.data import REPLAY_TEMPLATE
+from poke_env.player.player import Player
+
+ARCHIVE_SUFFIX = ".replays.gz"
+INDEX_SUFFIX = ".index.jsonl"
+
+
+def render(entry: dict, log: str) -> str:
+    """The HTML replay poke_env would have written for an archived game."""
+    replay = REPLAY_TEMPLATE
+    replay = replay.replace("{BATTLE_TAG}", entry["battle"])
+    replay = replay.replace("{PLAYER_USERNAME}", entry["player"])
+    replay = replay.replace("{OPPONENT_USERNAME}", str(entry["opponent"]))
+    return replay.replace("{REPLAY_LOG}", log)
+
+
+class ReplayArchive:
+    """Read access to one archive written by a ReplaySink."""
+
+    def __init__(self, path: str):
+        """
+        :param path: The archive, with or without its suffix.
+        """
+        if path.endswith(ARCHIVE_SUFFIX):
+            path = path[: -len(ARCHIVE_SUFFIX)]
+        self.path = path
+
+        self.entries: Dict[str, dict] = {}
+        with open(path + INDEX_SUFFIX, "r", encoding="utf-8") as file:
+            for line in file:
+                entry = json.loads(line)
+                self.entries[entry["name"]] = entry
+
+    def names(self) -> List[str]:
+        return list(self.entries)
+
+    def log(self, name: str) -> str:
+        """The battle log of one game, read without decompressing the others."""
+        entry = self.entries[name]
+        with open(self.path + ARCHIVE_SUFFIX, "rb") as file:
+            file.seek(entry["offset"])
+            return gzip.decompress(file.read(entry["size"])).decode("utf-8")
+
+    def html(self, name: str) -> str:
+        return render(self.entries[name], self.log(name))
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for name in self.entries:
+            yield name, self.log(name)
+
+
+class ReplaySink:
+    def __init__(self, root: str, compresslevel: int = 9):
+        """
+        :param root: The replay directory; archives are written at its top level.
+        :param compresslevel: gzip level, paid on the writer thread.
+        """
+        self.root = os.path.abspath(root)
+        self.compresslevel = compresslevel
+        self.written = 0
+        self.raw_bytes = 0
+        self.archived_bytes = 0
+
+        # Where the battles in progress would have saved their replay
+        self._destinations: Dict[Tuple[int, str], str] = {}
+        self._queue: queue.Queue = queue.Queue()
+        self._files: Dict[str, tuple] = {}
+        self._writer: Optional[threading.Thread] = None
+
+    def attach(self, player: Player) -> Player:
+        """Sends the replays player would save to the archives instead."""
+        create_battle = player._create_battle
+        battle_finished_callback = player._battle_finished_callback
+
+        async def archiving_create_battle(split_message):
+            battle = await create_battle(split_message)
+            if battle._save_replays:
+                # Keep poke_env from writing the HTML file when the battle ends
+                self._destinations[(id(player), battle.battle_tag)] = (
+                    "replays" if battle._save_replays is True else battle._save_replays
+                )
+                battle._save_replays = False
+            return battle
+
+        def archiving_battle_finished_callback(battle):
+            destination = self._destinations.pop((id(player), battle.battle_tag), None)
+            if destination is not None:
+                self._submit(destination, battle)
+            battle_finished_callback(battle)
+
+        player._create_battle = archiving_create_battle
+        player._battle_finished_callback = archiving_battle_finished_callback
+        return player
+
+    def _submit(self, destination: str, battle):
+        archive, directory = self._locate(destination)
+        name = f"{battle.player_username} - {battle.battle_tag}.html"
+        entry = {
+            "name": f"{directory}/{name}" if directory else name,
+            "battle": battle.battle_tag,
+            "player": battle.player_username,
+            "opponent": battle.opponent_username,
+            "won": battle.won,
+            "turns": battle.turn,
+        }
+        # The event lists are handed over as is; joining them is left to the writer
+        events = [
+            battle.observations[turn].events for turn in sorted(battle.observations)
+        ]
+
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write, daemon=True)
+            self._writer.start()
+        self._queue.put((archive, entry, events))
+
+    def _locate(self, destination: str) -> Tuple[str, str]:
+        """The archive a replay directory maps to, and its path inside it."""
+        relative = os.path.relpath(os.path.abspath(destination), self.root)
+        if relative == "." or relative.startswith(".."):
+            return os.path.basename(os.path.normpath(destination)), ""
+        archive, _, directory = relative.replace(os.sep, "/").partition("/")
+        return archive, directory
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._append(*item)
+            finally:
+                self._queue.task_done()
+
+    def _append(self, archive: str, entry: dict, events: List[List[List[str]]]):
+        files = self._files.get(archive)
+        if files is None:
+            if not os.path.exists(self.root):
+                os.makedirs(self.root)
+            path = os.path.join(self.root, archive)
+            files = self._files[archive] = (
+                open(path + ARCHIVE_SUFFIX, "ab"),
+                open(path + INDEX_SUFFIX, "a", encoding="utf-8"),
+            )
+        data, index = files
+
+        log = f">{entry['battle']}" + "\n".join(
+            "|".join(message) for turn in events for message in turn
+        )
+        member = gzip.compress(log.encode("utf-8"), compresslevel=self.compresslevel)
+
+        # Appending to an existing archive starts after what is already there
+        data.seek(0, os.SEEK_END)
+        entry["offset"] = data.tell()
+        entry["size"] = len(member)
+        data.write(member)
+        data.flush()
+        index.write(json.dumps(entry) + "\n")
+        index.flush()
+
+        self.written += 1
+        self.raw_bytes += len(render(entry, log).encode("utf-8"))
+        self.archived_bytes += len(member)
+
+    def flush(self):
+        """Blocks until every submitted replay is on disk."""
+        self._queue.join()
+
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        for data, index in self._files.values():
+            data.close()
+            index.close()
+        self._files.clear()
+
+    def summary(self) -> str:
+        ratio = self.raw_bytes / self.archived_bytes if self.archived_bytes else 0.0
+        return (
+            f"{self.written} replays archived in {self.archived_bytes / 1024:.0f} KB "
+            f"({ratio:.1f}x smaller than HTML files)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("archive", help="archive path, e.g. replays/round_1")
+    parser.add_argument("name", nargs="?", help="game to extract; all if omitted")
+    parser.add_argument("--output", help="directory to write the HTML replays to")
+    parser.add_argument("--list", action="store_true", help="only list the games")
+    args = parser.parse_args()
+
+    archive = ReplayArchive(args.archive)
+    if args.list:
+        for name, entry in archive.entries.items():
+            print(f"{name}\t{entry['opponent']}\twon={entry['won']}\t{entry['turns']} turns")
+        return
+
+    output = args.output or archive.path
+    names = [args.name] if args.name else archive.names()
+    for name in names:
+        path = os.path.join(output, name)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(archive.html(name))
+        print(f"Replay written to {path}")
+
+
+if __name__ == "__main__":
+    main()
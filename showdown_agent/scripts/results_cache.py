@@ -0,0 +1,111 @@
+# Persistent store of cross-evaluation results, so re-running an evaluation only
+# plays the pairs it has not seen before. Agents are identified by a hash of
+# their code, their team and the battle format rather than by username, so
+# editing an agent or its team invalidates exactly the pairs it took part in,
+# and unchanged bot-vs-bot pairs are always merged from the store. Pairs are
+# kept per evaluation mode (adaptive_eval.evaluation_mode), so a pair played in
+# 3 fixed games is never recalled by an SPRT run, nor the other way round.
+
+
+import hashlib
+import inspect
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from poke_env.player.player import Player
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def agent_key(player: Player) -> str:
+    """Identifies an agent by its code hash, team hash and battle format.
+
+    The code includes the sets file an agent may read next to its module
+    (<module>_sets.json), as it changes how the agent plays.
+    """
+    agent_class = type(player)
+    path = inspect.getfile(agent_class)
+    with open(path, "r", encoding="utf-8") as file:
+        code = f"{agent_class.__qualname__}\n{file.read()}"
+    sets = os.path.splitext(path)[0] + "_sets.json"
+    if os.path.exists(sets):
+        with open(sets, "r", encoding="utf-8") as file:
+            code += f"\n{file.read()}"
+
+    return f"{_digest(code)}-{_digest(player.next_team or '')}-{player.format}"
+
+
+class ResultsCache:
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        # Mode -> "key1|key2" -> [wins, losses, games] of key1 against key2,
+        # key1 < key2
+        self._modes: Dict[str, Dict[str, List[int]]] = {}
+        self._keys: Dict[int, str] = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                # Caches from before modes were kept do not say how their pairs
+                # were played, and are started over
+                self._modes = json.load(file).get("modes", {})
+
+    def _key(self, player: Player) -> str:
+        # Reading an agent's source once is enough for the whole run
+        key = self._keys.get(id(player))
+        if key is None:
+            key = self._keys[id(player)] = agent_key(player)
+        return key
+
+    def has(self, p1: Player, p2: Player, mode: str) -> bool:
+        k1, k2 = self._key(p1), self._key(p2)
+        return f"{min(k1, k2)}|{max(k1, k2)}" in self._modes.get(mode, {})
+
+    def get(self, p1: Player, p2: Player, mode: str) -> Optional[Tuple[int, int, int]]:
+        """p1's wins, losses and games against p2, if the pair was played before in
+        the evaluation mode."""
+        counts = self.peek(p1, p2, mode)
+        if counts is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return counts
+
+    def peek(self, p1: Player, p2: Player, mode: str) -> Optional[Tuple[int, int, int]]:
+        """Same as get, without counting as a hit or a miss."""
+        k1, k2 = self._key(p1), self._key(p2)
+        counts = self._modes.get(mode, {}).get(f"{min(k1, k2)}|{max(k1, k2)}")
+        if counts is None:
+            return None
+
+        wins, losses, games = counts
+        return (wins, losses, games) if k1 <= k2 else (losses, wins, games)
+
+    def record(self, p1: Player, p2: Player, mode: str, counts: Tuple[int, int, int]):
+        """Stores p1's wins, losses and games against p2 in the evaluation mode and
+        saves the cache."""
+        k1, k2 = self._key(p1), self._key(p2)
+        wins, losses, games = counts
+        if k1 > k2:
+            k1, k2, wins, losses = k2, k1, losses, wins
+        self._modes.setdefault(mode, {})[f"{k1}|{k2}"] = [wins, losses, games]
+        self.save()
+
+    def save(self):
+        # Write then rename, so an interrupted run never leaves a broken cache
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"modes": self._modes}, file, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def summary(self) -> str:
+        return f"{self.hits} pairs from the results cache, {self.misses} played"
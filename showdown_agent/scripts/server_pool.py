@@ -0,0 +1,172 @@
+# node pokemon-showdown start 8000 --no-security
+# node pokemon-showdown start 8001 --no-security
+# ...
+#
+# Spreads tournament matches over several local Showdown servers so evaluation
+# is not capped at the one core a single server process can use. A poke_env
+# Player is bound to the server it was built for, so every agent gets one
+# instance per server, built with the same construction kwargs, and each match
+# is played on the least loaded server on which both of its agents are free.
+
+
+import asyncio
+import contextlib
+from typing import Callable, Dict, List, Optional, Sequence
+
+from poke_env import ServerConfiguration
+from poke_env.player.player import Player
+
+from adaptive_eval import SPRT, evaluation_mode, play_or_recall
+from agent_registry import AgentLike, LazyAgent, resolve
+from results_cache import ResultsCache
+
+AUTHENTICATION_URL = "https://play.pokemonshowdown.com/action.php?"
+
+
+def parse_servers(endpoints: Sequence[str]) -> List[ServerConfiguration]:
+    """Turns ports, host:port pairs or websocket urls into server configurations."""
+    servers = []
+    for endpoint in endpoints:
+        if "://" not in endpoint:
+            if ":" not in endpoint:
+                endpoint = f"localhost:{endpoint}"
+            endpoint = f"ws://{endpoint}/showdown/websocket"
+        servers.append(ServerConfiguration(endpoint, AUTHENTICATION_URL))
+    return servers
+
+
+class ServerPool:
+    def __init__(
+        self, servers: Sequence[ServerConfiguration], matches_per_server: int = 4
+    ):
+        if not servers:
+            raise ValueError("A server pool needs at least one server")
+
+        self.servers = list(servers)
+        self.matches_per_server = matches_per_server
+
+        # Matches in flight and matches played on each server
+        self.load = [0] * len(self.servers)
+        self.played = [0] * len(self.servers)
+
+        self._replicas: Dict[str, List[AgentLike]] = {}
+        self._busy: set = set()
+        self._released: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.matches_per_server * len(self.servers)
+
+    def replicate(
+        self, gather: Callable[..., List[AgentLike]], **kwargs
+    ) -> List[AgentLike]:
+        """Calls gather once per server and returns the agents built for the first.
+
+        The agents built for the other servers are kept as replicas, matched up by
+        username, and are picked by lease whenever a match lands on their server.
+        """
+        per_server = [
+            gather(server_configuration=server, **kwargs) for server in self.servers
+        ]
+        for replicas in zip(*per_server):
+            self._replicas[replicas[0].username] = list(replicas)
+        return per_server[0]
+
+    def replicas(self, player: AgentLike) -> List[AgentLike]:
+        """All instances of an agent, one per server; lazy agents stay unbuilt."""
+        return self._replicas[player.username]
+
+    def _condition(self) -> asyncio.Condition:
+        # Conditions are bound to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self._released is None or self._loop is not loop:
+            self._released = asyncio.Condition()
+            self._loop = loop
+        return self._released
+
+    def _pick_server(self, players: Sequence[AgentLike]) -> Optional[int]:
+        free = [
+            server
+            for server in range(len(self.servers))
+            if self.load[server] < self.matches_per_server
+            and not any(
+                self._replicas[player.username][server] in self._busy
+                for player in players
+            )
+        ]
+        return min(free, key=lambda server: self.load[server]) if free else None
+
+    @contextlib.asynccontextmanager
+    async def lease(self, *players: AgentLike):
+        """Reserves a server for a match between players and yields their instances
+        on it, in the same order, building lazy ones.
+
+        Replays are saved wherever the given agents would have saved them.
+        """
+        released = self._condition()
+        async with released:
+            server = self._pick_server(players)
+            while server is None:
+                await released.wait()
+                server = self._pick_server(players)
+
+            entries = [self._replicas[player.username][server] for player in players]
+            self.load[server] += 1
+            self._busy.update(entries)
+
+        try:
+            replicas = [resolve(entry) for entry in entries]
+            for player, replica in zip(players, replicas):
+                # An agent that was never built has nothing set on it yet
+                if not isinstance(player, LazyAgent) or player.built:
+                    replica._save_replays = resolve(player)._save_replays
+
+            yield replicas
+        finally:
+            async with released:
+                self.load[server] -= 1
+                self.played[server] += 1
+                self._busy.difference_update(entries)
+                released.notify_all()
+
+    async def cross_evaluate(
+        self,
+        players: List[Player],
+        n_challenges: int,
+        rule: Optional[SPRT] = None,
+        cache: Optional[ResultsCache] = None,
+    ) -> Dict[str, Dict[str, Optional[float]]]:
+        """Same results as adaptive_eval.cross_evaluate, with the pairs played
+        concurrently across the pool."""
+        results: Dict[str, Dict[str, Optional[float]]] = {
+            p1.username: {p2.username: None for p2 in players} for p1 in players
+        }
+
+        async def play(p1: Player, p2: Player):
+            if cache is not None and cache.has(
+                p1, p2, evaluation_mode(n_challenges, rule)
+            ):
+                rates = await play_or_recall(p1, p2, n_challenges, rule, cache)
+            else:
+                async with self.lease(p1, p2) as (r1, r2):
+                    rates = await play_or_recall(r1, r2, n_challenges, rule, cache)
+            (
+                results[p1.username][p2.username],
+                results[p2.username][p1.username],
+            ) = rates
+
+        await asyncio.gather(
+            *(
+                play(p1, p2)
+                for i, p1 in enumerate(players)
+                for p2 in players[i + 1 :]
+            )
+        )
+        return results
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{server.websocket_url}: {played} matches"
+            for server, played in zip(self.servers, self.played)
+        )
@@ -0,0 +1,219 @@
+# Parses and validates every team once, however many agents use it.
+#
+# poke_env builds a ConstantTeambuilder for each agent from its team string,
+# parsing and re-packing the same text for every (bot, team) pair. The registry
+# parses each distinct team once, keyed by a hash of its content, checks it
+# against the format's GenData (species, abilities, moves and learnsets,
+# natures, EVs and IVs) and hands the same SharedTeam to every agent built
+# with it. Invalid teams raise InvalidTeamError when they are loaded, before a
+# tournament starts rather than when the server rejects a challenge; moves the
+# learnsets do not list only print a warning, as the data has gaps (event-only
+# moves, formes, transfer moves) that Showdown itself allows.
+
+
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from poke_env.data import GenData
+from poke_env.data.normalize import to_id_str
+from poke_env.player.player import Player
+from poke_env.teambuilder import ConstantTeambuilder, Teambuilder, TeambuilderPokemon
+
+
+class InvalidTeamError(ValueError):
+    pass
+
+
+class SharedTeam(ConstantTeambuilder):
+    """A parsed, validated team, shared read-only by every agent that uses it."""
+
+    def __init__(self, mons: List[TeambuilderPokemon], digest: str):
+        self._mons: Tuple[TeambuilderPokemon, ...] = tuple(mons)
+        self.packed_team = self.join_team(mons)
+        self.digest = digest
+
+    @property
+    def team(self) -> Tuple[TeambuilderPokemon, ...]:
+        return self._mons
+
+    @property
+    def species(self) -> Tuple[str, ...]:
+        return tuple(_species(mon) for mon in self._mons)
+
+
+def _species(mon: TeambuilderPokemon) -> str:
+    # Teams without nicknames only fill in the nickname
+    return to_id_str(mon.species or mon.nickname)
+
+
+def _digest(team: str) -> str:
+    return hashlib.sha256(team.strip().encode("utf-8")).hexdigest()[:16]
+
+
+_REGISTRIES: Dict[str, "TeamRegistry"] = {}
+
+
+def registry(battle_format: str = "gen9ubers") -> "TeamRegistry":
+    """The registry shared by everything that builds agents for battle_format."""
+    if battle_format not in _REGISTRIES:
+        _REGISTRIES[battle_format] = TeamRegistry(battle_format)
+    return _REGISTRIES[battle_format]
+
+
+class TeamRegistry:
+    def __init__(self, battle_format: str = "gen9ubers"):
+        self.battle_format = battle_format
+        self._gen_data = GenData.from_format(battle_format)
+        self._teams: Dict[str, SharedTeam] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, team: str, name: Optional[str] = None) -> SharedTeam:
+        """The shared team for a showdown-format or packed team string.
+
+        :raises InvalidTeamError: If the team is not valid in the format.
+        """
+        digest = _digest(team)
+        shared = self._teams.get(digest)
+        if shared is not None:
+            self.hits += 1
+            return shared
+
+        self.misses += 1
+        if "|" in team:
+            mons = Teambuilder.parse_packed_team(team)
+        else:
+            mons = Teambuilder.parse_showdown_team(team)
+
+        problems = self.validate(mons)
+        if problems:
+            raise InvalidTeamError(
+                f"Invalid {self.battle_format} team {name or digest}:\n  "
+                + "\n  ".join(problems)
+            )
+        unlisted = self.unlisted_moves(mons)
+        if unlisted:
+            print(
+                f"⚠️ {self.battle_format} team {name or digest} has moves its "
+                "learnsets do not list:\n  " + "\n  ".join(unlisted)
+            )
+
+        shared = SharedTeam(mons, digest)
+        # The packed form agents report (next_team) finds the same team
+        self._teams[digest] = self._teams[_digest(shared.packed_team)] = shared
+        return shared
+
+    def load(self, directory: str) -> Dict[str, SharedTeam]:
+        """Every valid .txt team in directory, by file name without the extension;
+        invalid ones are reported and left out."""
+        teams = {}
+        for team_file in sorted(os.listdir(directory)):
+            if team_file.endswith(".txt"):
+                with open(
+                    os.path.join(directory, team_file), "r", encoding="utf-8"
+                ) as file:
+                    try:
+                        teams[team_file[:-4]] = self.get(file.read(), team_file)
+                    except InvalidTeamError as error:
+                        print(f"⚠️ Skipping {error}")
+        return teams
+
+    def share(self, player: Player) -> Player:
+        """Validates the constant team an agent was built with and swaps it for the
+        shared one.
+
+        :raises InvalidTeamError: If the team is not valid in the format.
+        """
+        builder = player._team
+        if isinstance(builder, ConstantTeambuilder) and not isinstance(
+            builder, SharedTeam
+        ):
+            player._team = self.get(builder.packed_team, player.username)
+        return player
+
+    def admit(self, player: Player) -> bool:
+        """Shares player's team, or, if it is invalid, reports it and stops the
+        agent's connection so that the run can go on without it."""
+        try:
+            self.share(player)
+        except InvalidTeamError as error:
+            print(f"⚠️ Skipping {player.username}: {error}")
+            listening = getattr(player.ps_client, "_listening_coroutine", None)
+            if listening is not None:
+                # Cancelling the listener closes the socket, open or not yet
+                listening.cancel()
+            return False
+        return True
+
+    def validate(self, mons: List[TeambuilderPokemon]) -> List[str]:
+        """What is wrong with a parsed team; empty if nothing is."""
+        if not 1 <= len(mons) <= 6:
+            return [f"{len(mons)} Pokemon, expected 1 to 6"]
+
+        problems = []
+        for mon in mons:
+            species = _species(mon)
+            entry = self._gen_data.pokedex.get(species)
+            if entry is None:
+                problems.append(f"{species}: unknown species")
+                continue
+
+            abilities = {to_id_str(a) for a in entry.get("abilities", {}).values()}
+            if mon.ability and to_id_str(mon.ability) not in abilities:
+                problems.append(f"{species}: cannot have ability {mon.ability}")
+
+            if not 1 <= len(mon.moves) <= 4:
+                problems.append(f"{species}: {len(mon.moves)} moves, expected 1 to 4")
+            for move in mon.moves:
+                if to_id_str(move) not in self._gen_data.moves:
+                    problems.append(f"{species}: unknown move {move}")
+
+            if mon.nature and to_id_str(mon.nature) not in self._gen_data.natures:
+                problems.append(f"{species}: unknown nature {mon.nature}")
+            if any(not 0 <= ev <= 252 for ev in mon.evs) or sum(mon.evs) > 510:
+                problems.append(f"{species}: EVs {mon.evs} out of range")
+            if any(not 0 <= iv <= 31 for iv in mon.ivs):
+                problems.append(f"{species}: IVs {mon.ivs} out of range")
+
+        return problems
+
+    def unlisted_moves(self, mons: List[TeambuilderPokemon]) -> List[str]:
+        """Moves of a parsed team that its species' learnsets do not list."""
+        unlisted = []
+        for mon in mons:
+            species = _species(mon)
+            learnable = self._learnable(species)
+            if learnable is None:
+                continue
+            for move in mon.moves:
+                move_id = to_id_str(move)
+                if move_id in self._gen_data.moves and move_id not in learnable:
+                    unlisted.append(f"{species}: {move}")
+        return unlisted
+
+    def _learnable(self, species: str) -> Optional[set]:
+        """Moves species can learn, its base forme's and pre-evolutions' included;
+        None if the learnsets do not cover it, or if it has Sketch and so can
+        learn any move."""
+        moves: set = set()
+        seen = set()
+        pending = [species]
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            moves.update(self._gen_data.learnset.get(current, {}).get("learnset", {}))
+
+            entry = self._gen_data.pokedex.get(current, {})
+            for related in ("changesFrom", "baseSpecies", "prevo"):
+                if entry.get(related):
+                    pending.append(to_id_str(entry[related]))
+        if "sketch" in moves:
+            return None
+        return moves or None
+
+    def summary(self) -> str:
+        teams = len({id(team) for team in self._teams.values()})
+        return f"{teams} teams parsed once, {self.hits} reused"